@@ -1,20 +1,16 @@
 # -*- coding: utf-8 -*-
 """对 tag.xlsx Sheet2 做数据概览 + 相关性分析（含点消、拖消、目标物品），并输出结论文档与 CSV。"""
-import pandas as pd
 import numpy as np
 
+import correlation
+import data_loader
+from data_loader import TAG_COLS
+
 FILE = "tag.xlsx"
 OUT_PREFIX = "tag"
-TAG_COLS = ["点消", "拖消", "目标物品"]
 
-df = pd.read_excel(FILE, sheet_name="Sheet2", engine="openpyxl")
-# 统一标签列名（Sheet2 第 3～5 列为点消、拖消、目标物品）
-if len(df.columns) >= 5:
-    df = df.rename(columns={
-        df.columns[2]: "点消",
-        df.columns[3]: "拖消",
-        df.columns[4]: "目标物品",
-    })
+# Sheet2 第 3～5 列已由 data_loader 统一命名为点消、拖消、目标物品
+df = data_loader.load_dataset(FILE)
 
 numeric = df.select_dtypes(include=[np.number])
 numeric = numeric.dropna(axis=1, how="all")
@@ -37,19 +33,13 @@ free_play = df[(df["Challenge solved"] == 0) & (df["Challenge failed"] == 0)]
 
 # 相关性
 corr_pearson = numeric.corr(method="pearson")
-corr_spearman = numeric.corr(method="spearman")
+corr_spearman = correlation.spearman_matrix(numeric)  # 每列只排一次秩
 corr_pearson.to_csv(f"{OUT_PREFIX}_correlation_pearson.csv", encoding="utf-8-sig")
 corr_spearman.to_csv(f"{OUT_PREFIX}_correlation_spearman.csv", encoding="utf-8-sig")
 
-n = len(corr_pearson)
-pairs = []
-for i in range(n):
-    for j in range(i + 1, n):
-        a, b = corr_pearson.columns[i], corr_pearson.columns[j]
-        p_val = corr_pearson.iloc[i, j]
-        s_val = corr_spearman.iloc[i, j]
-        pairs.append((a, b, float(p_val), float(s_val)))
-pairs_sorted = sorted(pairs, key=lambda x: abs(x[2]), reverse=True)
+pairs_sorted = correlation.ranked_pairs(corr_pearson, corr_spearman)
+# 报告中的指标对附 p 值与 bootstrap 置信区间（脚本内逐对计算，结果按指标对缓存）
+corr_engine = correlation.CorrelationEngine(numeric)
 rate_cols = [c for c in numeric.columns if "rate" in c.lower()]
 rate_pairs = [(a, b, p, s) for a, b, p, s in pairs_sorted if a in rate_cols and b in rate_cols and abs(p) >= 0.5]
 
@@ -99,11 +89,9 @@ lines.extend([
     "",
     "以下为这三列与其它数值指标的相关系数（|Pearson| ≥ 0.2），便于观察标签与消耗、转化、游戏行为的关系。",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in tag_pairs[:25]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, tag_pairs[:25]))
 lines.extend([
     "",
     "---",
@@ -114,20 +102,16 @@ lines.extend([
     "",
     "### 率指标之间强相关 (|Pearson| ≥ 0.5)",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in rate_pairs[:20]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, rate_pairs[:20]))
 lines.extend([
     "",
     "### 全表最强相关对 (按 |Pearson| 前 15 对)",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in pairs_sorted[:15]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, pairs_sorted[:15]))
 lines.extend([
     "",
     "---",
@@ -3,31 +3,20 @@
 import pandas as pd
 import numpy as np
 
+import correlation
+import data_loader
+import outliers
+import tagging
+from data_loader import TAG_COLS
+
 FILE = "tag.xlsx"
 OUT_MD = "数据分析报告_排除极值.md"
 OUT_PREFIX = "tag_no_outliers"
-TAG_COLS = ["点消", "拖消", "目标物品"]
-
-# 极值判定：按展示量 Impressions 的 IQR 方法，超出 [Q1-1.5*IQR, Q3+1.5*IQR] 视为极值
-def flag_outliers_iqr(series, k=1.5):
-    q1, q3 = series.quantile(0.25), series.quantile(0.75)
-    iqr = q3 - q1
-    if iqr == 0:
-        return pd.Series(False, index=series.index)
-    lower, upper = q1 - k * iqr, q3 + k * iqr
-    return (series < lower) | (series > upper)
 
-df = pd.read_excel(FILE, sheet_name="Sheet2", engine="openpyxl")
-if len(df.columns) >= 5:
-    df = df.rename(columns={
-        df.columns[2]: "点消",
-        df.columns[3]: "拖消",
-        df.columns[4]: "目标物品",
-    })
+df = data_loader.load_dataset(FILE)
 
-# 按 Impressions 标出极值
-imp = df["Impressions"].dropna()
-outlier_mask = flag_outliers_iqr(df["Impressions"])
+# 极值判定：按展示量 Impressions 的 IQR 方法，超出 [Q1-1.5*IQR, Q3+1.5*IQR] 视为极值
+outlier_mask = pd.Series(outliers.outlier_mask(df, ["Impressions"], "iqr", 1.5), index=df.index)
 excluded = df.loc[outlier_mask].copy()
 df_in = df.loc[~outlier_mask].copy()
 n_excluded = outlier_mask.sum()
@@ -55,54 +44,21 @@ free_play = df_in[(df_in["Challenge solved"] == 0) & (df_in["Challenge failed"]
 
 # 相关性（排除极值后）
 corr_pearson = numeric.corr(method="pearson")
-corr_spearman = numeric.corr(method="spearman")
+corr_spearman = correlation.spearman_matrix(numeric)  # 每列只排一次秩
 corr_pearson.to_csv(f"{OUT_PREFIX}_correlation_pearson.csv", encoding="utf-8-sig")
 corr_spearman.to_csv(f"{OUT_PREFIX}_correlation_spearman.csv", encoding="utf-8-sig")
 
-n = len(corr_pearson)
-pairs = []
-for i in range(n):
-    for j in range(i + 1, n):
-        a, b = corr_pearson.columns[i], corr_pearson.columns[j]
-        p_val = corr_pearson.iloc[i, j]
-        s_val = corr_spearman.iloc[i, j]
-        pairs.append((a, b, float(p_val), float(s_val)))
-pairs_sorted = sorted(pairs, key=lambda x: abs(x[2]), reverse=True)
+pairs_sorted = correlation.ranked_pairs(corr_pearson, corr_spearman)
+# 报告中的指标对附 p 值与 bootstrap 置信区间（脚本内逐对计算，结果按指标对缓存）
+corr_engine = correlation.CorrelationEngine(numeric)
 rate_cols = [c for c in numeric.columns if "rate" in c.lower()]
 rate_pairs = [(a, b, p, s) for a, b, p, s in pairs_sorted if a in rate_cols and b in rate_cols and abs(p) >= 0.5]
 tag_pairs = [(a, b, p, s) for a, b, p, s in pairs_sorted if (a in TAG_COLS or b in TAG_COLS) and abs(p) >= 0.2]
 
 # 标签对比（排除极值后）：与 tag_label_compare 相同逻辑
-for c in TAG_COLS:
-    if c in df_in.columns:
-        df_in[c] = pd.to_numeric(df_in[c], errors="coerce")
-
-def assign_tag(row):
-    if row.get("目标物品") == 1:
-        return "目标物品"
-    if row.get("点消") == 1:
-        return "点消"
-    if row.get("拖消") == 1:
-        return "拖消"
-    return "未标注"
-
-df_in["_tag"] = df_in.apply(assign_tag, axis=1)
-metrics = [
-    "Impressions", "Spend", "CTA clicked", "CTA click rate",
-    "Unique redirects rate", "HTML completion rate", "Challenge solved rate",
-    "Average duration", "Runtime error rate",
-]
-metrics = [m for m in metrics if m in df_in.columns]
-overall = df_in[metrics].mean()
-ratio_rows = []
-for tag in ["点消", "拖消", "目标物品"]:
-    sub_df = df_in[df_in["_tag"] == tag]
-    if len(sub_df) == 0:
-        continue
-    sub = sub_df[metrics].mean()
-    ratio = (sub / overall).replace([np.inf, -np.inf], np.nan)
-    ratio_rows.append({"标签": tag, "样本数": len(sub_df), **ratio})
-ratio_df = pd.DataFrame(ratio_rows)
+df_in = data_loader.coerce_tag_columns(df_in)
+metrics = [m for m in tagging.COMPARE_METRICS if m in df_in.columns]
+ratio_df = tagging.tag_summary(df_in, metrics).ratios.reset_index()
 
 # 写入报告
 lines = [
@@ -186,29 +142,23 @@ lines.extend([
     "",
     "### 4.1 率指标之间强相关 (|Pearson| ≥ 0.5)",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in rate_pairs[:18]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, rate_pairs[:18]))
 lines.extend([
     "",
     "### 4.2 标签与指标相关 (|Pearson| ≥ 0.2)",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in tag_pairs[:20]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, tag_pairs[:20]))
 lines.extend([
     "",
     "### 4.3 全表最强相关对 (按 |Pearson| 前 12 对)",
     "",
-    "| 指标 A | 指标 B | Pearson | Spearman |",
-    "|--------|--------|---------|----------|",
+    *correlation.MARKDOWN_PAIR_HEADER,
 ])
-for a, b, p, s in pairs_sorted[:12]:
-    lines.append(f"| {a} | {b} | {p:.3f} | {s:.3f} |")
+lines.extend(correlation.markdown_pair_rows(corr_engine, pairs_sorted[:12]))
 lines.extend([
     "",
     "---",
@@ -1,4 +1,4 @@
-import io
+import datetime
 import zipfile
 import pandas as pd
 import numpy as np
@@ -7,12 +7,31 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
 
+import charts
+import correlation
+import data_loader
+import density
+import filters
+import history_store
+import leaderboard
+import outliers
+import pivot
+import predict_analysis
+import search_index
+import snapshot_diff
+import tagging
+import trendlines
+import workers
+
 # 1. 定义中英文对照字典 (在这里添加你想要翻译的所有列名)
     # 格式： '英文原名': '中文显示名'
 col_map = {
     # 基础信息
     'HTML': '素材名称',
     'URL': '链接地址',
+    'Source file': '来源文件',
+    'Source sheet': '来源 Sheet',
+    'Snapshot date': '快照日期',
         
     # 核心消耗与展示
     'Impressions': '展示量 (Impressions)',
@@ -66,13 +85,36 @@ col_map = {
     'Rendering error rate': '渲染错误率',
     'Runtime error rate': '运行报错率',
 
+    # 看板派生指标（见 leaderboard.DERIVED_METRICS）
+    'Incomplete Count': '未完成次数',
+    'Incomplete Rate': '未完成率',
+
     # tag 表 Sheet2 标签列（分类标签，非连续型指标）
     '点消': '点消',
     '拖消': '拖消',
     '目标物品': '目标物品',
 }
 # 标签列：用于相关性分析时可选排除（与连续型指标含义不同）
-TAG_COLS = ["点消", "拖消", "目标物品"]
+TAG_COLS = data_loader.TAG_COLS
+# 各页面实际用到的列（None 表示全部列）：有列式旁路文件时只读这些列，切到需要更多列的页面时再补读
+BASE_COLS = ["HTML", "URL", "Impressions", "CTA clicked", data_loader.SOURCE_COL, data_loader.SOURCE_SHEET_COL]
+PAGE_COLUMNS = {
+    "📊 数据看板": BASE_COLS + [
+        'Spend', 'CTA click rate', 'Average duration', 'HTML displayed',
+        'Challenge started', 'Challenge solved', 'Challenge failed',
+        'Challenge solved rate', 'Challenge failed rate', 'Runtime error rate',
+        'Challenge pass 25', 'Challenge pass 50', 'Challenge pass 75',
+        'Unique interactions', 'Total interactions', 'Redirect count', 'Unique redirects rate',
+    ],
+    "🛠️ 自定义探索": None,
+    "📈 相关性分析": None,
+    "📉 预测分析": None,
+    "🏷️ 标签对比": None,
+    "🔀 快照对比": BASE_COLS,
+}
+# 可用于排除极值的指标（文本、标签与看板派生列除外）
+NON_METRIC_COLS = ['HTML', 'URL', data_loader.SOURCE_COL, data_loader.SOURCE_SHEET_COL, 'Snapshot date', 'Incomplete Count', 'Incomplete Rate']
+OUTLIER_METRICS = [c for c in col_map if c not in NON_METRIC_COLS and c not in TAG_COLS]
 
 def get_label(col_name):
     return col_map.get(col_name, col_name)
@@ -83,42 +125,93 @@ st.title("📊 广告数据看板 (本地读取)")
 #侧边栏
 with st.sidebar:
     st.header("📍 页面导航")
-    page = st.radio("选择功能模块", ["📊 数据看板", "🛠️ 自定义探索", "📈 相关性分析", "📉 预测分析"], index=0)
+    page = st.radio("选择功能模块", ["📊 数据看板", "🛠️ 自定义探索", "📈 相关性分析", "📉 预测分析", "🏷️ 标签对比", "🔀 快照对比"], index=0)
     st.markdown("---")
 
 
     st.header("⚙️ 参数设置")
-    # 优先支持网页上传：Excel 或 含 Excel 的 ZIP 包
-    uploaded_file = st.file_uploader(
-        "上传 Excel 或 ZIP 包（可选）",
-        type=["xlsx", "xls", "zip"],
-        help="支持 .xlsx / .xls / .zip。若 Excel 在本地打开需输入密码，请先「另存为」未加密的 .xlsx 再上传；ZIP 加密时可在下方填写密码。",
-    )
-
-    if uploaded_file is None:
-        data_table = st.selectbox("数据表", ["sksx.xlsx", "tag.xlsx"], index=0, help="选择要分析的数据表")
-        file_name = data_table
+    # 已建立历史快照库（python history_store.py ingest ...）时，可直接查询库中的快照
+    data_source = "Excel 文件"
+    if history_store.exists():
+        data_source = st.radio("数据来源", ["Excel 文件", "历史快照库"], horizontal=True,
+                               help="历史快照库按「素材 + 快照日期」累积每次导出，查询时每个素材只取一行。")
+    if data_source == "历史快照库":
+        uploaded_files = []
+        snapshot_days = history_store.list_snapshots()[history_store.SNAPSHOT_COL].tolist()
+        history_as_of = st.selectbox(
+            "快照日期", [None] + snapshot_days[::-1],
+            format_func=lambda d: "各素材最新快照" if d is None else f"截至 {d} 的最新快照",
+        )
+        file_name = "历史快照库"
     else:
-        file_name = uploaded_file.name
+        # 优先支持网页上传：Excel 或 含 Excel 的 ZIP 包，可一次选择多个文件
+        uploaded_files = st.file_uploader(
+            "上传 Excel 或 ZIP 包（可选，可多选）",
+            type=["xlsx", "xls", "zip"],
+            accept_multiple_files=True,
+            help="支持 .xlsx / .xls / .zip，可一次选择多个文件，将并行解析并按列名对齐后合并分析。若 Excel 在本地打开需输入密码，请先「另存为」未加密的 .xlsx 再上传；ZIP 加密时可在下方填写密码。",
+        )
+
+        if not uploaded_files:
+            data_table = st.selectbox("数据表", list(data_loader.DATASETS), index=0, help="选择要分析的数据表")
+            file_name = data_table
+        else:
+            file_name = "、".join(f.name for f in uploaded_files)
+    xlsx_engines = data_loader.available_xlsx_engines()
+    xlsx_engine = st.selectbox(
+        "Excel 解析引擎",
+        xlsx_engines,
+        index=len(xlsx_engines) - 1,
+        help="calamine（需安装 python-calamine）解析 .xlsx 通常比 openpyxl 快数倍；.xls 固定使用 xlrd。同一文件解析一次后即走缓存，切换引擎不会重复解析。",
+    )
 
     min_imp = st.number_input("展示量过滤最小阈值 (Impressions > ?)", value=1000, step=100)
     max_imp = st.number_input("展示量过滤最大阈值 (Impressions < ?)", value=-1, step=100)
+    # 极值排除：所选任一指标超出界限的素材在所有页面中都不参与统计（界限按整份数据计算并缓存）
+    outlier_cols = st.multiselect("排除极值的指标（可多选，不选则不排除）", OUTLIER_METRICS, default=[], format_func=get_label)
+    outlier_exclude = None
+    if outlier_cols:
+        oc1, oc2 = st.columns([3, 2])
+        with oc1:
+            outlier_method = st.selectbox("极值判定方法", list(outliers.METHODS), format_func=outliers.METHODS.get)
+        with oc2:
+            outlier_k = st.number_input(
+                "倍数 k", value=outliers.DEFAULT_K[outlier_method], min_value=0.5, step=0.5,
+                key=f"outlier_k_{outlier_method}",
+                help="IQR：超出 [Q1 - k×IQR, Q3 + k×IQR] 为极值；MAD：偏离中位数超过 k×MAD（已按正态换算）为极值。",
+            )
+        outlier_exclude = (tuple(outlier_cols), outlier_method, float(outlier_k))
     if st.button("🔄 刷新数据"):
         st.rerun()
 
-def _excel_engine(file_name):
-    """按扩展名选择 Excel 引擎：.xls 用 xlrd，.xlsx 用 openpyxl，避免 'file is not a zip file'。"""
-    if file_name and str(file_name).lower().endswith(".xls") and not str(file_name).lower().endswith(".xlsx"):
-        return "xlrd"
-    return "openpyxl"
+# 当前页面需要读取的列：排除极值所用的指标也要读入
+load_columns = PAGE_COLUMNS.get(page)
+if load_columns is not None and outlier_cols:
+    load_columns = load_columns + [c for c in outlier_cols if c not in load_columns]
 
-try:
-    if uploaded_file is not None:
-        uploaded_file.seek(0)
-        is_zip = file_name.lower().endswith(".zip")
+def _stop_on_zip_read_error(e):
+    """解压 ZIP 成员失败（多为密码错误）时给出提示并停止本次渲染。"""
+    if "password" in str(e).lower() or "Bad password" in str(e):
+        st.error("❌ ZIP 密码错误或压缩包已加密。请检查左侧「ZIP 密码」后刷新重试。")
+    else:
+        st.error(f"❌ 解压 ZIP 内文件失败：{e}")
+    st.stop()
 
-        if is_zip:
-            # ZIP 包：支持加密 ZIP（侧栏可填密码），解压后列出其中的 Excel 文件供选择
+try:
+    if data_source == "历史快照库":
+        # 只查询一个快照视图（每个素材一行）并只取当前页面需要的列，按库文件状态缓存
+        df = history_store.load_snapshot(history_as_of, columns=load_columns)
+        if df.empty:
+            st.error("❌ 历史快照库中没有所选日期及之前的快照。")
+            st.stop()
+        st.success(f"✅ 已读取历史快照库：{len(df)} 个素材（{'各素材最新快照' if history_as_of is None else f'截至 {history_as_of}'}）")
+    elif uploaded_files:
+        # 所有上传文件（含 ZIP 内的 Excel）汇总为数据来源列表，统一交给 data_loader 并行解析、对齐合并
+        sources = []
+        sheet_options = []
+        zip_pwd_bytes = None
+        if any(f.name.lower().endswith(".zip") for f in uploaded_files):
+            # ZIP 包：支持加密 ZIP（侧栏可填密码）
             zip_password = st.sidebar.text_input(
                 "ZIP 密码（若压缩包加密请填写，选填）",
                 type="password",
@@ -126,85 +219,80 @@ try:
                 help="仅当 ZIP 压缩时设置了密码时需要填写",
             )
             zip_pwd_bytes = zip_password.encode("utf-8") if zip_password else None
-            try:
-                with zipfile.ZipFile(uploaded_file, "r") as z:
-                    excel_in_zip = [n for n in z.namelist() if n.lower().endswith((".xlsx", ".xls")) and not n.startswith("__")]
-            except zipfile.BadZipFile as e:
-                st.error("❌ 无法识别为 ZIP 文件，可能已损坏或不是标准 ZIP 格式。")
-                st.stop()
-            except RuntimeError as e:
-                if "password" in str(e).lower() or "encrypt" in str(e).lower():
-                    st.error("❌ 该 ZIP 可能已加密。请在左侧「ZIP 密码」中填写正确密码后点击「刷新数据」重试。")
+
+        for up in uploaded_files:
+            data = up.getvalue()
+            if up.name.lower().endswith(".zip"):
+                try:
+                    excel_in_zip = data_loader.zip_excel_members(data)
+                except zipfile.BadZipFile as e:
+                    st.error(f"❌ 「{up.name}」无法识别为 ZIP 文件，可能已损坏或不是标准 ZIP 格式。")
+                    st.stop()
+                except RuntimeError as e:
+                    if "password" in str(e).lower() or "encrypt" in str(e).lower():
+                        st.error("❌ 该 ZIP 可能已加密。请在左侧「ZIP 密码」中填写正确密码后点击「刷新数据」重试。")
+                    else:
+                        st.error(f"❌ 读取 ZIP 失败：{e}")
+                    st.stop()
+                if not excel_in_zip:
+                    st.error(f"❌ 「{up.name}」中未找到 .xlsx 或 .xls 文件，请检查压缩包内容。")
+                    st.stop()
+                if len(excel_in_zip) == 1 or st.sidebar.checkbox(
+                    f"合并「{up.name}」内全部 {len(excel_in_zip)} 个 Excel",
+                    value=True,
+                    key=f"zip_merge_{up.name}",
+                    help="并行解析包内所有 Excel 并纵向合并，新增「来源文件」列标明每行出处；取消勾选则只分析其中一个文件。",
+                ):
+                    zip_members = excel_in_zip
                 else:
-                    st.error(f"❌ 读取 ZIP 失败：{e}")
-                st.stop()
-            if not excel_in_zip:
-                st.error("❌ 该 ZIP 中未找到 .xlsx 或 .xls 文件，请检查压缩包内容。")
-                st.stop()
-            if len(excel_in_zip) == 1:
-                excel_choice = excel_in_zip[0]
+                    zip_members = [st.sidebar.selectbox(f"选择「{up.name}」内的 Excel 文件", excel_in_zip, key=f"zip_excel_{up.name}")]
+                sources += data_loader.zip_sources(up.name, data, zip_members, pwd=zip_pwd_bytes)
+                try:
+                    names = data_loader.zip_sheet_names(data, zip_members[0], pwd=zip_pwd_bytes, engine=xlsx_engine)
+                except RuntimeError as e:
+                    _stop_on_zip_read_error(e)
             else:
-                excel_choice = st.sidebar.selectbox("选择 ZIP 内的 Excel 文件", excel_in_zip, key="zip_excel")
-            uploaded_file.seek(0)
-            try:
-                with zipfile.ZipFile(uploaded_file, "r") as z:
-                    excel_bytes = z.read(excel_choice, pwd=zip_pwd_bytes)
-            except RuntimeError as e:
-                if "password" in str(e).lower() or "Bad password" in str(e):
-                    st.error("❌ ZIP 密码错误或压缩包已加密。请检查左侧「ZIP 密码」后刷新重试。")
-                else:
-                    st.error(f"❌ 解压 ZIP 内文件失败：{e}")
-                st.stop()
-            excel_io = io.BytesIO(excel_bytes)
-            engine = _excel_engine(excel_choice)
-            try:
-                xl = pd.ExcelFile(excel_io, engine=engine)
-            except Exception as zip_err:
-                if "zip" in str(zip_err).lower() and engine == "openpyxl":
-                    excel_io.seek(0)
-                    xl = pd.ExcelFile(excel_io, engine="xlrd")
-                else:
-                    raise zip_err
-            display_name = f"{file_name} / {excel_choice}"
+                # 直接上传的 Excel
+                sources += data_loader.excel_sources(up.name, data)
+                names = data_loader.sheet_names(data, up.name, engine=xlsx_engine)
+            sheet_options += [n for n in names if n not in sheet_options]
+
+        if len(sheet_options) > 1:
+            sheet_choices = st.sidebar.multiselect(
+                "选择 Sheet（可多选，合并分析）",
+                [data_loader.FIRST_SHEET] + sheet_options,
+                default=[data_loader.FIRST_SHEET],
+                format_func=lambda s: "各文件的首个 Sheet" if s == data_loader.FIRST_SHEET else s,
+                key="upload_sheets",
+                help="按名称选择时，没有该 Sheet 的文件会被跳过。",
+            ) or [data_loader.FIRST_SHEET]
         else:
-            # 直接上传的 Excel
-            engine = _excel_engine(uploaded_file.name)
-            try:
-                xl = pd.ExcelFile(uploaded_file, engine=engine)
-            except Exception as zip_err:
-                if "zip" in str(zip_err).lower() and engine == "openpyxl":
-                    uploaded_file.seek(0)
-                    xl = pd.ExcelFile(uploaded_file, engine="xlrd")
-                else:
-                    raise zip_err
-            display_name = file_name
+            sheet_choices = [data_loader.FIRST_SHEET]
+        # 若希望按 tag 表格式解析，可将第 3～5 列视为点消/拖消/目标物品（与本地 tag 表一致；列数不足 5 时不生效）
+        tag_parse = st.sidebar.checkbox("按 tag 表格式解析（第3～5列为点消/拖消/目标物品）", value=False, key="tag_parse")
 
-        sheet_names = xl.sheet_names
-        if len(sheet_names) > 1:
-            sheet_choice = st.sidebar.selectbox("选择 Sheet", sheet_names, index=0, key="upload_sheet")
+        # 每个「文件 × Sheet」按内容哈希缓存；未命中的在进程池中并行解析，按 col_map 的列顺序对齐后合并
+        try:
+            df = data_loader.read_sources(
+                sources, sheet_choices, tag_parse, schema=list(col_map),
+                columns=load_columns, engine=xlsx_engine, compact=True,
+            )
+        except RuntimeError as e:
+            _stop_on_zip_read_error(e)
+        if df.attrs.get("skipped"):
+            st.sidebar.warning("以下文件中没有所选 Sheet，已跳过：" + "、".join(f"{label}「{sheet}」" for label, sheet in df.attrs["skipped"]))
+        if df.empty:
+            st.error("❌ 所选文件 / Sheet 中没有可分析的数据。")
+            st.stop()
+        if data_loader.SOURCE_COL in df.columns:
+            n_parts = len(df[[data_loader.SOURCE_COL, data_loader.SOURCE_SHEET_COL]].drop_duplicates())
+            st.success(f"✅ 已并行解析并合并 {df[data_loader.SOURCE_COL].nunique()} 个文件的 {n_parts} 个 Sheet，共 {len(df)} 行")
         else:
-            sheet_choice = sheet_names[0]
-        df = xl.parse(sheet_choice)
-        # 若列数≥5 且用户希望按 tag 表格式解析，可将第 3～5 列视为点消/拖消/目标物品（与本地 tag 表一致）
-        if len(df.columns) >= 5 and st.sidebar.checkbox("按 tag 表格式解析（第3～5列为点消/拖消/目标物品）", value=False, key="tag_parse"):
-            df = df.rename(columns={
-                df.columns[2]: "点消",
-                df.columns[3]: "拖消",
-                df.columns[4]: "目标物品",
-            })
-        st.success(f"✅ 已加载上传文件「{display_name}」Sheet「{sheet_choice}」")
+            shown_sheet = sheet_options[0] if sheet_choices[0] == data_loader.FIRST_SHEET else sheet_choices[0]
+            st.success(f"✅ 已加载上传文件「{sources[0]['label']}」Sheet「{shown_sheet}」")
     else:
-        # 使用本地数据表
-        if file_name == "tag.xlsx":
-            df = pd.read_excel(file_name, sheet_name="Sheet2", engine="openpyxl")
-            if len(df.columns) >= 5:
-                df = df.rename(columns={
-                    df.columns[2]: "点消",
-                    df.columns[3]: "拖消",
-                    df.columns[4]: "目标物品",
-                })
-        else:
-            df = pd.read_excel(file_name, engine="openpyxl")
+        # 使用本地数据表（Sheet 与列名规范化方式见 data_loader.DATASETS）
+        df = data_loader.load_dataset(file_name, columns=load_columns, engine=xlsx_engine, compact=True)
         st.success(f"✅ 本地文件「{file_name}」读取成功！")
 except FileNotFoundError:
     st.error(f"❌ 找不到文件！请确认「{file_name}」在当前目录下。")
@@ -219,45 +307,90 @@ except Exception as e:
         st.error(f"❌ 读取失败：{e}")
     st.stop()
 
+# 内存占用：类型压缩前后对比（只统计当前页面读取的列）
+raw_bytes, compact_bytes = data_loader.memory_report(df)
+if raw_bytes:
+    st.sidebar.caption(
+        f"💾 数据内存：{raw_bytes / 1024 ** 2:.2f} MB → {compact_bytes / 1024 ** 2:.2f} MB"
+        f"（紧凑类型，节省 {1 - compact_bytes / raw_bytes:.0%}）"
+    )
+
+# 把当前导出写入历史快照库（写入完整列，不受当前页面的列投影影响）
+if history_store.HAS_DUCKDB and data_source == "Excel 文件":
+    with st.sidebar.expander("📚 写入历史快照库"):
+        snapshot_day = st.date_input("快照日期", value=datetime.date.today())
+        if st.button("写入当前数据"):
+            if uploaded_files:
+                df_full = data_loader.read_sources(sources, sheet_choices, tag_parse, schema=list(col_map), engine=xlsx_engine)
+            else:
+                df_full = data_loader.load_dataset(file_name, engine=xlsx_engine)
+            n_written = history_store.ingest(df_full, snapshot_day, source=file_name)
+            st.success(f"已写入 {snapshot_day} 快照：{n_written} 个素材。可在「数据来源」中切换到历史快照库查看。")
+
 # 筛选有效数据（若存在 Impressions / CTA clicked 列则按阈值过滤，否则使用全部行）
+# 按 Impressions 排序的位置索引每份数据只建一次，调整阈值只需二分查找 + 切片，结果按阈值（及极值排除规则）缓存
 if "Impressions" in df.columns and "CTA clicked" in df.columns:
-    if max_imp > 0 and max_imp > min_imp:
-        df_effective = df[(df["Impressions"] > min_imp) & (df["Impressions"] < max_imp) & (df["CTA clicked"] != 0)]
-    else:
-        df_effective = df[(df["Impressions"] > min_imp) & (df["CTA clicked"] != 0)]
+    df_effective = filters.effective_rows(df, min_imp, max_imp, exclude=outlier_exclude)
 else:
-    df_effective = df.copy()
+    df_effective = df.copy() if outlier_exclude is None else filters.exclude_outliers(df, outlier_exclude)
     if "Impressions" not in df.columns or "CTA clicked" not in df.columns:
         st.info("当前数据缺少 Impressions 或 CTA clicked 列，未做展示量/点击过滤，展示全部行。")
+if outlier_exclude is not None:
+    n_outliers = int(outliers.outlier_mask(df, *outlier_exclude).sum())
+    st.sidebar.caption(
+        f"🚫 按{outliers.METHODS[outlier_exclude[1]]}（k={outlier_exclude[2]:g}）标出 {n_outliers} 条极值素材，"
+        f"筛选后参与分析 {len(df_effective)} 条"
+    )
+
+def _reset_link_page():
+    """搜索条件或每页条数变化时，素材链接列表回到第 1 页。"""
+    st.session_state["link_page"] = 1
 
 with st.sidebar:
     st.markdown("---") 
     st.header("🔎 素材链接搜索")
-    search_keyword = st.text_input("输入素材名 (如果不填默认显示Top20)", "")
+    search_keyword = st.text_input("输入素材名 (不填则按展示量列出全部素材)", "",
+                                   help="支持多个关键词（空格分隔，需同时包含）" + ("、拼音首字母" if search_index.HAS_PINYIN else "") + "；结果按展示量排序。",
+                                   on_change=_reset_link_page)
+    fuzzy_search = st.checkbox("模糊匹配（精确结果不足时补充相近素材名）", value=True, on_change=_reset_link_page)
     has_html_url = "HTML" in df_effective.columns and "URL" in df_effective.columns
     sort_col = "Impressions" if "Impressions" in df_effective.columns else df_effective.columns[0]
     if has_html_url:
-        df_search = df_effective.sort_values(by=sort_col, ascending=False)[["HTML", "URL"]].drop_duplicates()
+        # 去重后的素材表与 n-gram 倒排索引按「数据 + 筛选条件」缓存，每次输入只查索引
+        links_index = search_index.search_index(df_effective, sort_col)
         if search_keyword:
-            df_display_links = df_search[df_search["HTML"].astype(str).str.contains(search_keyword, case=False, na=False)]
+            rows, n_exact = links_index.search(search_keyword, fuzzy=fuzzy_search)
+            df_display_links = links_index.frame.iloc[rows]
+            if len(rows) > n_exact:
+                st.caption(f"精确匹配 {n_exact} 条，模糊匹配 {len(rows) - n_exact} 条（排在精确结果之后）")
         else:
-            df_display_links = df_search.head(20)
-        max_items = 20
-        if len(df_display_links) > max_items:
-            st.warning(f"结果太多，仅显示前 {max_items} 条...")
-            df_display = df_display_links.head(max_items)
-        else:
-            df_display = df_display_links
+            df_display_links = links_index.frame
     else:
-        df_display = pd.DataFrame()
+        df_display_links = pd.DataFrame()
         st.caption("当前数据无 HTML/URL 列，跳过素材链接搜索。")
 
-    if not df_display.empty:
-        for index, row in df_display.iterrows():
-            with st.container(border=True): 
-                st.markdown(f"<div style='font-size:12px; word-break:break-all;'><b>{row['HTML']}</b></div>", unsafe_allow_html=True)
-
-                st.link_button("👉 点击试玩", row['URL'], use_container_width = True)
+    if not df_display_links.empty:
+        # 分页：整页结果放进同一个表格（链接列可直接点击试玩），控件数量不随每页条数增长
+        pc1, pc2 = st.columns(2)
+        with pc1:
+            page_size = st.selectbox("每页条数", [20, 50, 100, 200], index=0, on_change=_reset_link_page)
+        n_pages = (len(df_display_links) - 1) // page_size + 1
+        with pc2:
+            # 页码用固定 key：关键词 / 模糊匹配 / 每页条数变化时由回调重置为 1；数据或筛选变化导致页数变少时也回到第 1 页
+            if st.session_state.get("link_page", 1) > n_pages:
+                st.session_state["link_page"] = 1
+            page_no = st.number_input("页码", min_value=1, max_value=n_pages, step=1, key="link_page")
+        start = (page_no - 1) * page_size
+        st.caption(f"共 {len(df_display_links):,} 条，第 {page_no}/{n_pages} 页")
+        st.dataframe(
+            df_display_links.iloc[start:start + page_size],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "HTML": st.column_config.TextColumn("素材名", width="medium"),
+                "URL": st.column_config.LinkColumn("试玩", display_text="👉 点击试玩", width="small"),
+            },
+        )
     else:
         st.caption("没有找到匹配的素材")
 st.write("前5行数据预览（用于确保数据读取正确）", df.head())
@@ -268,24 +401,35 @@ st.markdown("---")
 if page == "📊 数据看板":
     st.header("📊 数据看板")
     st.caption("一目了然获取到你所想要了解的数据信息。")
+
+    if data_source == "历史快照库":
+        # 历史走势：直接查询库中按快照日预聚合的视图（daily_summary），不读取明细
+        df_daily = history_store.list_snapshots()
+        trend_cols = [c for c in ['Impressions', 'CTA clicked', 'Spend'] if c in df_daily.columns]
+        if len(df_daily) > 1 and trend_cols:
+            fig_daily = px.line(
+                df_daily, x=history_store.SNAPSHOT_COL, y=trend_cols, markers=True,
+                title='折线图：各快照日的展示量 / 点击量 / 花费合计', labels=col_map, template='seaborn',
+            )
+            st.plotly_chart(fig_daily, use_container_width=True)
     
     #获取有明确游戏结果的游戏以及限时自由游戏
-    df_haveResultGame = df_effective[(df_effective['Challenge solved'] > 50) & (df_effective['Challenge failed'] > 50 )]
-    df_freeTimeGame = df_effective[(df_effective['Challenge solved'] == 0) & (df_effective['Challenge failed'] == 0 )]
-    #获取更具体一步的数据
+    #（按阈值缓存，只在阈值或数据变化时重新筛选）
+    df_haveResultGame = filters.derive(df_effective, "have_result", lambda d: d[(d['Challenge solved'] > 50) & (d['Challenge failed'] > 50 )])
+    df_freeTimeGame = filters.derive(df_effective, "free_time", lambda d: d[(d['Challenge solved'] == 0) & (d['Challenge failed'] == 0 )])
+    #获取更具体一步的数据：各排行榜一次性部分选择（见 leaderboard.DASHBOARD_BOARDS），按筛选条件缓存
+    board_sources = {"effective": df_effective, "have_result": df_haveResultGame}
+    boards = leaderboard.compute_boards(board_sources, leaderboard.DASHBOARD_BOARDS)
     #前十名 展示量游戏
-    top10_impressionsGames = df_effective.sort_values(by = 'Impressions' , ascending = False).head(10)
+    top10_impressionsGames = boards["top10_impressions"]
     #前十名完成率较低的游戏
-    top10_imcompleteGames = df_haveResultGame.copy()
-    top10_imcompleteGames['Incomplete Count'] = top10_imcompleteGames['Challenge started'] - top10_imcompleteGames['Challenge solved'] - top10_imcompleteGames['Challenge failed']
-    top10_imcompleteGames['Incomplete Rate'] = top10_imcompleteGames['Incomplete Count'] / top10_imcompleteGames['Challenge started']
-    top10_imcompleteGames = top10_imcompleteGames.sort_values(by = 'Incomplete Rate',ascending = False).head(10)
+    top10_imcompleteGames = boards["top10_incomplete"]
     #前五名最困难的游戏
-    top5_hardGames = df_haveResultGame.sort_values(by = 'Challenge failed rate' , ascending= False).head(5)
+    top5_hardGames = boards["top5_hard"]
     #前五名最容易的游戏
-    top5_easyGames = df_haveResultGame.sort_values(by = 'Challenge solved rate' , ascending= False).head(5)
+    top5_easyGames = boards["top5_easy"]
     #前五名运行中错误率最高的素材
-    top5_errorGames = df_effective.sort_values(by = 'Runtime error rate',ascending = False).head(5)
+    top5_errorGames = boards["top5_error"]
 
 
 
@@ -320,59 +464,65 @@ if page == "📊 数据看板":
 
 
 
+    # 以下各图表由 _build_* 函数构建，按「数据 + 筛选条件 + 图表 id」缓存（见 charts.py），
+    # 只改动侧栏搜索等无关控件时直接取缓存，不再重新整理数据、拟合趋势线
     #柱状图 Top10 展示量最高的游戏数据展示
 
-    fig_impressionsGames = px.bar(
-        top10_impressionsGames,
-        title= '柱状图：Top10 展示量最高的游戏 (鼠标悬停看详情)',
-        x='HTML',
-        y=['Impressions', 'CTA clicked','Unique interactions','Total interactions','Redirect count'], 
-        barmode='group', 
-        text_auto='.2s',
-        hover_data = ['CTA click rate'],
-        labels={
-            'HTML': '素材',
+    def _build_top10_impressions():
+        fig_impressionsGames = px.bar(
+            top10_impressionsGames,
+            title= '柱状图：Top10 展示量最高的游戏 (鼠标悬停看详情)',
+            x='HTML',
+            y=['Impressions', 'CTA clicked','Unique interactions','Total interactions','Redirect count'], 
+            barmode='group', 
+            text_auto='.2s',
+            hover_data = ['CTA click rate'],
+            labels={
+                'HTML': '素材',
+            }
+        )
+        fig_impressionsGames.update_yaxes(type="log", title_text="数量 (次)") 
+        fig_impressionsGames.update_layout(legend_title_text='数据指标' )
+        new_names = {
+            'Impressions': '展示量（次）',
+            'CTA clicked': '点击量（次）',
+            'Unique interactions':'唯一交互人数',
+            'Total interactions':'总交互次数',
+            'Redirect count':'跳转总次数'
         }
-    )
-    fig_impressionsGames.update_yaxes(type="log", title_text="数量 (次)") 
-    fig_impressionsGames.update_layout(legend_title_text='数据指标' )
-    new_names = {
-        'Impressions': '展示量（次）',
-        'CTA clicked': '点击量（次）',
-        'Unique interactions':'唯一交互人数',
-        'Total interactions':'总交互次数',
-        'Redirect count':'跳转总次数'
-    }
-    fig_impressionsGames.for_each_trace(lambda t: t.update(name = new_names[t.name]))
-    fig_impressionsGames.update_layout(template='seaborn')
-    st.plotly_chart(fig_impressionsGames)
+        fig_impressionsGames.for_each_trace(lambda t: t.update(name = new_names[t.name]))
+        fig_impressionsGames.update_layout(template='seaborn')
+        return fig_impressionsGames
+    st.plotly_chart(charts.cached_figure(df_effective, "top10_impressions", _build_top10_impressions))
 
 
 
     #柱状图 Top10 流失率最高的游戏
 
-    fig_imcompleteGames = px.bar(
-        top10_imcompleteGames,
-        title = '柱状图：流失率（指未完成整个游戏流程）最高 Top10 的可玩',
-        x = 'HTML',
-        y = ['Incomplete Rate','Challenge solved rate','Challenge failed rate'],
-        barmode = 'group',
-        text_auto='.2%',
-        hover_data = ['Impressions'],
-        labels={
-            'HTML': '素材',
-            'Incomplete Rate':'未完率'
+    def _build_top10_incomplete():
+        fig_imcompleteGames = px.bar(
+            top10_imcompleteGames,
+            title = '柱状图：流失率（指未完成整个游戏流程）最高 Top10 的可玩',
+            x = 'HTML',
+            y = ['Incomplete Rate','Challenge solved rate','Challenge failed rate'],
+            barmode = 'group',
+            text_auto='.2%',
+            hover_data = ['Impressions'],
+            labels={
+                'HTML': '素材',
+                'Incomplete Rate':'未完率'
+            }
+        )
+        new_names = {
+            'Incomplete Rate':'未完率',
+            'Challenge failed rate':'失败率',
+            'Challenge solved rate':'成功率'
         }
-    )
-    new_names = {
-        'Incomplete Rate':'未完率',
-        'Challenge failed rate':'失败率',
-        'Challenge solved rate':'成功率'
-    }
-    fig_imcompleteGames.update_yaxes(type="log", title_text="数量 (次)") 
-    fig_imcompleteGames.for_each_trace(lambda t: t.update(name = new_names[t.name]))
-    fig_imcompleteGames.update_layout(template='seaborn')
-    st.plotly_chart(fig_imcompleteGames)
+        fig_imcompleteGames.update_yaxes(type="log", title_text="数量 (次)") 
+        fig_imcompleteGames.for_each_trace(lambda t: t.update(name = new_names[t.name]))
+        fig_imcompleteGames.update_layout(template='seaborn')
+        return fig_imcompleteGames
+    st.plotly_chart(charts.cached_figure(df_effective, "top10_incomplete", _build_top10_incomplete))
 
 
 
@@ -381,52 +531,54 @@ if page == "📊 数据看板":
     col_left, col_right = st.columns(2)
     with col_left:
         #开启双侧尺
-        fig_hardGames = make_subplots(specs=[[{"secondary_y": True}]])
-        #添加第一个柱状图 使用左侧轴
-        fig_hardGames.add_trace(
-            go.Bar(
-                x=top5_hardGames['HTML'],
-                y=top5_hardGames['Impressions'],
-                name='展示量 (Impressions)',   
-                marker_color='#636EFA', 
-                opacity=0.6,     
-                offsetgroup=1 
-            ),
-            secondary_y = False 
-        )
-        #添加第二个柱状图 使用左侧轴
-        fig_hardGames.add_trace(
-            go.Bar(
-                x=top5_hardGames['HTML'], 
-                y=top5_hardGames['CTA clicked'],
-                name='点击量 (CTA Clicked)',
-                marker_color='#EF553B', 
-                offsetgroup=2 
-            ),
-            secondary_y=False
-        )
-        #添加折线图 使用右侧轴
-        fig_hardGames.add_trace(
-            go.Scatter(
-                x=top5_hardGames['HTML'],
-                y=top5_hardGames['Challenge failed rate'],
-                name='失败率 (Rate)',
-                mode='lines+markers+text',
-                marker=dict(size=10, color='green'), # 绿色点
-                text=top5_hardGames['Challenge failed rate'],
-                texttemplate='%{text:.1%}', 
-                textposition='top center'
-            ),
-            secondary_y=True # 这一根线走右边的轴
-        )
-        fig_hardGames.update_layout(
-            title='柱状折线图：Top5 最困难的可玩',
-            barmode='group' # 让柱子成簇排列
-        )
-        fig_hardGames.update_yaxes(title_text="数量 (次)", secondary_y=False)
-        fig_hardGames.update_yaxes(title_text="比率 (%)", tickformat=".0%", secondary_y=True)
-        fig_hardGames.update_layout(template='seaborn')
-        st.plotly_chart(fig_hardGames)
+        def _build_top5_hard():
+            fig_hardGames = make_subplots(specs=[[{"secondary_y": True}]])
+            #添加第一个柱状图 使用左侧轴
+            fig_hardGames.add_trace(
+                go.Bar(
+                    x=top5_hardGames['HTML'],
+                    y=top5_hardGames['Impressions'],
+                    name='展示量 (Impressions)',   
+                    marker_color='#636EFA', 
+                    opacity=0.6,     
+                    offsetgroup=1 
+                ),
+                secondary_y = False 
+            )
+            #添加第二个柱状图 使用左侧轴
+            fig_hardGames.add_trace(
+                go.Bar(
+                    x=top5_hardGames['HTML'], 
+                    y=top5_hardGames['CTA clicked'],
+                    name='点击量 (CTA Clicked)',
+                    marker_color='#EF553B', 
+                    offsetgroup=2 
+                ),
+                secondary_y=False
+            )
+            #添加折线图 使用右侧轴
+            fig_hardGames.add_trace(
+                go.Scatter(
+                    x=top5_hardGames['HTML'],
+                    y=top5_hardGames['Challenge failed rate'],
+                    name='失败率 (Rate)',
+                    mode='lines+markers+text',
+                    marker=dict(size=10, color='green'), # 绿色点
+                    text=top5_hardGames['Challenge failed rate'],
+                    texttemplate='%{text:.1%}', 
+                    textposition='top center'
+                ),
+                secondary_y=True # 这一根线走右边的轴
+            )
+            fig_hardGames.update_layout(
+                title='柱状折线图：Top5 最困难的可玩',
+                barmode='group' # 让柱子成簇排列
+            )
+            fig_hardGames.update_yaxes(title_text="数量 (次)", secondary_y=False)
+            fig_hardGames.update_yaxes(title_text="比率 (%)", tickformat=".0%", secondary_y=True)
+            fig_hardGames.update_layout(template='seaborn')
+            return fig_hardGames
+        st.plotly_chart(charts.cached_figure(df_effective, "top5_hard", _build_top5_hard))
 
 
 
@@ -434,253 +586,315 @@ if page == "📊 数据看板":
 
     #开启双侧尺
     with col_right:
-        fig_easyGames = make_subplots(specs=[[{"secondary_y": True}]])
-        #添加第一个柱状图 使用左侧轴
-        fig_easyGames.add_trace(
-            go.Bar(
-                x = top5_easyGames['HTML'],
-                y = top5_easyGames['Impressions'],
-                name = '展示量 (Impressions)',   
-                marker_color = '#636EFA', 
-                opacity = 0.6,     
-                offsetgroup = 1 
-            ),
-            secondary_y = False 
-        )
-        #添加第二个柱状图 使用左侧轴
-        fig_easyGames.add_trace(
-            go.Bar(
-                x = top5_easyGames['HTML'], 
-                y = top5_easyGames['CTA clicked'],
-                name = '点击量 (CTA Clicked)',
-                marker_color = '#EF553B', 
-                offsetgroup = 2 
-            ),
-            secondary_y = False
-        )
-        #添加折线图 使用右侧轴
-        fig_easyGames.add_trace(
-            go.Scatter(
-                x = top5_easyGames['HTML'],
-                y = top5_easyGames['Challenge solved rate'],
-                name = '成功率 (Rate)',
-                mode = 'lines+markers+text',
-                marker = dict(size=10, color='green'), # 绿色点
-                text = top5_easyGames['Challenge solved rate'],
-                texttemplate = '%{text:.1%}', 
-                textposition = 'top center'
-            ),
-            secondary_y = True # 这一根线走右边的轴
-        )
-        fig_easyGames.update_layout(
-            title='柱状折线图：Top5 最容易的可玩',
-            barmode='group' # 让柱子成簇排列
-        )
-        fig_easyGames.update_yaxes(type="log", secondary_y=False)
-        fig_easyGames.update_yaxes(title_text="数量 (次)", secondary_y=False)
-        fig_easyGames.update_yaxes(title_text="比率 (%)", tickformat=".0%", secondary_y=True)
-        fig_easyGames.update_layout(template='seaborn')
-        st.plotly_chart(fig_easyGames)
+        def _build_top5_easy():
+            fig_easyGames = make_subplots(specs=[[{"secondary_y": True}]])
+            #添加第一个柱状图 使用左侧轴
+            fig_easyGames.add_trace(
+                go.Bar(
+                    x = top5_easyGames['HTML'],
+                    y = top5_easyGames['Impressions'],
+                    name = '展示量 (Impressions)',   
+                    marker_color = '#636EFA', 
+                    opacity = 0.6,     
+                    offsetgroup = 1 
+                ),
+                secondary_y = False 
+            )
+            #添加第二个柱状图 使用左侧轴
+            fig_easyGames.add_trace(
+                go.Bar(
+                    x = top5_easyGames['HTML'], 
+                    y = top5_easyGames['CTA clicked'],
+                    name = '点击量 (CTA Clicked)',
+                    marker_color = '#EF553B', 
+                    offsetgroup = 2 
+                ),
+                secondary_y = False
+            )
+            #添加折线图 使用右侧轴
+            fig_easyGames.add_trace(
+                go.Scatter(
+                    x = top5_easyGames['HTML'],
+                    y = top5_easyGames['Challenge solved rate'],
+                    name = '成功率 (Rate)',
+                    mode = 'lines+markers+text',
+                    marker = dict(size=10, color='green'), # 绿色点
+                    text = top5_easyGames['Challenge solved rate'],
+                    texttemplate = '%{text:.1%}', 
+                    textposition = 'top center'
+                ),
+                secondary_y = True # 这一根线走右边的轴
+            )
+            fig_easyGames.update_layout(
+                title='柱状折线图：Top5 最容易的可玩',
+                barmode='group' # 让柱子成簇排列
+            )
+            fig_easyGames.update_yaxes(type="log", secondary_y=False)
+            fig_easyGames.update_yaxes(title_text="数量 (次)", secondary_y=False)
+            fig_easyGames.update_yaxes(title_text="比率 (%)", tickformat=".0%", secondary_y=True)
+            fig_easyGames.update_layout(template='seaborn')
+            return fig_easyGames
+        st.plotly_chart(charts.cached_figure(df_effective, "top5_easy", _build_top5_easy))
 
 
 
     #散点图 平均停留时长和转化率之间的关系
 
-    fig_impressionsAndCTA = px.scatter(
-        df_effective,
-        title='散点图：玩家平均停留时长 vs 转化率关联分析 (气泡越大，颜色越深，平均停留时长越长)',
-        x='Average duration',    # X轴: 玩家平均停留时长
-        y='Unique redirects rate',      # Y轴：转化率
-        size='Average duration',             # 气泡大小：玩家平均停留时长越长 气泡越大
-        color='Average duration',  # 颜色：展示量越大 越绿
-        color_continuous_scale= 'Greens',
-        trendline="ols",                
-        labels={
-            'Average duration': '玩家平均停留时长（秒）',
-            'Unique redirects rate': '转化效果 (跳转率)'
-        }
-    )
-    fig_impressionsAndCTA.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
-    fig_impressionsAndCTA.update_layout(template='seaborn')
-    st.plotly_chart(fig_impressionsAndCTA)
+    def _build_duration_vs_cvr():
+        fig_impressionsAndCTA = px.scatter(
+            df_effective,
+            title='散点图：玩家平均停留时长 vs 转化率关联分析 (气泡越大，颜色越深，平均停留时长越长)',
+            x='Average duration',    # X轴: 玩家平均停留时长
+            y='Unique redirects rate',      # Y轴：转化率
+            size='Average duration',             # 气泡大小：玩家平均停留时长越长 气泡越大
+            color='Average duration',  # 颜色：展示量越大 越绿
+            color_continuous_scale= 'Greens',
+            labels={
+                'Average duration': '玩家平均停留时长（秒）',
+                'Unique redirects rate': '转化效果 (跳转率)'
+            }
+        )
+        fig_impressionsAndCTA.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
+        fig_impressionsAndCTA.update_layout(template='seaborn')
+        # 趋势线单独拟合并缓存（见 trendlines.py）
+        trendlines.add_trendline(fig_impressionsAndCTA, df_effective['Average duration'], df_effective['Unique redirects rate'], "ols")
+        return fig_impressionsAndCTA
+    st.plotly_chart(charts.cached_figure(df_effective, "duration_vs_cvr", _build_duration_vs_cvr))
 
 
 
     #散点图 展示游戏难度和转化率之间的关系
 
-    fig_diffcultyAndCTA = px.scatter(
-        df_haveResultGame,
-        title='散点图：游戏难度 vs 转化率关联分析 (气泡越大，展示量越大，颜色越深，难度越高)',
-        x='Challenge failed rate',      # X轴：难度 (失败率)    
-        y='Unique redirects rate',      # Y轴：转化率
-        size='Impressions',             # 气泡大小：展示量
-        color='Challenge failed rate',  # 颜色：越红越难
-        color_continuous_scale= 'YlOrBr',
-        # 鼠标悬停显示素材名，方便你抓出那个“特异点”是谁
-        hover_name='HTML',              
+    def _build_difficulty_vs_cvr():
+        fig_diffcultyAndCTA = px.scatter(
+            df_haveResultGame,
+            title='散点图：游戏难度 vs 转化率关联分析 (气泡越大，展示量越大，颜色越深，难度越高)',
+            x='Challenge failed rate',      # X轴：难度 (失败率)    
+            y='Unique redirects rate',      # Y轴：转化率
+            size='Impressions',             # 气泡大小：展示量
+            color='Challenge failed rate',  # 颜色：越红越难
+            color_continuous_scale= 'YlOrBr',
+            # 鼠标悬停显示素材名，方便你抓出那个“特异点”是谁
+            hover_name='HTML',              
+            labels = {
+                'Challenge failed rate': '难度 (失败率)',
+                'Unique redirects rate': '转化效果 (跳转率)'
+            }
+        )
+        fig_diffcultyAndCTA.update_traces(marker=dict(sizemin=5)) 
+        fig_diffcultyAndCTA.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
+        fig_diffcultyAndCTA.update_layout(xaxis_tickformat=".0%", yaxis_tickformat=".1%")
+        fig_diffcultyAndCTA.update_layout(template='seaborn')
         # 【关键】加一条趋势线 (OLS回归线)
-        # 如果运行报错，说明没装 statsmodels 库，删掉这行即可
-        trendline="ols",                
-        labels = {
-            'Challenge failed rate': '难度 (失败率)',
-            'Unique redirects rate': '转化效果 (跳转率)'
-        }
-    )
-    fig_diffcultyAndCTA.update_traces(marker=dict(sizemin=5)) 
-    fig_diffcultyAndCTA.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
-    fig_diffcultyAndCTA.update_layout(xaxis_tickformat=".0%", yaxis_tickformat=".1%")
-    fig_diffcultyAndCTA.update_layout(template='seaborn')
-    st.plotly_chart(fig_diffcultyAndCTA)
+        trendlines.add_trendline(fig_diffcultyAndCTA, df_haveResultGame['Challenge failed rate'], df_haveResultGame['Unique redirects rate'], "ols")
+        return fig_diffcultyAndCTA
+    st.plotly_chart(charts.cached_figure(df_effective, "difficulty_vs_cvr", _build_difficulty_vs_cvr))
 
 
 
     #散点图：人均操作次数 (Interaction Intensity) vs 点击转化率 (CTR) 关联分析
 
-    df_interaction_analysis = df_effective[(df_effective['Unique interactions'] > 0)].copy()
-    df_interaction_analysis['Clicks per User'] = df_interaction_analysis['Total interactions'] / df_interaction_analysis['Unique interactions']
-    df_filtered = df_interaction_analysis[
-        (df_interaction_analysis['Clicks per User'] >= 1) & 
-        (df_interaction_analysis['Clicks per User'] <= 50)
-    ]
-    fig_correlation = px.scatter(
-        df_filtered,
-        title='散点图：人均操作次数 vs 转化率关联分析（气泡越大，展示量越大，颜色越深，人均操作量越高）',
-        x='Clicks per User',      
-        y='CTA click rate',       
-        size='Impressions',             # 气泡越大，说明该数据点越可靠（样本量大）
-        color='Clicks per User',        # 颜色仅仅为了好看区分
-
-        trendline="lowess",             
-        
-        hover_name='HTML',              # 鼠标悬停显示素材名，方便抓典型
-        hover_data={
-            'Impressions': ':.2s',      # 格式化展示量
-            'Clicks per User': ':.1f',  # 保留1位小数
-            'CTA click rate': ':.2%'    # 百分比格式
-        },
-        labels={
-            'Clicks per User': '人均操作次数 (强度)',
-            'CTA click rate': '点击转化率 (CTR)'
-        }
-    )
-    fig_correlation.update_layout(
-        yaxis_tickformat=".1%",
-        template='seaborn',
-        legend_title="操作强度"
-    )
-    best_performer = df_filtered.loc[df_filtered['CTA click rate'].idxmax()]
-    best_clicks = best_performer['Clicks per User']
-    best_ctr = best_performer['CTA click rate']
-    fig_correlation.add_annotation(
-        x=best_clicks,
-        y=best_ctr,
-        text=f"巅峰转化: {best_ctr:.1%} (需操作 {best_clicks:.1f} 次)",
-        showarrow=True,
-        arrowhead=1,
-        ax=0,
-        ay=-40
-    )
-    fig_correlation.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
-    fig_correlation.update_traces(marker=dict(sizemin=5)) 
-    st.plotly_chart(fig_correlation)
+    def _build_clicks_per_user_vs_ctr():
+        df_interaction_analysis = df_effective[(df_effective['Unique interactions'] > 0)].copy()
+        df_interaction_analysis['Clicks per User'] = df_interaction_analysis['Total interactions'] / df_interaction_analysis['Unique interactions']
+        df_filtered = df_interaction_analysis[
+            (df_interaction_analysis['Clicks per User'] >= 1) & 
+            (df_interaction_analysis['Clicks per User'] <= 50)
+        ]
+        fig_correlation = px.scatter(
+            df_filtered,
+            title='散点图：人均操作次数 vs 转化率关联分析（气泡越大，展示量越大，颜色越深，人均操作量越高）',
+            x='Clicks per User',      
+            y='CTA click rate',       
+            size='Impressions',             # 气泡越大，说明该数据点越可靠（样本量大）
+            color='Clicks per User',        # 颜色仅仅为了好看区分
+            hover_name='HTML',              # 鼠标悬停显示素材名，方便抓典型
+            hover_data={
+                'Impressions': ':.2s',      # 格式化展示量
+                'Clicks per User': ':.1f',  # 保留1位小数
+                'CTA click rate': ':.2%'    # 百分比格式
+            },
+            labels={
+                'Clicks per User': '人均操作次数 (强度)',
+                'CTA click rate': '点击转化率 (CTR)'
+            }
+        )
+        fig_correlation.update_layout(
+            yaxis_tickformat=".1%",
+            template='seaborn',
+            legend_title="操作强度"
+        )
+        best_performer = df_filtered.loc[df_filtered['CTA click rate'].idxmax()]
+        best_clicks = best_performer['Clicks per User']
+        best_ctr = best_performer['CTA click rate']
+        fig_correlation.add_annotation(
+            x=best_clicks,
+            y=best_ctr,
+            text=f"巅峰转化: {best_ctr:.1%} (需操作 {best_clicks:.1f} 次)",
+            showarrow=True,
+            arrowhead=1,
+            ax=0,
+            ay=-40
+        )
+        fig_correlation.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
+        fig_correlation.update_traces(marker=dict(sizemin=5)) 
+        # LOWESS 趋势线：点数较多时按分箱均值近似，并在图上注明
+        trend_note = trendlines.add_trendline(fig_correlation, df_filtered['Clicks per User'], df_filtered['CTA click rate'], "lowess")
+        trendlines.annotate_note(fig_correlation, trend_note)
+        return fig_correlation
+    st.plotly_chart(charts.cached_figure(df_effective, "clicks_per_user_vs_ctr", _build_clicks_per_user_vs_ctr))
 
 
 
     #漏斗图 1：总体转化链路 (曝光 -> 展示 -> 开始 -> 完成 -> 点击)
 
-    funnel_cols = ['Impressions', 'HTML displayed', 'Challenge started', 'Challenge solved', 'CTA clicked']
-    funnel_values = df_effective[funnel_cols].sum()
-    fig_funnel_total = go.Figure(go.Funnel(
-        y = ['曝光 (Impressions)', '成功展示 (Displayed)', '开始游戏 (Started)', '游戏通关 (Solved)', '点击转化 (CTA Clicked)'],
-        x = funnel_values.values,
-        textinfo = "value+percent previous",  # 显示数值 + 占上一步的百分比
-        opacity = 0.65,
-        marker = {"color": ["#1f77b4", "#00b3ca", "#ff7f0e", "#2ca02c", "#d62728"]},
-        connector = {"line": {"color": "royalblue", "dash": "dot", "width": 3}}
-    ))
-
-    fig_funnel_total.update_layout(
-        title_text="漏斗图：总体用户转化漏斗 (基于清洗后数据)", 
-        template='seaborn'
-    )
-    st.plotly_chart(fig_funnel_total)
+    def _build_funnel_total():
+        funnel_cols = ['Impressions', 'HTML displayed', 'Challenge started', 'Challenge solved', 'CTA clicked']
+        funnel_values = df_effective[funnel_cols].sum()
+        fig_funnel_total = go.Figure(go.Funnel(
+            y = ['曝光 (Impressions)', '成功展示 (Displayed)', '开始游戏 (Started)', '游戏通关 (Solved)', '点击转化 (CTA Clicked)'],
+            x = funnel_values.values,
+            textinfo = "value+percent previous",  # 显示数值 + 占上一步的百分比
+            opacity = 0.65,
+            marker = {"color": ["#1f77b4", "#00b3ca", "#ff7f0e", "#2ca02c", "#d62728"]},
+            connector = {"line": {"color": "royalblue", "dash": "dot", "width": 3}}
+        ))
+
+        fig_funnel_total.update_layout(
+            title_text="漏斗图：总体用户转化漏斗 (基于清洗后数据)", 
+            template='seaborn'
+        )
+        return fig_funnel_total
+    st.plotly_chart(charts.cached_figure(df_effective, "funnel_total", _build_funnel_total))
 
 
 
     #漏斗图 2：游戏内深度流失分析 (开始 -> 25% -> 50% -> 75% -> 通关)
 
-    game_depth_cols = ['Challenge started', 'Challenge pass 25', 'Challenge pass 50', 'Challenge pass 75', 'Challenge solved']
-    game_depth_values = df_effective[game_depth_cols].sum()
-    fig_funnel_game = go.Figure(go.Funnel(
-        y = ['开始游戏', '进度 25%', '进度 50%', '进度 75%', '通关 (Solved)'],
-        x = game_depth_values.values,
-        textinfo = "value+percent initial", # 这里推荐看“占初始值(开始游戏)的百分比”，即留存率
-        marker = {"color": "#636efa"},
-        connector = {"line": {"color": "white", "width": 2}}
-    ))
-    fig_funnel_game.update_layout(
-        title_text="漏斗图：游戏内玩家流失详情 (留存分析)", 
-        template='seaborn'
-    )
-    st.plotly_chart(fig_funnel_game)
+    def _build_funnel_game():
+        game_depth_cols = ['Challenge started', 'Challenge pass 25', 'Challenge pass 50', 'Challenge pass 75', 'Challenge solved']
+        game_depth_values = df_effective[game_depth_cols].sum()
+        fig_funnel_game = go.Figure(go.Funnel(
+            y = ['开始游戏', '进度 25%', '进度 50%', '进度 75%', '通关 (Solved)'],
+            x = game_depth_values.values,
+            textinfo = "value+percent initial", # 这里推荐看“占初始值(开始游戏)的百分比”，即留存率
+            marker = {"color": "#636efa"},
+            connector = {"line": {"color": "white", "width": 2}}
+        ))
+        fig_funnel_game.update_layout(
+            title_text="漏斗图：游戏内玩家流失详情 (留存分析)", 
+            template='seaborn'
+        )
+        return fig_funnel_game
+    st.plotly_chart(charts.cached_figure(df_effective, "funnel_game", _build_funnel_game))
 
 
 
     #直方图：用户平均交互次数分布 (Interaction Intensity)
 
-    df_interaction = df_effective[df_effective['Unique interactions'] > 0].copy()
-    df_interaction['Clicks per User'] = df_interaction['Total interactions'] / df_interaction['Unique interactions']
-
-    fig_interact = px.histogram(
-        df_interaction,
-        title='直方图：用户平均点击/滑动次数分布',
-        x='Clicks per User',
-        nbins= 20, # 分成20个区间
-        marginal= "box", # 顶部显示箱线图，看中位数
-        color_discrete_sequence=['#AB63FA'
-    ],
-        labels={'Clicks per User': '平均每人操作次数'}
-    )
+    def _build_clicks_per_user_hist():
+        df_interaction = df_effective[df_effective['Unique interactions'] > 0].copy()
+        df_interaction['Clicks per User'] = df_interaction['Total interactions'] / df_interaction['Unique interactions']
+
+        fig_interact = px.histogram(
+            df_interaction,
+            title='直方图：用户平均点击/滑动次数分布',
+            x='Clicks per User',
+            nbins= 20, # 分成20个区间
+            marginal= "box", # 顶部显示箱线图，看中位数
+            color_discrete_sequence=['#AB63FA'
+        ],
+            labels={'Clicks per User': '平均每人操作次数'}
+        )
 
-    fig_interact.update_layout(
-        bargap=0.1, 
-        template='seaborn',
-        xaxis_title="每人平均操作次数", 
-        yaxis_title="素材数量 (个)"
-    )
-    st.plotly_chart(fig_interact)
+        fig_interact.update_layout(
+            bargap=0.1, 
+            template='seaborn',
+            xaxis_title="每人平均操作次数", 
+            yaxis_title="素材数量 (个)"
+        )
+        return fig_interact
+    st.plotly_chart(charts.cached_figure(df_effective, "clicks_per_user_hist", _build_clicks_per_user_hist))
 
 
     #直方图：展示玩家的集中停留时长
 
     # 取出有效数据列，防止报错
-    df_dist = df_effective[['Average duration']].dropna()
-    # 创建直方图 + 密度曲线 (marginal='box' 顶部加箱线图辅助)
-    fig_hist = px.histogram(
-        df_dist, 
-        x="Average duration",
-        nbins=30,  
-        marginal="box",
-        opacity=0.75,
-        title="直方图：大部分用户的停留时长分布",
-        labels={"Average duration": "停留时长 (秒)"},
-        color_discrete_sequence=['#636EFA'] 
-    )
-    mean_val = df_dist['Average duration'].mean()
-    fig_hist.add_vline(
-        x=mean_val, 
-        line_dash="dash", 
-        line_color="red", 
-        annotation_text=f"平均值: {mean_val:.1f}s"
-    )
-    p99 = df_dist['Average duration'].quantile(0.99)
-    fig_hist.update_xaxes(range=[0, p99])
-    fig_hist.update_layout(
-        bargap=0.1, 
-        template='seaborn',
-        yaxis_title="用户/素材数量 (个)"
-    )
-    st.plotly_chart(fig_hist, use_container_width=True)
+    def _build_duration_hist():
+        df_dist = df_effective[['Average duration']].dropna()
+        # 创建直方图 + 密度曲线 (marginal='box' 顶部加箱线图辅助)
+        fig_hist = px.histogram(
+            df_dist, 
+            x="Average duration",
+            nbins=30,  
+            marginal="box",
+            opacity=0.75,
+            title="直方图：大部分用户的停留时长分布",
+            labels={"Average duration": "停留时长 (秒)"},
+            color_discrete_sequence=['#636EFA'] 
+        )
+        mean_val = df_dist['Average duration'].mean()
+        fig_hist.add_vline(
+            x=mean_val, 
+            line_dash="dash", 
+            line_color="red", 
+            annotation_text=f"平均值: {mean_val:.1f}s"
+        )
+        p99 = df_dist['Average duration'].quantile(0.99)
+        fig_hist.update_xaxes(range=[0, p99])
+        fig_hist.update_layout(
+            bargap=0.1, 
+            template='seaborn',
+            yaxis_title="用户/素材数量 (个)"
+        )
+        return fig_hist
+    st.plotly_chart(charts.cached_figure(df_effective, "duration_hist", _build_duration_hist), use_container_width=True)
+
+    # 自定义排行榜：按任意指标取前 N 名，每个榜单单独缓存，新增榜单不会重算已有榜单
+    st.markdown("---")
+    st.subheader("🏆 自定义排行榜")
+    st.caption("选择指标与名次数添加榜单；榜单按当前筛选条件计算并缓存，调整阈值后自动更新。")
+    board_scopes = {"effective": "全部有效素材", "have_result": "有明确游戏结果的素材"}
+    board_metrics = df_effective.select_dtypes(include=[np.number]).columns.tolist() + list(leaderboard.DERIVED_METRICS)
+    with st.form("custom_board"):
+        b1, b2, b3, b4 = st.columns([2, 2, 1, 1])
+        with b1:
+            board_metric = st.selectbox("排序指标", board_metrics, format_func=get_label)
+        with b2:
+            board_scope = st.selectbox("范围", list(board_scopes), format_func=board_scopes.get)
+        with b3:
+            board_k = st.number_input("前 N 名", min_value=1, max_value=500, value=10)
+        with b4:
+            board_asc = st.radio("排序", ["从高到低", "从低到高"]) == "从低到高"
+        if st.form_submit_button("➕ 添加榜单"):
+            spec = {"source": board_scope, "metric": board_metric, "k": int(board_k), "ascending": board_asc}
+            if board_metric in leaderboard.DERIVED_METRICS:
+                spec["extra"] = [board_metric]
+            custom_boards = st.session_state.setdefault("custom_boards", [])
+            if spec not in custom_boards:
+                custom_boards.append(spec)
+
+    custom_boards = st.session_state.get("custom_boards", [])
+    if custom_boards:
+        custom_results = leaderboard.compute_boards(board_sources, {f"custom_{i}": spec for i, spec in enumerate(custom_boards)})
+        for i, spec in enumerate(custom_boards):
+            board = custom_results[f"custom_{i}"]
+            title_col, remove_col = st.columns([5, 1])
+            with title_col:
+                order_text = "最低" if spec.get("ascending") else "最高"
+                st.markdown(f"**{board_scopes[spec['source']]}：{get_label(spec['metric'])}{order_text}的前 {spec['k']} 名**")
+            with remove_col:
+                if st.button("移除", key=f"remove_board_{i}"):
+                    custom_boards.pop(i)
+                    st.rerun()
+            if board.empty:
+                st.caption("当前数据缺少该指标或没有满足条件的素材。")
+                continue
+            show_cols = [c for c in dict.fromkeys(["HTML", spec["metric"], "Impressions"]) if c in board.columns]
+            st.dataframe(
+                board[show_cols].rename(columns=get_label).reset_index(drop=True),
+                use_container_width=True,
+            )
 
 
 if page == "🛠️ 自定义探索":
@@ -697,8 +911,8 @@ if page == "🛠️ 自定义探索":
     
     # 1. 准备数据列分类
     all_columns = df_effective.columns.tolist()
-    numeric_columns = df_effective.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    string_columns = df_effective.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
+    numeric_columns = df_effective.select_dtypes(include=[np.number]).columns.tolist()
+    string_columns = df_effective.select_dtypes(include=['object', 'string', 'category', 'boolean']).columns.tolist()
 
     # 2. 布局：增加 "直方图/密度图" 选项
     c1, c2, c3 = st.columns([1, 1, 2])
@@ -706,8 +920,17 @@ if page == "🛠️ 自定义探索":
         # >>> 修改点：增加了选项 <<<
         chart_type = st.selectbox("图表类型", ["散点图", "柱状图", "直方图"])
     with c2:
-        data_show_num = st.number_input("展示数据量 (Top N)", value=1000, step=100, min_value=10) 
-        # 注：可以把默认值改大一点，看分布需要较多数据
+        if chart_type == "散点图":
+            # 散点图展示全部行：点数超过阈值时自动切换为密度图（服务端分箱聚合），不再截取前 N 行
+            density_threshold = st.number_input("密度模式阈值 (点数)", value=density.DENSITY_THRESHOLD, step=1000, min_value=10,
+                                                help="有效点数超过该值时，散点图自动改为二维分箱密度图，悬停查看每个格子的汇总。")
+            data_show_num = 0
+        else:
+            data_show_num = st.number_input("展示数据量 (Top N)", value=1000, step=100, min_value=10) 
+            # 注：可以把默认值改大一点，看分布需要较多数据
+    with c3:
+        if chart_type == "散点图":
+            density_bins = st.slider("密度图分箱数 (每轴)", 20, 200, density.DENSITY_BINS, step=10)
 
     st.markdown("---")
     
@@ -736,6 +959,14 @@ if page == "🛠️ 自定义探索":
             default_y = [c for c in ['Impressions', 'CTA clicked'] if c in numeric_columns]
             if not default_y: default_y = [numeric_columns[0]]
             y_axis_val = st.multiselect("Y 轴 (数值 - 支持多选)", numeric_columns, default=default_y, format_func=get_label)
+        with col3:
+            # 聚合模式：同一分组有多行时（如同一素材多行、按标签分组），按组聚合后再画柱
+            agg_how = st.selectbox("聚合方式", ["无"] + list(pivot.AGGREGATIONS),
+                                   format_func=lambda x: "不聚合 (原始行)" if x == "无" else pivot.AGGREGATIONS[x])
+            agg_weight = None
+            if agg_how == "weighted_mean":
+                idx_w = numeric_columns.index('Impressions') if 'Impressions' in numeric_columns else 0
+                agg_weight = st.selectbox("权重列", numeric_columns, index=idx_w, format_func=get_label)
 
     # --- C: 直方图 ---
     elif chart_type == "直方图":
@@ -755,11 +986,26 @@ if page == "🛠️ 自定义探索":
         if data_show_num > 0:
             df_show = df_effective.head(data_show_num).copy()
         else:
-            df_show = df_effective.copy()
+            df_show = df_effective  # 后续只做 dropna / 排序等返回新表的操作，不复制整表
             
         try:
             # --- 绘图 A：散点图 ---
-            if chart_type == "散点图" and y_axis_val:
+            if chart_type == "散点图" and y_axis_val and len(df_show.dropna(subset=[x_axis_val, y_axis_val])) > density_threshold:
+                # 密度模式：按「数据 + 筛选条件 + 轴 + 分箱数」缓存图表
+                mean_cols = [] if z_axis_val == '无' else [z_axis_val]
+                def _build_density():
+                    fig = density.density_figure(
+                        df_show, x_axis_val, y_axis_val, bins=density_bins,
+                        mean_cols=mean_cols, sum_cols=[c for c in ['Impressions', 'CTA clicked'] if c in df_show.columns],
+                        labels=col_map,
+                    )
+                    trendlines.add_trendline(fig, df_show[x_axis_val], df_show[y_axis_val], "ols")
+                    return fig
+                fig = charts.cached_figure(df_effective, "sandbox_density", _build_density,
+                                           x=x_axis_val, y=y_axis_val, z=z_axis_val, bins=density_bins)
+                st.caption(f"点数超过 {density_threshold:,}，已切换为密度图：颜色表示格子内的点数（对数刻度），悬停查看格子汇总。调高「密度模式阈值」可改回散点图。")
+
+            elif chart_type == "散点图" and y_axis_val:
                 df_show = df_show.dropna(subset=[x_axis_val, y_axis_val])
                 plot_args = {
                     "data_frame": df_show,
@@ -769,7 +1015,6 @@ if page == "🛠️ 自定义探索":
                     "height": 600,
                     "labels": col_map, # 关键：传入字典实现自动翻译
                     "template": "seaborn",
-                    "trendline": "ols",
                     "render_mode": "webgl"
                 }
                 if z_axis_val != '无':
@@ -778,18 +1023,36 @@ if page == "🛠️ 自定义探索":
                 
                 fig = px.scatter(**plot_args)
                 fig.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')))
+                # OLS 趋势线单独拟合并缓存，同样的数据切换图表或重跑时不再重新拟合
+                trendlines.add_trendline(fig, df_show[x_axis_val], df_show[y_axis_val], "ols")
 
             # --- 绘图 B：柱状图 ---
             elif chart_type == "柱状图" and y_axis_val:
                 sort_col = y_axis_val[0] if isinstance(y_axis_val, list) else y_axis_val
-                df_show = df_show.sort_values(by=sort_col, ascending=False)
-                fig = px.bar(
-                    df_show,
-                    x=x_axis_val, y=y_axis_val,
-                    barmode='group', height=600,
-                    labels=col_map, # 关键：翻译
-                    template="seaborn"
-                )
+                if agg_how != "无":
+                    # 透视：对全部筛选后的数据按分组列聚合（结果缓存），再取排序后的前 N 组
+                    df_pivot = pivot.group_aggregate(df_effective, x_axis_val, y_axis_val, agg_how, agg_weight)
+                    df_pivot = df_pivot.sort_values(by=sort_col, ascending=False).head(data_show_num)
+                    agg_label = pivot.AGGREGATIONS[agg_how] + (f"（按 {get_label(agg_weight)} 加权）" if agg_weight else "")
+                    fig = px.bar(
+                        df_pivot,
+                        x=x_axis_val, y=y_axis_val,
+                        barmode='group', height=600,
+                        hover_data=[pivot.COUNT_COL],
+                        labels=col_map,
+                        template="seaborn",
+                        title=f"按《{get_label(x_axis_val)}》分组的{agg_label}（共 {len(df_pivot):,} 组）",
+                    )
+                    fig.update_xaxes(type='category')
+                else:
+                    df_show = df_show.sort_values(by=sort_col, ascending=False)
+                    fig = px.bar(
+                        df_show,
+                        x=x_axis_val, y=y_axis_val,
+                        barmode='group', height=600,
+                        labels=col_map, # 关键：翻译
+                        template="seaborn"
+                    )
 
             # --- 绘图 C：直方图/密度图 ---
             elif chart_type == "直方图":
@@ -838,10 +1101,9 @@ if page == "📈 相关性分析":
     st.header("📈 指标相关性分析")
     st.caption("基于当前筛选后的数据计算 Pearson / Spearman 相关，找出关联较强的指标对。")
 
-    # 数值列，去掉全空与常数列
-    numeric = df_effective.select_dtypes(include=[np.number])
-    numeric = numeric.dropna(axis=1, how="all")
-    numeric = numeric.loc[:, numeric.nunique() > 1]
+    # 相关引擎按「数据 + 筛选条件（阈值、极值排除）」缓存：数值列（含 0/1 标签列）已去掉全空与常数列，相关矩阵按所选列增量计算
+    corr_engine = correlation.engine_for(df_effective, df_effective.attrs.get("filter_key"))
+    numeric = corr_engine.data
 
     # 当前数据中实际存在的标签列
     tag_cols_present = [c for c in TAG_COLS if c in numeric.columns]
@@ -881,16 +1143,9 @@ if page == "📈 相关性分析":
             st.warning("请至少选择 2 个指标，或保持默认「全部」显示。")
             selected_cols = all_cols
 
-        corr_pearson = numeric.corr(method="pearson")
-        corr_spearman = numeric.corr(method="spearman")
-        # 按所选指标子集截取相关矩阵
-        corr_pearson_sub = corr_pearson.loc[selected_cols, selected_cols]
-        corr_spearman_sub = corr_spearman.loc[selected_cols, selected_cols]
-        selected_set = set(selected_cols)
-
-        # 相关矩阵热力图（仅所选指标）
+        # 相关矩阵热力图（仅所选指标，只计算尚未算过的列）
         corr_method = st.radio("相关类型", ["Pearson（线性相关）", "Spearman（秩相关）"], horizontal=True)
-        corr_mat = corr_spearman_sub if "Spearman" in corr_method else corr_pearson_sub
+        corr_mat = corr_engine.matrix(selected_cols, "spearman" if "Spearman" in corr_method else "pearson")
 
         fig_heat = go.Figure(data=go.Heatmap(
             z=corr_mat.values,
@@ -914,58 +1169,277 @@ if page == "📈 相关性分析":
         )
         st.plotly_chart(fig_heat, use_container_width=True)
 
-        # 强相关对：仅所选指标之间的配对
-        n_sub = len(selected_cols)
-        pairs = []
-        for i in range(n_sub):
-            for j in range(i + 1, n_sub):
-                a, b = corr_pearson_sub.columns[i], corr_pearson_sub.columns[j]
-                p_val = corr_pearson_sub.iloc[i, j]
-                s_val = corr_spearman_sub.iloc[i, j]
-                pairs.append((a, b, float(p_val), float(s_val)))
-        pairs_sorted = sorted(pairs, key=lambda x: abs(x[2]), reverse=True)
+        # 强相关对：仅所选指标之间的配对，已按 |Pearson| 从大到小排列（按所选列缓存）
+        pairs_sorted = corr_engine.pairs(selected_cols)
+        pair_labels = {"A": "指标 A", "B": "指标 B"}
 
         rate_cols = [c for c in selected_cols if "rate" in c.lower()]
 
         st.subheader("强相关指标对")
         min_corr = st.slider("最低 |Pearson| 显示阈值", 0.3, 0.95, 0.5, 0.05)
-        strong = [(a, b, p, s) for a, b, p, s in pairs_sorted if abs(p) >= min_corr]
-
-        if not strong:
-            st.info(f"当前所选指标中，没有 |Pearson| ≥ {min_corr} 的指标对，可调低阈值或增加指标。")
-        else:
-            tbl = pd.DataFrame(
-                strong,
-                columns=["指标 A", "指标 B", "Pearson", "Spearman"],
+        c_sig, c_boot = st.columns(2)
+        with c_sig:
+            show_sig = st.checkbox(
+                "显示 p 值与 bootstrap 95% 置信区间",
+                value=True,
+                help="样本量较小时（如几百个素材），相关系数可能只是噪声：p 值越小、置信区间越窄且不跨 0，结论越可靠。",
             )
+        with c_boot:
+            n_boot = st.number_input("bootstrap 重采样次数", min_value=200, max_value=10000, value=correlation.N_BOOT, step=200, disabled=not show_sig)
+        strong = pairs_sorted[pairs_sorted["Pearson"].abs() >= min_corr]
+        # 仅率与率的相关（业务重点），且限于所选指标
+        rate_pairs = pairs_sorted[
+            pairs_sorted["A"].isin(rate_cols) & pairs_sorted["B"].isin(rate_cols) & (pairs_sorted["Pearson"].abs() >= 0.4)
+        ]
+
+        if show_sig and not (strong.empty and rate_pairs.empty):
+            # 两张表的指标对一起算：重采样在进程池中按指标对并行，已算过的指标对直接取缓存
+            boot_bar = st.progress(0.0, text="正在计算 bootstrap 置信区间…")
+            pair_stats = corr_engine.pair_stats(
+                pd.concat([strong, rate_pairs]).drop_duplicates(["A", "B"]),
+                n_boot=int(n_boot),
+                executor=workers.process_pool(),
+                progress=lambda done, total: boot_bar.progress(done / total, text=f"正在计算 bootstrap 置信区间… {done}/{total}"),
+            ).drop(columns=["Pearson", "Spearman"])
+            boot_bar.empty()
+            strong = strong.merge(pair_stats, on=["A", "B"], how="left")
+            rate_pairs = rate_pairs.merge(pair_stats, on=["A", "B"], how="left")
+
+        def _pair_table(pairs):
+            tbl = pairs.rename(columns=pair_labels).reset_index(drop=True)
             tbl["指标 A"] = tbl["指标 A"].map(lambda x: get_label(x))
             tbl["指标 B"] = tbl["指标 B"].map(lambda x: get_label(x))
-            tbl["Pearson"] = tbl["Pearson"].round(3)
-            tbl["Spearman"] = tbl["Spearman"].round(3)
-            st.dataframe(tbl, use_container_width=True, height=400)
+            tbl[tbl.columns[2:]] = tbl[tbl.columns[2:]].round(3)
+            for col in ["Pearson p", "Spearman p"]:
+                if col in tbl.columns:
+                    tbl[col] = pairs[col].to_numpy().round(4)
+            return tbl
 
-        # 仅率与率的相关（业务重点），且限于所选指标
-        rate_pairs = [(a, b, p, s) for a, b, p, s in pairs_sorted if a in rate_cols and b in rate_cols and abs(p) >= 0.4]
-        if rate_pairs:
+        if strong.empty:
+            st.info(f"当前所选指标中，没有 |Pearson| ≥ {min_corr} 的指标对，可调低阈值或增加指标。")
+        else:
+            st.dataframe(_pair_table(strong), use_container_width=True, height=400)
+
+        if not rate_pairs.empty:
             st.subheader("率指标之间的相关（业务重点）")
-            tbl_rate = pd.DataFrame(
-                rate_pairs,
-                columns=["指标 A", "指标 B", "Pearson", "Spearman"],
-            )
-            tbl_rate["指标 A"] = tbl_rate["指标 A"].map(lambda x: get_label(x))
-            tbl_rate["指标 B"] = tbl_rate["指标 B"].map(lambda x: get_label(x))
-            tbl_rate["Pearson"] = tbl_rate["Pearson"].round(3)
-            tbl_rate["Spearman"] = tbl_rate["Spearman"].round(3)
-            st.dataframe(tbl_rate, use_container_width=True)
+            st.dataframe(_pair_table(rate_pairs), use_container_width=True)
 
 if page == "📉 预测分析":
-    st.header("📉 预测分析结果")
-    st.caption("基于 tag.xlsx 的 CVR 回归与高/低转化二分类结果，及指标解读与素材方向指导。运行 python predict_analysis.py 可刷新下方内容。")
-    try:
-        with open("predict_分析结果.md", "r", encoding="utf-8") as f:
-            md_content = f.read()
-        st.markdown(md_content, unsafe_allow_html=False)
-    except FileNotFoundError:
-        st.warning("未找到 predict_分析结果.md。请先在项目目录执行：`python predict_analysis.py` 生成该文件。")
-    except Exception as e:
-        st.error(f"读取预测分析结果失败：{e}")
\ No newline at end of file
+    st.header("📉 预测分析")
+    st.caption("基于当前筛选后的数据训练 Ridge 回归 / LogisticRegression 二分类，5 折交叉验证在后台并行运行，训练期间可继续操作其它控件。")
+
+    pred_numeric = tagging.numeric_metrics(df_effective) + [c for c in TAG_COLS if c in df_effective.columns]
+    pc1, pc2, pc3 = st.columns([2, 2, 1])
+    with pc1:
+        pred_task = st.radio("任务", list(predict_analysis.TASKS), format_func=predict_analysis.TASKS.get, horizontal=True)
+    with pc2:
+        target_options = [c for c in pred_numeric if c not in TAG_COLS]
+        idx_t = target_options.index(predict_analysis.TARGET_REGRESSION) if predict_analysis.TARGET_REGRESSION in target_options else 0
+        pred_target = st.selectbox("预测目标", target_options, index=idx_t, format_func=get_label) if target_options else None
+    with pc3:
+        if pred_task == predict_analysis.REGRESSION:
+            pred_params = {"alpha": st.number_input("正则强度 alpha", value=1.0, min_value=0.001, step=0.5, format="%.3f")}
+        else:
+            pred_params = {"C": st.number_input("正则参数 C（越小正则越强）", value=1.0, min_value=0.001, step=0.5, format="%.3f")}
+    feature_options = [c for c in pred_numeric if c != pred_target]
+    pred_features = st.multiselect(
+        "特征（尽量选「原因侧」指标，避免与目标同源的指标造成信息泄漏）",
+        feature_options, default=[c for c in predict_analysis.FEATURE_COLS if c in feature_options], format_func=get_label,
+    )
+
+    # 结果按「数据哈希 + 特征 + 目标 + 模型参数」缓存；未命中时各折提交到后台进程池，本次渲染不等待
+    pred_job = None
+    if pred_target and pred_features:
+        pred_job = predict_analysis.start(df_effective, pred_task, pred_features, pred_target, pred_params)
+    if pred_job is None:
+        st.warning(f"有效样本不足 {predict_analysis.MIN_SAMPLES} 条、二分类目标只有一类，或未选择目标 / 特征，无法训练。")
+    elif pred_job.error is not None:
+        st.error(f"训练失败：{pred_job.error}")
+        if st.button("重新训练"):
+            predict_analysis.start(df_effective, pred_task, pred_features, pred_target, pred_params, retry=True)
+            st.rerun()
+    elif not pred_job.finished:
+        # 只有进度片段按秒刷新；训练完成（或失败）后整页重跑一次以显示结果
+        @st.fragment(run_every=1.0)
+        def _predict_progress():
+            if pred_job.finished:
+                st.rerun()
+            st.progress(pred_job.done / pred_job.total,
+                        text=f"后台训练中：{pred_job.n} 条样本，已完成 {pred_job.done}/{pred_job.total}（{predict_analysis.N_SPLITS} 折交叉验证 + 全量拟合）")
+
+        _predict_progress()
+    else:
+        pred = pred_job.result
+        m_cols = st.columns(len(predict_analysis.SCORING[pred_task]) + 1)
+        m_cols[0].metric("有效样本数", pred["n_samples"])
+        metric_labels = {"r2": "R²", "mae": "MAE", "rmse": "RMSE", "accuracy": "Accuracy", "f1_weighted": "F1 (weighted)", "roc_auc": "ROC AUC"}
+        for col, name in zip(m_cols[1:], predict_analysis.SCORING[pred_task]):
+            col.metric(f"{metric_labels[name]}（{predict_analysis.N_SPLITS} 折均值）", f"{pred[name]:.4f}")
+        if pred["failed_folds"]:
+            st.warning(f"{pred['failed_folds']} 折训练或评估失败（如训练集中只有一类），这些折的得分记为缺失，均值只按其余折计算。")
+        if pred_task == predict_analysis.REGRESSION:
+            st.caption("R² 越接近 1 拟合越好，样本少时容易偏低甚至为负，可优先参考 MAE / RMSE 或改用二分类。")
+
+        pr1, pr2 = st.columns([3, 2])
+        with pr1:
+            coef = pred["coef"].rename(index=get_label).sort_values()
+            fig_coef = px.bar(
+                x=coef.to_numpy(), y=coef.index, orientation="h",
+                color=coef.to_numpy(), color_continuous_scale="RdBu", color_continuous_midpoint=0,
+                labels={"x": "标准化系数", "y": ""},
+                title="条形图：各特征的标准化系数（全量数据拟合；正值表示特征越大目标越高）",
+                template="seaborn", height=max(360, 28 * len(coef)),
+            )
+            fig_coef.update_layout(coloraxis_showscale=False)
+            st.plotly_chart(fig_coef, use_container_width=True)
+        with pr2:
+            st.markdown("**各折得分**")
+            st.dataframe(pred["folds"].rename(columns=metric_labels).round(4), use_container_width=True)
+
+    with st.expander("📄 离线报告（predict_analysis.py 生成的 predict_分析结果.md）", expanded=False):
+        try:
+            with open("predict_分析结果.md", "r", encoding="utf-8") as f:
+                md_content = f.read()
+            st.markdown(md_content, unsafe_allow_html=False)
+        except FileNotFoundError:
+            st.warning("未找到 predict_分析结果.md。请先在项目目录执行：`python predict_analysis.py` 生成该文件。")
+        except Exception as e:
+            st.error(f"读取预测分析结果失败：{e}")
+if page == "🏷️ 标签对比":
+    st.header("🏷️ 标签对比")
+    st.caption("按当前筛选后的数据，实时计算各标签组的指标均值、样本数与相对整体的比值（>1 表示高于整体，<1 表示低于整体）。")
+
+    # 候选标签列：点消/拖消/目标物品，以及其它 0/1 布尔列
+    tag_candidates = [c for c in df_effective.columns if c in TAG_COLS or str(df_effective[c].dtype) in ("bool", "boolean")]
+    if not tag_candidates:
+        st.info("当前数据没有标签列。本地请选择 tag.xlsx；上传文件时请在侧栏勾选「按 tag 表格式解析」。")
+    else:
+        tc1, tc2 = st.columns([2, 1])
+        with tc1:
+            tag_cols_sel = st.multiselect("标签列", tag_candidates, default=tag_candidates, format_func=get_label)
+        with tc2:
+            multi_label = st.radio(
+                "归类方式", [False, True], horizontal=True,
+                format_func=lambda x: "多标签" if x else "单标签",
+                help="单标签：每条素材只归入一个标签（按 目标物品 > 点消 > 拖消 的优先级）；多标签：带多个标签的素材同时计入各组。",
+            )
+        if not tag_cols_sel:
+            st.warning("请至少选择一个标签列。")
+        else:
+            # 全部数值指标的分组统计按「筛选条件 + 标签 + 归类方式」缓存，切换指标直接从结果中取列
+            tag_stats = tagging.cached_summary(df_effective, tag_cols_sel, multi_label=multi_label)
+            metric_options = list(tag_stats.overall.index)
+            tag_metrics = st.multiselect(
+                "对比指标", metric_options,
+                default=[m for m in tagging.COMPARE_METRICS if m in metric_options] or metric_options[:5],
+                format_func=get_label,
+            )
+            ratios = tag_stats.ratios
+            if ratios.empty:
+                st.info("筛选后的数据中没有带所选标签的素材，可放宽展示量阈值。")
+            elif tag_metrics:
+                st.subheader("各标签相对整体的比值")
+                ratio_show = ratios[["样本数"] + tag_metrics].rename(columns=get_label)
+                st.dataframe(ratio_show.round(2), use_container_width=True)
+
+                ratio_long = ratios[tag_metrics].reset_index().melt(id_vars="标签", var_name="指标", value_name="相对整体比值")
+                ratio_long["指标"] = ratio_long["指标"].map(get_label)
+                fig_ratio = px.bar(
+                    ratio_long, x="指标", y="相对整体比值", color="标签", barmode="group",
+                    title="柱状图：各标签组指标均值 / 整体均值", template="seaborn", height=500,
+                )
+                fig_ratio.add_hline(y=1, line_dash="dash", line_color="gray")
+                st.plotly_chart(fig_ratio, use_container_width=True)
+
+                notes = []
+                for tag in ratios.index:
+                    pts = tagging.highlights(ratios.loc[tag])
+                    if pts:
+                        notes.append(f"- **{tag}**（n={int(ratios.loc[tag, '样本数'])}）：" + "；".join(pts) + "。")
+                if notes:
+                    st.markdown("**较突出的标签**：\n\n" + "\n".join(notes))
+
+                with st.expander("各标签组的指标均值与非空样本数"):
+                    by_tag_show = tag_stats.by_tag[tag_metrics].round(4)
+                    by_tag_show.columns = [f"{get_label(m)}（{'均值' if k == 'mean' else '样本数'}）" for m, k in by_tag_show.columns]
+                    st.dataframe(by_tag_show, use_container_width=True)
+                    st.caption(f"整体共 {len(df_effective)} 条素材" + ("；多标签模式下同一素材可计入多个标签组。" if multi_label else "。"))
+
+if page == "🔀 快照对比":
+    st.header("🔀 快照对比")
+    st.caption("选择同一批素材的两份导出（如上周与本周），按素材名连接，对比各指标的变化并找出变化最大的素材。")
+
+    # 可对比的数据：本地数据表、历史快照库中的快照、临时上传的导出
+    diff_options = [f"本地：{n}" for n in data_loader.DATASETS]
+    if history_store.exists():
+        diff_options += [f"快照：{d}" for d in history_store.list_snapshots()[history_store.SNAPSHOT_COL].tolist()[::-1]]
+    diff_options.append("上传文件")
+
+    def _load_compare_side(side, default_index):
+        choice = st.selectbox(f"{side}数据", diff_options, index=min(default_index, len(diff_options) - 1), key=f"diff_src_{side}")
+        if choice == "上传文件":
+            up = st.file_uploader(f"上传{side}导出 (Excel)", type=["xlsx", "xls"], key=f"diff_upload_{side}")
+            if up is None:
+                return None
+            return data_loader.read_sheet(up.getvalue(), up.name, engine=xlsx_engine, compact=True)
+        if choice.startswith("快照："):
+            # 只取该日写入的快照本身，不从更早的快照补上当天没有的素材
+            return history_store.load_snapshot(choice[len("快照："):], exact=True)
+        return data_loader.load_dataset(choice[len("本地："):], engine=xlsx_engine, compact=True)
+
+    dc1, dc2 = st.columns(2)
+    with dc1:
+        # 有历史快照时默认对比最近两次快照，否则对比前两个本地数据表
+        n_local = len(data_loader.DATASETS)
+        has_snapshots = len(diff_options) - 1 - n_local >= 2
+        df_old = _load_compare_side("旧", n_local + 1 if has_snapshots else 0)
+    with dc2:
+        df_new = _load_compare_side("新", n_local if has_snapshots else 1)
+
+    if df_old is None or df_new is None:
+        st.info("请上传要对比的导出文件。")
+    elif "HTML" not in df_old.columns or "HTML" not in df_new.columns:
+        st.warning("两份数据都需要包含 HTML（素材名）列才能对比。")
+    else:
+        # 连接与全部指标的变化按两份数据的指纹缓存，切换指标 / 排序只在结果上取前 N 名
+        diff = snapshot_diff.compare(df_old, df_new, metrics=list(col_map))
+        m1, m2, m3 = st.columns(3)
+        m1.metric("两边都有的素材", f"{len(diff.html):,}")
+        m2.metric("仅旧数据有", f"{len(diff.only_old):,}")
+        m3.metric("仅新数据有", f"{len(diff.only_new):,}")
+
+        if not diff.metrics or not len(diff.html):
+            st.warning("两份数据没有共同的素材或数值指标，无法对比。")
+        else:
+            with st.expander("各指标合计变化", expanded=False):
+                summary = diff.summary()
+                summary["指标"] = summary["指标"].map(get_label)
+                st.dataframe(summary.round(4), use_container_width=True, hide_index=True)
+
+            sc1, sc2, sc3 = st.columns([2, 2, 1])
+            with sc1:
+                idx_m = diff.metrics.index('Impressions') if 'Impressions' in diff.metrics else 0
+                diff_metric = st.selectbox("对比指标", diff.metrics, index=idx_m, format_func=get_label)
+            with sc2:
+                diff_ranking = st.selectbox("排序方式", list(snapshot_diff.RANKINGS), format_func=snapshot_diff.RANKINGS.get)
+            with sc3:
+                diff_k = st.number_input("显示前 N 个", value=20, min_value=5, max_value=500, step=5)
+
+            movers = diff.movers(diff_metric, diff_ranking, diff_k)
+            if movers.empty:
+                st.info("没有符合条件的素材。")
+            else:
+                fig_movers = px.bar(
+                    movers, x="变化量", y="HTML", orientation="h",
+                    color="变化量", color_continuous_scale="RdYlGn",
+                    hover_data={"旧值": ":.4g", "新值": ":.4g", "相对变化": ":.1%"},
+                    title=f"条形图：{get_label(diff_metric)} {snapshot_diff.RANKINGS[diff_ranking]}的素材",
+                    template="seaborn", height=max(400, 24 * len(movers)),
+                )
+                fig_movers.update_layout(yaxis=dict(autorange="reversed"), yaxis_title=None)
+                st.plotly_chart(fig_movers, use_container_width=True)
+                # 相对变化换算为百分数后用 printf 格式显示（format="percent" 预设需要较新的 Streamlit）
+                st.dataframe(
+                    movers.assign(相对变化=movers["相对变化"] * 100), use_container_width=True, hide_index=True,
+                    column_config={"相对变化": st.column_config.NumberColumn(format="%.1f%%")},
+                )
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""进程内缓存工具：内容哈希 + 按字节上限淘汰的 LRU 缓存（支持 TTL 过期）。
+
+Streamlit 每次交互都会从头重跑 app.py，但已导入的模块在进程内常驻，
+因此放在模块级的 LRUCache 可以跨重跑、跨会话复用解析/计算结果。
+"""
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def content_hash(data):
+    """对字节内容求摘要，作为缓存键的一部分。"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def key_hash(*parts):
+    """把若干可 repr 的键组成部分压成一个短摘要。"""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def estimate_nbytes(value):
+    """估算缓存对象占用的字节数：DataFrame/Series 取深度内存，字节串/字符串取长度。"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存。
+
+    - 总大小超过 ``max_bytes`` 时，从最久未访问的条目开始淘汰；
+    - 条目写入超过 ``ttl`` 秒后视为过期（``ttl=None`` 表示不过期）；
+    - 单个条目大于 ``max_bytes`` 时不入缓存，直接返回计算结果。
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, nbytes, 写入时间)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, nbytes, stamp = item
+            if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+                self._drop(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, nbytes=None):
+        if nbytes is None:
+            nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, nbytes, time.monotonic())
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes and self._data:
+                self._drop(next(iter(self._data)))
+        return value
+
+    def get_or_compute(self, key, compute):
+        """命中则直接返回；否则调用 compute() 计算并写入缓存。计算在锁外进行。"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.put(key, compute())
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+
+    def _drop(self, key):
+        _, nbytes, _ = self._data.pop(key)
+        self._nbytes -= nbytes
+
+
+_MISSING = object()
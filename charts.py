@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Plotly 图表缓存：同一份数据、同样筛选条件和图表参数下，图表只构建一次。
+
+缓存键 = 数据指纹（``attrs["dataset_key"]``）+ 筛选条件（``attrs["filter_key"]``）+ 列 + 图表 id + 图表参数；
+缓存的是图表序列化后的 JSON（按字节数计入上限、LRU 淘汰），命中时直接反序列化，
+不再重新做 px 的数据整理和趋势线拟合。仅改动侧栏搜索等与图表无关的控件时，各图表都走缓存。
+"""
+import plotly.io as pio
+
+from cache_utils import LRUCache, key_hash
+
+# 图表 JSON：总量上限 128MB，写入 1 小时后过期
+_FIGURES = LRUCache(max_bytes=128 * 1024 * 1024, ttl=3600)
+
+
+def figure_key(df, chart_id, **options):
+    """图表缓存键；数据没有指纹时返回 None（不缓存）。"""
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return None
+    return key_hash(data_key, df.attrs.get("filter_key"), tuple(df.columns), chart_id, sorted(options.items()))
+
+
+def cached_figure(df, chart_id, build, **options):
+    """返回图表：命中缓存时由 JSON 还原，否则调用 build() 构建并缓存其 JSON。
+
+    df 为图表所用数据（用于取指纹与筛选条件）；options 为影响图表的其它参数（如控件取值），须可 repr。
+    """
+    key = figure_key(df, chart_id, **options)
+    if key is None:
+        return build()
+    spec = _FIGURES.get(key)
+    if spec is None:
+        spec = _FIGURES.put(key, build().to_json())
+    return pio.from_json(spec)
+
+
+def clear_cache():
+    """清空图表缓存。"""
+    _FIGURES.clear()
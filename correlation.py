@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""相关性计算引擎（📈 相关性分析页使用）。
+
+- 相关矩阵按列增量计算：已算过的列对不再重算，选择新列时只补算新列与其余列的块；
+- Pearson 用掩码矩阵乘法一次算出一个块，缺失值按「成对完整观测」处理（与 DataFrame.corr 一致）；
+- Spearman 对秩做 Pearson 块计算：无缺失的列缓存整列秩、每列只排一次；有缺失的列按「缺失模式」分组，
+  在每对分组的共同观测行上一次排秩、算完即释放，秩缓存不超过数据本身的大小（结果与 DataFrame.corr 一致）；
+- 矩阵乘积按行分块累加，行数很大（如事件级明细）时也不会一次占用大量临时内存；
+- 指标对用上三角下标向量化提取并按 |Pearson| 排序，结果按所选列缓存；
+- 指标对可附加 p 值（t 分布近似）与 bootstrap 置信区间：重采样整批向量化计算，
+  各指标对可分发到进程池并行，结果按指标对缓存在引擎中；
+- 引擎按「数据指纹 + 筛选条件」缓存在进程内，调阈值、切换排除标签等操作直接复用。
+"""
+import threading
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import workers
+
+from cache_utils import LRUCache, content_hash, key_hash
+
+METHODS = ("pearson", "spearman")
+# 矩阵乘积每次累加的行数
+CHUNK_ROWS = 200_000
+# bootstrap：默认重采样次数、置信水平；每批重采样的下标矩阵元素数上限（控制临时内存）
+N_BOOT = 1000
+CI_LEVEL = 0.95
+BOOT_BATCH_CELLS = 4_000_000
+
+# 引擎：数据指纹 + 筛选条件 -> CorrelationEngine
+_ENGINES = LRUCache(max_bytes=512 * 1024 * 1024, ttl=3600)
+
+
+def numeric_frame(df):
+    """参与相关计算的数值表：数值列与 0/1 标签列（按 0/1 计），去掉全空与常数列。"""
+    numeric = df.select_dtypes(include=[np.number, "boolean"]).astype("float64")
+    numeric = numeric.dropna(axis=1, how="all")
+    return numeric.loc[:, numeric.nunique() > 1]
+
+
+def _row_chunks(n_rows, chunk_rows):
+    step = max(1, chunk_rows or n_rows)
+    return [slice(start, start + step) for start in range(0, n_rows, step)]
+
+
+def pearson_block(x, y, chunk_rows=CHUNK_ROWS):
+    """x (n×a) 与 y (n×b) 各列之间的 Pearson 相关 (a×b)，按成对完整观测计算。
+
+    各列先减去自身均值再做乘积累加，避免大数值（如展示量）平方和的精度损失；
+    乘积按 chunk_rows 行分块累加。
+    """
+    a, b = x.shape[1], y.shape[1]
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    full = bool(mx.all() and my.all())
+    with np.errstate(invalid="ignore"):
+        x_mean = np.nanmean(x, axis=0) if len(x) else np.zeros(a)
+        y_mean = np.nanmean(y, axis=0) if len(y) else np.zeros(b)
+    sxy = np.zeros((a, b))
+    if full:
+        # 无缺失：每对列的观测行相同，只需一次乘积
+        sxx, syy = np.zeros(a), np.zeros(b)
+        for rows in _row_chunks(len(x), chunk_rows):
+            x0, y0 = x[rows] - x_mean, y[rows] - y_mean
+            sxy += x0.T @ y0
+            sxx += (x0 * x0).sum(axis=0)
+            syy += (y0 * y0).sum(axis=0)
+        n = np.full((a, b), float(len(x)))
+        var_x, var_y = sxx[:, None], syy[None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = sxy / np.sqrt(var_x * var_y)
+    else:
+        n, sx, sy, sxx, syy = (np.zeros((a, b)) for _ in range(5))
+        for rows in _row_chunks(len(x), chunk_rows):
+            fx, fy = mx[rows].astype(np.float64), my[rows].astype(np.float64)
+            x0 = np.where(mx[rows], x[rows] - x_mean, 0.0)
+            y0 = np.where(my[rows], y[rows] - y_mean, 0.0)
+            n += fx.T @ fy
+            sx += x0.T @ fy
+            sy += fx.T @ y0
+            sxx += (x0 * x0).T @ fy
+            syy += fx.T @ (y0 * y0)
+            sxy += x0.T @ y0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = sxy - sx * sy / n
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+            r = cov / np.sqrt(var_x * var_y)
+    r[(n < 2) | ~(var_x > 0) | ~(var_y > 0)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def rank_columns(values):
+    """按列求平均秩（并列取平均秩，与 Spearman 的定义一致）。"""
+    return pd.DataFrame(values).rank(method="average").to_numpy(dtype=np.float64)
+
+
+class RankCache:
+    """一份数据各列的秩：无缺失的列在全部行上的整列秩只排一次并缓存（每列至多一份，内存与数据同量级）。
+
+    有缺失的列要在「共同观测行」上排秩，行集合随配对的列而变，这类秩按块现算、用完即释放，不做缓存。
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self._valid = ~np.isnan(values)
+        self._patterns = {}
+        self._ranks = {}
+
+    @property
+    def nbytes(self):
+        return sum(r.nbytes for r in self._ranks.values())
+
+    def pattern(self, col):
+        """列的缺失模式：None 表示无缺失，否则为观测掩码的摘要。"""
+        if col not in self._patterns:
+            valid = self._valid[:, col]
+            self._patterns[col] = None if valid.all() else content_hash(np.packbits(valid).tobytes())
+        return self._patterns[col]
+
+    def rows(self, cols):
+        """一组列的共同观测行（布尔掩码）。"""
+        return self._valid[:, list(cols)].all(axis=1)
+
+    def full_ranks(self, cols):
+        """无缺失的列在全部行上的秩（n_rows×len(cols)）；未排过的列才重新排秩。"""
+        todo = [c for c in cols if c not in self._ranks]
+        if todo:
+            for c, r in zip(todo, rank_columns(self.values[:, todo]).T):
+                self._ranks[c] = r
+        return np.column_stack([self._ranks[c] for c in cols])
+
+    def ranks_on(self, cols, rows):
+        """cols 各列在 rows（布尔掩码）上的秩，现算不缓存。"""
+        return rank_columns(self.values[rows][:, list(cols)])
+
+
+def spearman_block(cache, left, right, chunk_rows=CHUNK_ROWS):
+    """cache 数据中 left 各列与 right 各列之间的 Spearman 相关 (len(left)×len(right))。
+
+    按缺失模式把两侧列分组：两组都无缺失时复用缓存的整列秩；否则在两组的共同观测行上
+    一次性为两组的列排秩（同一列只排一次），算完该块即释放。
+    """
+    out = np.full((len(left), len(right)), np.nan)
+    groups = {}
+    for side, cols in ((0, left), (1, right)):
+        for pos, col in enumerate(cols):
+            groups.setdefault((side, cache.pattern(col)), ([], []))
+            groups[(side, cache.pattern(col))][0].append(pos)
+            groups[(side, cache.pattern(col))][1].append(col)
+    left_groups = [(k[1], v) for k, v in groups.items() if k[0] == 0]
+    right_groups = [(k[1], v) for k, v in groups.items() if k[0] == 1]
+    for lkey, (lpos, lcols) in left_groups:
+        for rkey, (rpos, rcols) in right_groups:
+            if lkey is None and rkey is None:
+                rl, rr = cache.full_ranks(lcols), cache.full_ranks(rcols)
+            else:
+                union = list(dict.fromkeys(lcols + rcols))
+                ranked = cache.ranks_on(union, cache.rows([lcols[0], rcols[0]]))
+                where = {c: i for i, c in enumerate(union)}
+                rl = ranked[:, [where[c] for c in lcols]]
+                rr = ranked[:, [where[c] for c in rcols]]
+            out[np.ix_(lpos, rpos)] = pearson_block(rl, rr, chunk_rows)
+    return out
+
+
+def spearman_matrix(numeric, chunk_rows=CHUNK_ROWS):
+    """数值表的 Spearman 相关矩阵（DataFrame.corr(method="spearman") 的快速版本）。"""
+    cols = list(range(numeric.shape[1]))
+    cache = RankCache(numeric.to_numpy(dtype=np.float64))
+    mat = spearman_block(cache, cols, cols, chunk_rows)
+    return pd.DataFrame(mat, index=numeric.columns, columns=numeric.columns)
+
+
+def pvalues(r, n):
+    """相关系数的双侧 p 值（t 分布近似，Pearson / Spearman 通用）；样本数不足 3 时为 NaN。"""
+    r = np.asarray(r, dtype=np.float64)
+    dof = np.asarray(n, dtype=np.float64) - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = r * np.sqrt(dof / (1.0 - r * r))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    return np.where(dof >= 1, p, np.nan)
+
+
+def _rowwise_corr(x, y):
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (x * y).sum(axis=1) / np.sqrt((x * x).sum(axis=1) * (y * y).sum(axis=1))
+
+
+def bootstrap_pair(x, y, n_boot=N_BOOT, seed=0, level=CI_LEVEL):
+    """一对指标（已去掉缺失行）的 bootstrap 百分位置信区间：(Pearson 下限, 上限, Spearman 下限, 上限)。
+
+    每批同时抽取多组重采样下标，整批计算相关系数。
+    """
+    m = len(x)
+    if m < 3:
+        return (np.nan,) * 4
+    rng = np.random.default_rng(seed)
+    r_p, r_s = np.empty(n_boot), np.empty(n_boot)
+    batch = max(1, BOOT_BATCH_CELLS // m)
+    for start in range(0, n_boot, batch):
+        stop = min(n_boot, start + batch)
+        idx = rng.integers(0, m, size=(stop - start, m))
+        xs, ys = x[idx], y[idx]
+        r_p[start:stop] = _rowwise_corr(xs, ys)
+        r_s[start:stop] = _rowwise_corr(stats.rankdata(xs, axis=1), stats.rankdata(ys, axis=1))
+    q = [50 * (1 - level), 50 * (1 + level)]
+    with np.errstate(invalid="ignore"):
+        p_lo, p_hi = np.nanpercentile(r_p, q) if np.isfinite(r_p).any() else (np.nan, np.nan)
+        s_lo, s_hi = np.nanpercentile(r_s, q) if np.isfinite(r_s).any() else (np.nan, np.nan)
+    return float(p_lo), float(p_hi), float(s_lo), float(s_hi)
+
+
+def format_p(p):
+    """报告中的 p 值写法。"""
+    if not np.isfinite(p):
+        return "-"
+    return "<0.001" if p < 0.001 else f"{p:.3f}"
+
+
+def format_ci(r, lo, hi):
+    """报告中「相关系数 [下限, 上限]」的写法。"""
+    if not np.isfinite(lo):
+        return f"{r:.3f}"
+    return f"{r:.3f} [{lo:.2f}, {hi:.2f}]"
+
+
+# Markdown 报告中指标对表格的表头（配合 markdown_pair_rows 使用）
+MARKDOWN_PAIR_HEADER = [
+    "| 指标 A | 指标 B | Pearson [95% CI] | Spearman [95% CI] | p 值 (Pearson) | 样本数 |",
+    "|--------|--------|------------------|-------------------|----------------|--------|",
+]
+
+
+def markdown_pair_rows(engine, pairs, n_boot=N_BOOT):
+    """把 [(A, B, Pearson, Spearman), ...] 写成 Markdown 表格行，附 p 值与 bootstrap 置信区间。"""
+    if not pairs:
+        return []
+    table = engine.pair_stats(pd.DataFrame(pairs, columns=["A", "B", "Pearson", "Spearman"]), n_boot=n_boot)
+    return [
+        f"| {row.A} | {row.B} | {format_ci(row.Pearson, row['Pearson 下限'], row['Pearson 上限'])} "
+        f"| {format_ci(row.Spearman, row['Spearman 下限'], row['Spearman 上限'])} | {format_p(row['Pearson p'])} | {row.N} |"
+        for _, row in table.iterrows()
+    ]
+
+
+def ranked_pairs(corr_pearson, corr_spearman):
+    """两两指标对 [(A, B, Pearson, Spearman), ...]，按 |Pearson| 从大到小排列（并列时保持原顺序）。"""
+    i, j = np.triu_indices(len(corr_pearson), k=1)
+    p = corr_pearson.to_numpy()[i, j]
+    s = corr_spearman.to_numpy()[i, j]
+    order = np.argsort(-np.abs(p), kind="stable")
+    names = corr_pearson.columns
+    return [(names[i[k]], names[j[k]], float(p[k]), float(s[k])) for k in order]
+
+
+class CorrelationEngine:
+    """一份数值表的相关矩阵，按需增量计算、线程安全（多个会话可能共用同一引擎）。"""
+
+    def __init__(self, numeric, chunk_rows=CHUNK_ROWS):
+        self.data = numeric
+        self.chunk_rows = chunk_rows
+        self._values = numeric.to_numpy(dtype=np.float64)
+        self._ranks = RankCache(self._values)
+        self.columns = numeric.columns.tolist()
+        self._index = {c: i for i, c in enumerate(self.columns)}
+        k = len(self.columns)
+        self._mats = {m: np.full((k, k), np.nan) for m in METHODS}
+        self._done = {m: np.zeros(k, dtype=bool) for m in METHODS}
+        self._pairs = {}
+        self._boot = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        k = len(self.columns)
+        # 数据 + 数值数组 + 秩（约与数据同量级）+ 两个矩阵
+        return 3 * int(self.data.memory_usage(index=False).sum()) + 2 * k * k * 8
+
+    def matrix(self, cols, method="pearson"):
+        """所选列之间的相关矩阵（DataFrame）；只计算尚未算过的列。"""
+        idx = self._ensure(cols, method)
+        mat = self._mats[method][np.ix_(idx, idx)]
+        return pd.DataFrame(mat, index=list(cols), columns=list(cols))
+
+    def pairs(self, cols):
+        """所选列两两组合的 Pearson / Spearman，按 |Pearson| 从大到小排列（并列时保持列顺序）。"""
+        cols = tuple(cols)
+        with self._lock:
+            cached = self._pairs.get(cols)
+        if cached is not None:
+            return cached
+        idx = self._ensure(cols, "pearson")
+        self._ensure(cols, "spearman")
+        i, j = np.triu_indices(len(idx), k=1)
+        gi, gj = np.asarray(idx)[i], np.asarray(idx)[j]
+        p = self._mats["pearson"][gi, gj]
+        s = self._mats["spearman"][gi, gj]
+        order = np.argsort(-np.abs(p), kind="stable")
+        names = np.asarray(cols, dtype=object)
+        out = pd.DataFrame({
+            "A": names[i[order]],
+            "B": names[j[order]],
+            "Pearson": p[order],
+            "Spearman": s[order],
+        })
+        with self._lock:
+            self._pairs[cols] = out
+        return out
+
+    def pair_stats(self, pairs, n_boot=N_BOOT, executor=None, progress=None, seed=0):
+        """给指标对（pairs() 的结果或其子集）补上样本数、p 值与 bootstrap 置信区间。
+
+        置信区间按 (A, B, 次数, 种子) 缓存在引擎中，只为新出现的指标对重采样；每对的随机种子由
+        指标名与 seed 决定，结果可复现。executor 不为 None 时（如 workers.process_pool()）
+        各指标对分发到该执行器并行计算；progress(已完成, 总数) 用于显示进度。
+        """
+        out = pairs.reset_index(drop=True)
+        a = np.array([self._index[c] for c in out["A"]], dtype=int)
+        b = np.array([self._index[c] for c in out["B"]], dtype=int)
+        joint = ~np.isnan(self._values[:, a]) & ~np.isnan(self._values[:, b])
+        n = joint.sum(axis=0)
+        out = out.assign(**{
+            "N": n,
+            "Pearson p": pvalues(out["Pearson"], n),
+            "Spearman p": pvalues(out["Spearman"], n),
+        })
+
+        keys = [(ca, cb, n_boot, seed) for ca, cb in zip(out["A"], out["B"])]
+        with self._lock:
+            todo = [k for k in dict.fromkeys(keys) if k not in self._boot]
+        if todo:
+            jobs = {}
+            for k in todo:
+                ia, ib = self._index[k[0]], self._index[k[1]]
+                rows = ~np.isnan(self._values[:, ia]) & ~np.isnan(self._values[:, ib])
+                pair_seed = int(key_hash(k[0], k[1], seed)[:8], 16)
+                jobs[k] = (self._values[rows, ia], self._values[rows, ib], n_boot, pair_seed)
+            results = _run_bootstrap(jobs, executor, progress)
+            with self._lock:
+                self._boot.update(results)
+        ci = np.array([self._boot[k] for k in keys], dtype=np.float64).reshape(len(keys), 4)
+        return out.assign(**{
+            "Pearson 下限": ci[:, 0], "Pearson 上限": ci[:, 1],
+            "Spearman 下限": ci[:, 2], "Spearman 上限": ci[:, 3],
+        })
+
+    def _ensure(self, cols, method):
+        idx = [self._index[c] for c in cols]
+        with self._lock:
+            done = self._done[method]
+            new = [i for i in dict.fromkeys(idx) if not done[i]]
+            if new:
+                self._fill(method, new)
+        return idx
+
+    def _fill(self, method, new):
+        """补算新列与「已算列 + 新列」之间的相关块，并对称写回矩阵。"""
+        done = self._done[method]
+        targets = np.concatenate([np.flatnonzero(done), new]).astype(int)
+        mat = self._mats[method]
+        if method == "pearson":
+            block = pearson_block(self._values[:, new], self._values[:, targets], self.chunk_rows)
+        else:
+            block = spearman_block(self._ranks, new, list(targets), self.chunk_rows)
+        mat[np.ix_(new, targets)] = block
+        mat[np.ix_(targets, new)] = block.T
+        mat[new, new] = 1.0
+        done[new] = True
+
+
+def _run_bootstrap(jobs, executor, progress):
+    """执行各指标对的 bootstrap；executor 为 None 时在当前进程逐个计算。"""
+    results = {}
+    total = len(jobs)
+    if executor is None:
+        for k, args in jobs.items():
+            results[k] = bootstrap_pair(*args)
+            if progress:
+                progress(len(results), total)
+        return results
+    try:
+        futures = {executor.submit(bootstrap_pair, *args): k for k, args in jobs.items()}
+        for f in as_completed(futures):
+            results[futures[f]] = f.result()
+            if progress:
+                progress(len(results), total)
+    except BrokenProcessPool:
+        workers.reset_process_pool()
+        raise
+    return results
+
+
+def engine_for(df, *filter_key):
+    """按「数据指纹 + 筛选条件」取（或新建）相关引擎。
+
+    数据指纹取 ``df.attrs["dataset_key"]``（data_loader 读取时写入）；没有指纹时不缓存。
+    """
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return CorrelationEngine(numeric_frame(df))
+    key = key_hash(data_key, tuple(df.columns), filter_key)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        engine = CorrelationEngine(numeric_frame(df))
+        _ENGINES.put(key, engine, nbytes=engine.nbytes)
+    return engine
@@ -1,30 +1,23 @@
 # -*- coding: utf-8 -*-
 """相关性分析：从 sksx.xlsx 计算并找出强相关指标对"""
-import pandas as pd
 import numpy as np
 
-df = pd.read_excel('sksx.xlsx', engine='openpyxl')
+import correlation
+import data_loader
+
+df = data_loader.load_dataset('sksx.xlsx')
 numeric = df.select_dtypes(include=[np.number])
 numeric = numeric.dropna(axis=1, how='all')
 numeric = numeric.loc[:, numeric.nunique() > 1]
 
 corr_pearson = numeric.corr(method='pearson')
-corr_spearman = numeric.corr(method='spearman')
+corr_spearman = correlation.spearman_matrix(numeric)  # 每列只排一次秩
 
 # 保存完整相关矩阵，便于后续查看
 corr_pearson.to_csv('correlation_pearson.csv', encoding='utf-8-sig')
 corr_spearman.to_csv('correlation_spearman.csv', encoding='utf-8-sig')
 
-n = len(corr_pearson)
-pairs = []
-for i in range(n):
-    for j in range(i + 1, n):
-        a, b = corr_pearson.columns[i], corr_pearson.columns[j]
-        p_val = corr_pearson.iloc[i, j]
-        s_val = corr_spearman.iloc[i, j]
-        pairs.append((a, b, float(p_val), float(s_val)))
-
-pairs_sorted = sorted(pairs, key=lambda x: abs(x[2]), reverse=True)
+pairs_sorted = correlation.ranked_pairs(corr_pearson, corr_spearman)
 
 # 只保留「率」与「率」或「率」与其它有业务解释的配对，排除纯计数间的规模相关
 rate_cols = [c for c in numeric.columns if 'rate' in c.lower()]
@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+"""数据读取层（看板与各分析脚本共用）：统一读取、列名规范化与缓存。
+
+本地数据表的读取方式登记在 DATASETS 中，调用 load_dataset(名称) 即可拿到规范化后的表；
+上传文件走 read_sheet。同一份数据在一个进程内只解析一次。
+
+两级缓存：
+1. 进程内 LRU：缓存键 = 文件字节摘要 + ZIP 内成员名 + Sheet 名 + 是否按 tag 表格式解析；
+2. 磁盘旁路文件（.cache/sidecar/<键>.parquet）：首次解析后写一份 zstd 压缩的 Parquet，
+   已完成列名规范化（点消/拖消/目标物品），之后的进程（看板重启、各分析脚本）
+   直接以内存映射方式读取列式文件，不再经过 openpyxl。
+
+列投影：各读取函数的 columns 参数指定需要的列（不存在的列忽略，None 表示全部列）。
+有旁路文件时只读这些列，内存中也只保留这些列；之后需要更多列时只从旁路文件补读缺的列。
+注意：列投影只在旁路文件存在之后生效。缓存未命中时首次解析 Excel 仍读取全部列（旁路文件需要完整的列，
+供其它页面按需补读；且 openpyxl / calamine 即使指定 usecols 也要逐格读完整个 Sheet，节省有限），
+因此宽表的冷启动耗时与不做投影相同；未安装 pyarrow（无法写旁路文件）时内存中也保留全部列。
+.xlsx 可选用更快的 calamine 引擎（需安装 python-calamine），见 available_xlsx_engines()。
+
+紧凑类型：compact=True 时返回 compact_dtypes() 压缩后的表（看板使用，减少常驻内存），
+与原始表分开缓存；各分析脚本默认读原始类型，输出不受影响。
+
+解析得到的 DataFrame 由所有会话共享，调用方不要原地修改（需要改时先 copy）。
+"""
+import importlib.util
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_numeric_dtype
+
+import workers
+from cache_utils import LRUCache, content_hash, key_hash
+
+try:
+    import pyarrow.parquet as pq  # Parquet 旁路缓存依赖 pyarrow；未安装时只用进程内缓存
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# pandas 2.2 起支持 engine="calamine"（需另装 python-calamine）
+HAS_CALAMINE = (
+    importlib.util.find_spec("python_calamine") is not None
+    and tuple(int(x) for x in pd.__version__.split(".")[:2]) >= (2, 2)
+)
+
+# 标签列：tag 表 Sheet2 第 3～5 列（分类标签，取值 0/1，非连续型指标）
+TAG_COLS = ["点消", "拖消", "目标物品"]
+
+# 本地数据表：文件名 -> 读取参数（Sheet、是否按 tag 表格式解析）
+DATASETS = {
+    "sksx.xlsx": {"sheet_name": 0, "tag_parse": False},
+    "tag.xlsx": {"sheet_name": "Sheet2", "tag_parse": True},
+}
+
+# 多个文件 / Sheet 合并时的来源列：每行来自哪个文件、哪个 Sheet
+SOURCE_COL = "Source file"
+SOURCE_SHEET_COL = "Source sheet"
+# Sheet 选择中的「各文件的首个 Sheet」（按位置取，不要求各文件 Sheet 名一致）
+FIRST_SHEET = 0
+
+# 紧凑类型：金额列保持 float64（汇总时避免累积舍入误差）；素材名/链接转为字符串类型
+FLOAT64_COLS = ["Spend"]
+STRING_COLS = ["HTML", "URL"]
+# 计数列最小用 int32：计数非负，int32 以上相减不会回绕（int8/int16 下 100 - (-100) 即溢出）
+_INT_TYPES = ((np.int32, "Int32"), (np.int64, "Int64"))
+
+# 紧凑类型规则的版本：规则变化时递增，旧的紧凑旁路文件随缓存键变化自然失效
+COMPACT_VERSION = 2
+
+SIDECAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sidecar")
+
+# 已解析的表：总量上限 1GB，写入 1 小时后过期
+_FRAME_CACHE = LRUCache(max_bytes=1024 * 1024 * 1024, ttl=3600)
+# 工作簿的 Sheet 名列表（体积很小，同样按内容哈希缓存）
+_SHEET_CACHE = LRUCache(max_bytes=4 * 1024 * 1024, ttl=3600)
+# 本地文件摘要：路径 -> ((mtime_ns, size), 摘要)，文件未改动时不必重新读字节求哈希
+_FILE_DIGESTS = {}
+
+
+def is_excel_name(name):
+    """是否为 Excel 文件名（排除 macOS 压缩时带上的 __MACOSX 等目录）。"""
+    return str(name).lower().endswith((".xlsx", ".xls")) and not str(name).startswith("__")
+
+
+def available_xlsx_engines():
+    """当前环境可用的 .xlsx 解析引擎（calamine 基于 Rust，通常比 openpyxl 快一个数量级）。"""
+    return ["openpyxl", "calamine"] if HAS_CALAMINE else ["openpyxl"]
+
+
+def excel_engine(file_name, preferred=None):
+    """按扩展名选择 Excel 引擎：.xls 用 xlrd，.xlsx 默认 openpyxl，避免 'file is not a zip file'。
+
+    preferred 为 .xlsx 的首选引擎（如 "calamine"），未安装时退回 openpyxl。
+    """
+    if file_name and str(file_name).lower().endswith(".xls") and not str(file_name).lower().endswith(".xlsx"):
+        return "xlrd"
+    if preferred in available_xlsx_engines():
+        return preferred
+    return "openpyxl"
+
+
+def apply_tag_format(df):
+    """按 tag 表格式解析：第 3～5 列视为点消/拖消/目标物品（列数不足 5 时原样返回）。"""
+    if len(df.columns) < 5:
+        return df
+    return df.rename(columns=dict(zip(df.columns[2:5], TAG_COLS)))
+
+
+def coerce_tag_columns(df, fill=None):
+    """把存在的标签列转为数值（无法解析的记为缺失，紧凑类型中的布尔列转为 0/1），fill 不为 None 时用其填充缺失。返回新表。"""
+    df = df.copy()
+    for c in TAG_COLS:
+        if c in df.columns:
+            s = df[c].astype("Float64") if is_bool_dtype(df[c]) else df[c]
+            df[c] = pd.to_numeric(s, errors="coerce")
+            if fill is not None:
+                df[c] = df[c].fillna(fill)
+    return df
+
+
+def _compact_column(name, s):
+    if name in FLOAT64_COLS:
+        return s
+    if name in STRING_COLS:
+        if is_numeric_dtype(s):
+            return s
+        return s.astype("string[pyarrow]" if HAS_PYARROW else "category")
+    if not is_numeric_dtype(s) or is_bool_dtype(s):
+        return s
+    values = s.dropna()
+    if name in TAG_COLS and values.isin([0, 1]).all():
+        return s.astype("boolean")
+    if values.empty:
+        return s.astype(np.float32)
+    integral = is_integer_dtype(s) or bool((values == np.floor(values)).all())
+    if integral:
+        # 计数列：取能容纳取值范围的最小有符号整数；含缺失时用可空整数（Int32 / Int64）
+        lo, hi = values.min(), values.max()
+        for t, nullable in _INT_TYPES:
+            if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max:
+                return s.astype(t) if len(values) == len(s) else s.astype(nullable)
+        # 超出 int64 的取值：float32 无法精确表示，保持原类型
+        return s
+    return s.astype(np.float32)
+
+
+def compact_dtypes(df):
+    """把表压成紧凑类型，返回新表。
+
+    - 计数（整数值）：能容纳取值范围的最小有符号整数（至少 int32）；含缺失时为可空整数 Int32 / Int64；
+    - 比率等其余浮点列：float32（金额列 FLOAT64_COLS 除外）；
+    - 标签列（取值 0/1）：可空布尔；
+    - 素材名/链接（STRING_COLS）：Arrow 字符串（无 pyarrow 时为 category）。
+    压缩前各列占用字节数记在 ``attrs["raw_nbytes"]``，供内存对比展示。
+    """
+    raw = df.memory_usage(deep=True, index=False)
+    out = pd.DataFrame({col: _compact_column(col, df[col]) for col in df.columns}, index=df.index)
+    out.attrs.update(df.attrs)
+    out.attrs["raw_nbytes"] = {col: int(n) for col, n in raw.items()}
+    return out
+
+
+def memory_report(df):
+    """(压缩前字节数, 当前字节数)；没有压缩记录时两者相同。只统计 df 中现有的列。"""
+    now = int(df.memory_usage(deep=True, index=False).sum())
+    raw = df.attrs.get("raw_nbytes")
+    if not raw:
+        return now, now
+    return sum(raw.get(col, 0) for col in df.columns), now
+
+
+def dataset_key(digest, sheet_name=0, tag_parse=False, member=None):
+    """同一份数据的缓存键：字节摘要 + ZIP 成员 + Sheet + 解析方式。"""
+    return key_hash(digest, member, sheet_name, bool(tag_parse))
+
+
+def file_digest(path):
+    """本地文件的内容摘要；按 (mtime, size) 记忆，文件未改动时不重复读取。"""
+    path = os.path.abspath(path)
+    st_ = os.stat(path)
+    stamp = (st_.st_mtime_ns, st_.st_size)
+    memo = _FILE_DIGESTS.get(path)
+    if memo is not None and memo[0] == stamp:
+        return memo[1]
+    with open(path, "rb") as f:
+        digest = content_hash(f.read())
+    _FILE_DIGESTS[path] = (stamp, digest)
+    return digest
+
+
+def _sidecar_path(name, suffix=".parquet"):
+    return os.path.join(SIDECAR_DIR, name + suffix)
+
+
+def _read_sidecar(key, columns=None):
+    """读旁路文件中需要的列（列投影下推到 Parquet）；全部列名记在 ``attrs["all_columns"]``。"""
+    if not HAS_PYARROW:
+        return None
+    path = _sidecar_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        names = pq.read_schema(path).names
+        wanted = names if columns is None else [c for c in names if c in set(columns)]
+        df = pd.read_parquet(path, engine="pyarrow", columns=wanted, memory_map=True)
+    except Exception:
+        # 旁路文件损坏（如写入中断）时当作未命中，稍后重新生成
+        return None
+    df.attrs["all_columns"] = names
+    return df
+
+
+def _write_sidecar(key, df):
+    """写 Parquet 旁路文件；列名非字符串或存在混合类型列等无法列式存储时静默跳过。"""
+    if not HAS_PYARROW:
+        return
+    path = _sidecar_path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        df.to_parquet(tmp, engine="pyarrow", compression="zstd", index=False)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _open_excel(data, file_name, engine=None):
+    """打开工作簿；.xlsx 引擎报「不是 zip」时自动改用 xlrd 重试（后缀为 .xlsx 的老格式文件）。"""
+    engine = excel_engine(file_name, engine)
+    try:
+        return pd.ExcelFile(io.BytesIO(data), engine=engine)
+    except Exception as zip_err:
+        if "zip" in str(zip_err).lower() and engine != "xlrd":
+            return pd.ExcelFile(io.BytesIO(data), engine="xlrd")
+        raise
+
+
+def _parse_sheet(data, file_name, sheet_name, tag_parse, engine=None):
+    df = _parse_member(data, file_name, sheet_name, tag_parse, engine)
+    if df is None:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return df
+
+
+def _parse_member(data, file_name, sheet_name, tag_parse, engine=None):
+    """进程池中解析一个工作簿的一个 Sheet；工作簿中没有该 Sheet 时返回 None（由调用方记为跳过）。
+
+    实际读取的 Sheet 名记在 ``attrs["sheet_name"]``（sheet_name 为位置序号时也能得到真实名称）。
+    """
+    with _open_excel(data, file_name, engine) as xl:
+        if isinstance(sheet_name, str):
+            if sheet_name not in xl.sheet_names:
+                return None
+            resolved = sheet_name
+        else:
+            resolved = xl.sheet_names[sheet_name]
+        df = xl.parse(resolved)
+    if tag_parse:
+        df = apply_tag_format(df)
+    df.attrs["sheet_name"] = resolved
+    return df
+
+
+def align_frames(frames, schema=None):
+    """按统一的列顺序对齐并纵向合并多个表。
+
+    列顺序：schema（如看板的 col_map 键）中出现过的列在前，其余列按首次出现顺序在后，来源列放最后；
+    某个表缺少的列补为缺失值（NaN），不补 0，以免拉低均值等统计。
+    """
+    if not frames:
+        return pd.DataFrame()
+    seen = {}
+    for df in frames:
+        for c in df.columns:
+            seen.setdefault(c, None)
+    provenance = [c for c in (SOURCE_COL, SOURCE_SHEET_COL) if c in seen]
+    columns = [c for c in (schema or []) if c in seen and c not in provenance]
+    columns += [c for c in seen if c not in set(columns) and c not in provenance]
+    columns += provenance
+    return pd.concat([df.reindex(columns=columns) for df in frames], ignore_index=True, sort=False)
+
+
+def _project(df, columns):
+    """按需要的列取子表（保持原列顺序；不存在的列忽略）。"""
+    if columns is None:
+        return df
+    wanted = set(columns)
+    keep = [c for c in df.columns if c in wanted]
+    return df if len(keep) == len(df.columns) else df[keep]
+
+
+def _store(key, df, all_columns):
+    df.attrs["dataset_key"] = key
+    df.attrs["all_columns"] = list(all_columns)
+    _FRAME_CACHE.put(key, df)
+
+
+def _lookup(key, columns=None):
+    """只查缓存（进程内 -> 旁路文件），不解析 Excel；均未命中时返回 None。
+
+    进程内缓存的表缺少需要的列时，只从旁路文件补读缺的列并合并回缓存（列集合只增不减）。
+    """
+    df = _FRAME_CACHE.get(key)
+    if df is None:
+        df = _read_sidecar(key, columns)
+        if df is None:
+            return None
+        _store(key, df, df.attrs["all_columns"])
+        return df
+    all_columns = df.attrs["all_columns"]
+    wanted = all_columns if columns is None else [c for c in all_columns if c in set(columns)]
+    missing = [c for c in wanted if c not in df.columns]
+    if missing:
+        extra = _read_sidecar(key, missing)
+        if extra is None:
+            return None
+        attrs = dict(df.attrs)
+        df = pd.concat([df, extra], axis=1)
+        df = df[[c for c in all_columns if c in df.columns]]
+        df.attrs.update(attrs)
+        _store(key, df, all_columns)
+    return _project(df, columns)
+
+
+def _load(key, parse, columns=None, compact=False):
+    """进程内缓存 -> 旁路文件 -> 真正解析，逐级回退；解析后回写旁路文件。
+
+    缓存未命中时 parse() 总是解析全部列（列投影不下推到 Excel 读取），写入完整的旁路文件；
+    旁路文件写入成功时，内存中只保留需要的列，其余列留在旁路文件里按需补读。
+    compact=True 时以原始表为来源生成紧凑版本，单独缓存（进程内不再保留原始表）。
+    """
+    if compact:
+        def parse_compact():
+            raw = _load(key, parse)
+            _FRAME_CACHE.pop(key)
+            return compact_dtypes(raw)
+
+        return _load(key_hash(key, "compact", COMPACT_VERSION), parse_compact, columns)
+    df = _lookup(key, columns)
+    if df is not None:
+        return df
+    full = parse()
+    _write_sidecar(key, full)
+    all_columns = list(full.columns)
+    if columns is not None and os.path.exists(_sidecar_path(key)):
+        full = _project(full, columns)
+    _store(key, full, all_columns)
+    return _project(full, columns)
+
+
+def _sheet_names(digest, member, open_workbook):
+    def load():
+        path = _sidecar_path(key_hash(digest, member), ".sheets.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        with open_workbook() as xl:
+            names = list(xl.sheet_names)
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(names, f, ensure_ascii=False)
+        return names
+
+    return _SHEET_CACHE.get_or_compute((digest, member), load)
+
+
+def sheet_names(data, file_name, member=None, engine=None):
+    """工作簿中的 Sheet 名列表（按内容缓存）。"""
+    return _sheet_names(content_hash(data), member, lambda: _open_excel(data, file_name, engine))
+
+
+def read_sheet(data, file_name, sheet_name=0, tag_parse=False, member=None, columns=None, engine=None, compact=False):
+    """解析一个 Sheet 并缓存。
+
+    data 为 Excel 文件字节；file_name 仅用于选择引擎；member 为 ZIP 内成员名（非 ZIP 时为 None）；
+    columns 为需要的列（None 表示全部）；engine 为 .xlsx 首选引擎（不同引擎解析结果视为相同，共用缓存）；
+    compact=True 时返回紧凑类型版本（见 compact_dtypes）。
+    返回的 DataFrame 在 ``attrs["dataset_key"]`` 中带有缓存键，可作为下游缓存的数据指纹。
+    """
+    key = dataset_key(content_hash(data), sheet_name, tag_parse, member)
+    return _load(key, lambda: _parse_sheet(data, file_name, sheet_name, tag_parse, engine), columns, compact)
+
+
+def read_local(path, sheet_name=0, tag_parse=False, columns=None, engine=None, compact=False):
+    """读取本地 Excel 文件；命中旁路文件时完全不经过 openpyxl。文件被覆盖更新后自动重新解析。"""
+    key = dataset_key(file_digest(path), sheet_name, tag_parse)
+
+    def parse():
+        with open(path, "rb") as f:
+            data = f.read()
+        return _parse_sheet(data, os.path.basename(path), sheet_name, tag_parse, engine)
+
+    return _load(key, parse, columns, compact)
+
+
+def load_dataset(name, base_dir=".", columns=None, engine=None, compact=False):
+    """按 DATASETS 中登记的方式读取本地数据表；未登记的文件按首个 Sheet 原样读取。"""
+    opts = DATASETS.get(name, {"sheet_name": 0, "tag_parse": False})
+    return read_local(os.path.join(base_dir, name), columns=columns, engine=engine, compact=compact, **opts)
+
+
+def zip_excel_members(data):
+    """ZIP 包内的 Excel 成员名（只读中央目录，不解压；按内容缓存）。"""
+    def load():
+        with zipfile.ZipFile(io.BytesIO(data), "r") as z:
+            return [n for n in z.namelist() if is_excel_name(n)]
+
+    return _SHEET_CACHE.get_or_compute(("zip", content_hash(data)), load)
+
+
+def zip_sheet_names(data, member, pwd=None, engine=None):
+    """ZIP 内某个 Excel 成员的 Sheet 名列表。"""
+    def open_member():
+        with zipfile.ZipFile(io.BytesIO(data), "r") as z:
+            return _open_excel(z.read(member, pwd=pwd), member, engine)
+
+    return _sheet_names(content_hash(data), member, open_member)
+
+
+def excel_sources(file_name, data):
+    """单个 Excel 文件作为数据来源（供 read_sources 使用）。"""
+    return [{"label": file_name, "data": data, "member": None, "pwd": None}]
+
+
+def zip_sources(file_name, data, members, pwd=None):
+    """ZIP 包中选中的 Excel 成员作为数据来源（供 read_sources 使用）。"""
+    return [{"label": f"{file_name}/{m}", "data": data, "member": m, "pwd": pwd} for m in members]
+
+
+def read_sources(sources, sheets=(FIRST_SHEET,), tag_parse=False, schema=None, columns=None, engine=None, compact=False):
+    """把多个来源（Excel 文件、ZIP 成员）的多个 Sheet 并行解析，对齐列后合并为一张表。
+
+    - 每个「来源 × Sheet」单独缓存（进程内 + 旁路文件），只有未命中的才会解析；
+    - 未命中的任务提交到共享进程池并行解析；同一 ZIP 只打开一次，按顺序逐个解压成员，
+      解压完一个立即提交，解压与解析重叠进行；已缓存的成员不解压；
+    - 合并多于一个表时，追加来源列 SOURCE_COL / SOURCE_SHEET_COL，列按 schema 对齐（见 align_frames）；
+    - 来源中没有指定 Sheet 名的任务被跳过，(来源, Sheet) 名单记录在 ``attrs["skipped"]``。
+    合并结果按「全部来源摘要 + Sheet 列表 + 解析方式 + schema」整体缓存，columns / compact 只作用于合并结果。
+    """
+    digests = {}
+    for src in sources:
+        if id(src["data"]) not in digests:
+            digests[id(src["data"])] = content_hash(src["data"])
+    jobs = [
+        (src, sheet, dataset_key(digests[id(src["data"])], sheet, tag_parse, src["member"]))
+        for src in sources
+        for sheet in sheets
+    ]
+    key = key_hash(tuple(k for _, _, k in jobs), tuple(schema or ()), "sources")
+
+    def parse_all():
+        frames = {}
+        misses = []
+        for src, sheet, jkey in jobs:
+            df = _lookup(jkey)
+            if df is None:
+                misses.append((src, sheet, jkey))
+            else:
+                frames[jkey] = df
+        parsed = _parse_jobs(misses, tag_parse, engine)
+        for src, sheet, jkey in misses:
+            df = parsed[jkey]
+            frames[jkey] = df
+            if df is not None:
+                _write_sidecar(jkey, df)
+                _store(jkey, df, df.columns)
+
+        kept = [(src, jkey) for src, _, jkey in jobs if frames[jkey] is not None]
+        if len(kept) > 1:
+            parts = [
+                frames[jkey].assign(**{SOURCE_COL: src["label"], SOURCE_SHEET_COL: frames[jkey].attrs.get("sheet_name")})
+                for src, jkey in kept
+            ]
+        else:
+            parts = [frames[jkey] for _, jkey in kept]
+        merged = align_frames(parts, schema)
+        merged.attrs["skipped"] = [(src["label"], sheet) for src, sheet, jkey in jobs if frames[jkey] is None]
+        return merged
+
+    return _load(key, parse_all, columns, compact)
+
+
+def _parse_jobs(misses, tag_parse, engine=None):
+    """解析未命中缓存的任务：只有一个时在当前进程解析，多个时提交到进程池。返回 {键: DataFrame 或 None}。"""
+    if not misses:
+        return {}
+    archives = {}
+    try:
+        if len(misses) == 1:
+            src, sheet, jkey = misses[0]
+            return {jkey: _parse_member(_source_bytes(src, archives), _source_name(src), sheet, tag_parse, engine)}
+        pool = workers.process_pool()
+        futures = {}
+        for src, sheet, jkey in misses:
+            data = _source_bytes(src, archives)
+            futures[pool.submit(_parse_member, data, _source_name(src), sheet, tag_parse, engine)] = jkey
+        return {futures[f]: f.result() for f in as_completed(futures)}
+    except BrokenProcessPool:
+        workers.reset_process_pool()
+        raise
+    finally:
+        for z in archives.values():
+            z.close()
+
+
+def _source_name(src):
+    return src["member"] or src["label"]
+
+
+def _source_bytes(src, archives):
+    """取来源的 Excel 字节；ZIP 成员在这里才解压，同一个 ZIP 在 archives 中只打开一次。"""
+    if src["member"] is None:
+        return src["data"]
+    z = archives.get(id(src["data"]))
+    if z is None:
+        z = archives[id(src["data"])] = zipfile.ZipFile(io.BytesIO(src["data"]), "r")
+    return z.read(src["member"], pwd=src["pwd"])
+
+
+def clear_cache(sidecars=False):
+    """清空进程内解析缓存；sidecars=True 时一并删除磁盘旁路文件。"""
+    _FRAME_CACHE.clear()
+    _SHEET_CACHE.clear()
+    _FILE_DIGESTS.clear()
+    if sidecars and os.path.isdir(SIDECAR_DIR):
+        for name in os.listdir(SIDECAR_DIR):
+            os.remove(os.path.join(SIDECAR_DIR, name))
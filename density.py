@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""大数据量散点图的密度模式：在服务端把点按二维网格分箱聚合，只把网格发给浏览器。
+
+- 分箱与统计全部用 numpy 向量化完成（一次 bincount 计算每格点数，加权 bincount 计算各列均值）；
+- 每个格子的悬停信息包括：点数、X/Y 区间、X/Y 均值，以及可选附加列（如气泡大小列、展示量）的均值/合计；
+- 空格子不着色，颜色按点数（对数刻度，避免少数密集格子把其余格子压成同一种颜色）。
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+# 点数超过该值时，沙盒散点图默认切换为密度模式
+DENSITY_THRESHOLD = 5000
+# 默认每个轴的分箱数
+DENSITY_BINS = 60
+
+
+def _edges(values, bins):
+    lo, hi = float(values.min()), float(values.max())
+    if hi <= lo:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def _bin_index(values, edges):
+    bins = len(edges) - 1
+    idx = ((values - edges[0]) / (edges[-1] - edges[0]) * bins).astype(np.int64)
+    return np.clip(idx, 0, bins - 1)
+
+
+def density_grid(x, y, bins=DENSITY_BINS, means=None, sums=None):
+    """二维分箱统计。
+
+    x、y 为等长数值数组（缺失值所在行会被去掉，须至少剩一行）；means / sums 为 {名称: 数组}，按格子求均值 / 合计。
+    返回 {"x_edges", "y_edges", "count", "x_mean", "y_mean", "means", "sums", "n"}，
+    网格形状均为 (y 分箱数, x 分箱数)，与 go.Heatmap 的 z 一致；均值只按该列有值的点计算，格子中没有有效值时为 NaN。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    x_edges, y_edges = _edges(x, bins), _edges(y, bins)
+    flat = _bin_index(y, y_edges) * bins + _bin_index(x, x_edges)
+    shape = (bins, bins)
+    count = np.bincount(flat, minlength=bins * bins)
+
+    def _sum(values):
+        # values 已与 x、y 对齐（去掉了缺失行）；附加列中的缺失值按 0 计入合计
+        return np.bincount(flat, weights=np.nan_to_num(values), minlength=bins * bins)
+
+    def _mean(values):
+        # 只用该列有值的点：分子、分母都按非缺失点计，整格都缺失时为 NaN
+        valid = ~np.isnan(values)
+        total = np.bincount(flat[valid], weights=values[valid], minlength=bins * bins)
+        n_valid = np.bincount(flat[valid], minlength=bins * bins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (total / n_valid).reshape(shape)
+
+    extra = lambda values: np.asarray(values, dtype=np.float64)[ok]
+    return {
+        "x_edges": x_edges, "y_edges": y_edges, "n": int(len(x)),
+        "count": count.reshape(shape),
+        "x_mean": _mean(x), "y_mean": _mean(y),
+        "means": {name: _mean(extra(v)) for name, v in (means or {}).items()},
+        "sums": {name: _sum(extra(v)).reshape(shape) for name, v in (sums or {}).items()},
+    }
+
+
+def density_figure(df, x, y, bins=DENSITY_BINS, mean_cols=(), sum_cols=(), labels=None, height=600):
+    """由 df 的 x、y 列生成密度热力图（go.Heatmap），悬停显示每个格子的汇总信息。
+
+    mean_cols / sum_cols 为需要在悬停中展示均值 / 合计的列；labels 为列名到中文名的映射。
+    """
+    labels = labels or {}
+    label = lambda c: labels.get(c, c)
+    mean_cols = [c for c in dict.fromkeys(mean_cols) if c in df.columns and c not in (x, y)]
+    sum_cols = [c for c in dict.fromkeys(sum_cols) if c in df.columns]
+    grid = density_grid(
+        df[x].to_numpy(dtype=np.float64, na_value=np.nan),
+        df[y].to_numpy(dtype=np.float64, na_value=np.nan),
+        bins,
+        means={c: df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in mean_cols},
+        sums={c: df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in sum_cols},
+    )
+    count = grid["count"].astype(np.float64)
+    empty = count == 0
+    x_edges, y_edges = grid["x_edges"], grid["y_edges"]
+    ny, nx = count.shape
+
+    # customdata 每格：[点数, X 下限, X 上限, Y 下限, Y 上限, X 均值, Y 均值, 附加列...]
+    layers = [
+        count,
+        np.broadcast_to(x_edges[:-1], (ny, nx)), np.broadcast_to(x_edges[1:], (ny, nx)),
+        np.broadcast_to(y_edges[:-1, None], (ny, nx)), np.broadcast_to(y_edges[1:, None], (ny, nx)),
+        grid["x_mean"], grid["y_mean"],
+        *grid["means"].values(), *grid["sums"].values(),
+    ]
+    customdata = np.stack(layers, axis=-1)
+    hover = [
+        "点数：%{customdata[0]:,}",
+        f"{label(x)}：%{{customdata[1]:.4g}} ~ %{{customdata[2]:.4g}}（均值 %{{customdata[5]:.4g}}）",
+        f"{label(y)}：%{{customdata[3]:.4g}} ~ %{{customdata[4]:.4g}}（均值 %{{customdata[6]:.4g}}）",
+    ]
+    offset = 7
+    for i, c in enumerate(mean_cols):
+        hover.append(f"{label(c)} 均值：%{{customdata[{offset + i}]:.4g}}")
+    offset += len(mean_cols)
+    for i, c in enumerate(sum_cols):
+        hover.append(f"{label(c)} 合计：%{{customdata[{offset + i}]:,.0f}}")
+
+    z = np.where(empty, np.nan, np.log10(np.where(empty, 1, count)))
+    max_log = float(np.nanmax(z)) if (~empty).any() else 0.0
+    tickvals = np.arange(0, int(np.floor(max_log)) + 1)
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=z,
+        customdata=customdata,
+        hovertemplate="<br>".join(hover) + "<extra></extra>",
+        colorscale="Viridis",
+        colorbar=dict(title="点数", tickvals=tickvals, ticktext=[f"{10 ** int(t):,}" for t in tickvals]),
+        hoverongaps=False,
+    ))
+    fig.update_layout(
+        title=f"密度图：{label(x)} vs {label(y)}（共 {grid['n']:,} 个点，{bins}×{bins} 分箱）",
+        xaxis_title=label(x), yaxis_title=label(y),
+        height=height, template="seaborn",
+    )
+    return fig
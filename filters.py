@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""展示量阈值筛选：按 Impressions 排好序的位置索引 + 按阈值缓存的筛选结果。
+
+筛选条件与看板一致：Impressions > 最小阈值（最大阈值有效时再加 Impressions < 最大阈值）且 CTA clicked != 0。
+每份数据只建一次索引（CTA clicked != 0 的行按 Impressions 排序），之后调整阈值只需两次二分查找
+加一次切片，不再对全表做布尔扫描；筛选结果及其派生表按阈值缓存在进程内。
+另可按所选指标排除极值（见 outliers.py），排除规则与阈值一起记入筛选条件。
+"""
+import numpy as np
+
+import outliers
+from cache_utils import LRUCache, key_hash
+
+# 数据指纹 -> ThresholdIndex
+_INDEXES = LRUCache(max_bytes=256 * 1024 * 1024, ttl=3600)
+# 数据指纹 + 列 + 阈值（+ 派生表名）-> 筛选结果
+_FRAMES = LRUCache(max_bytes=512 * 1024 * 1024, ttl=3600)
+
+
+class ThresholdIndex:
+    """CTA clicked != 0 且 Impressions 非空的行，按 Impressions 升序排列的位置索引。"""
+
+    def __init__(self, df):
+        imp = df["Impressions"].to_numpy(dtype=np.float64, na_value=np.nan)
+        cta = df["CTA clicked"].to_numpy(dtype=np.float64, na_value=np.nan)
+        eligible = np.flatnonzero((cta != 0) & ~np.isnan(imp))
+        self.n_rows = len(imp)
+        self.order = eligible[np.argsort(imp[eligible], kind="stable")]
+        self.sorted_impressions = imp[self.order]
+
+    @property
+    def nbytes(self):
+        return int(self.order.nbytes + self.sorted_impressions.nbytes)
+
+    def positions(self, min_imp, max_imp=-1):
+        """满足阈值的行位置（按原表行顺序）。max_imp 不大于 0 或不大于 min_imp 时不设上限。"""
+        lo = np.searchsorted(self.sorted_impressions, min_imp, side="right")
+        if max_imp > 0 and max_imp > min_imp:
+            hi = np.searchsorted(self.sorted_impressions, max_imp, side="left")
+        else:
+            hi = len(self.order)
+        selected = self.order[lo:max(lo, hi)]
+        if len(selected) * 16 < self.n_rows:
+            return np.sort(selected)
+        # 选中行较多时用位图还原原行顺序（线性时间，比排序快）
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[selected] = True
+        return np.flatnonzero(mask)
+
+
+def threshold_index(df):
+    """取（或新建）数据的阈值索引；按 ``df.attrs["dataset_key"]`` 缓存，没有指纹时不缓存。"""
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return ThresholdIndex(df)
+    index = _INDEXES.get(data_key)
+    if index is None:
+        index = ThresholdIndex(df)
+        _INDEXES.put(data_key, index, nbytes=index.nbytes)
+    return index
+
+
+def effective_rows(df, min_imp, max_imp=-1, exclude=None):
+    """按展示量阈值与 CTA clicked != 0 筛选后的表（与布尔掩码筛选结果相同，保持原行顺序与索引）。
+
+    exclude 为极值排除规则 (指标列元组, "iqr"/"mad", k)，为 None 时不排除；极值界限在整份数据上计算。
+    结果按「数据指纹 + 列 + 阈值 + 排除规则」缓存，筛选条件记在 ``attrs["filter_key"]``，供派生表缓存使用。
+    """
+    filter_key = (min_imp, max_imp) if exclude is None else (min_imp, max_imp, exclude)
+    data_key = df.attrs.get("dataset_key")
+    key = key_hash(data_key, tuple(df.columns), filter_key)
+
+    def compute():
+        positions = threshold_index(df).positions(min_imp, max_imp)
+        if exclude is not None:
+            positions = positions[~outliers.outlier_mask(df, *exclude)[positions]]
+        out = df.iloc[positions]
+        out.attrs["filter_key"] = filter_key
+        return out
+
+    if data_key is None:
+        return compute()
+    return _FRAMES.get_or_compute(key, compute)
+
+
+def exclude_outliers(df, exclude):
+    """缺少展示量 / 点击列、不做阈值筛选时，只按极值排除规则筛选全部行（缓存方式同 effective_rows）。"""
+    filter_key = ("all", exclude)
+    data_key = df.attrs.get("dataset_key")
+
+    def compute():
+        out = df.iloc[np.flatnonzero(~outliers.outlier_mask(df, *exclude))]
+        out.attrs["filter_key"] = filter_key
+        return out
+
+    if data_key is None:
+        return compute()
+    return _FRAMES.get_or_compute(key_hash(data_key, tuple(df.columns), filter_key), compute)
+
+
+def derive(df, name, compute):
+    """由筛选结果派生的表（如「有明确游戏结果」的素材），按「筛选结果 + 名称」缓存。
+
+    df 须为 effective_rows() 的返回值；compute(df) 计算派生表，调用方不要原地修改返回结果。
+    """
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None or "filter_key" not in df.attrs:
+        return compute(df)
+    key = key_hash(data_key, tuple(df.columns), df.attrs["filter_key"], name)
+    return _FRAMES.get_or_compute(key, lambda: compute(df))
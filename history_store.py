@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""历史快照库：把每次导出的数据追加到本地 DuckDB 单文件库，按「素材（HTML）+ 快照日期」存储。
+
+    python history_store.py ingest tag.xlsx sksx.xlsx --date 2026-10-18   # 写入快照（同日同素材覆盖）
+    python history_store.py list                                        # 列出已有快照
+
+- 库文件默认在仓库根目录的 history.duckdb（无需服务端）；新导出出现新列时自动加列；
+- 视图 latest_snapshot：每个素材最近一次快照；daily_summary：每个快照日的素材数与计数类指标合计；
+- 看板读取时只查询一个快照视图（每个素材一行）并只取页面需要的列，内存与导出累积了多少天无关；
+  查询结果按「库文件修改时间 + 快照日 + 列」缓存，库未更新时不重复查询。
+需安装 duckdb（见 requirements.txt），未安装时看板不显示历史库选项。
+"""
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+import data_loader
+from cache_utils import LRUCache, key_hash
+
+try:
+    import duckdb  # 可选：历史快照库依赖 duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.duckdb")
+TABLE = "snapshots"
+# 快照日期列（查询结果中为 YYYY-MM-DD 字符串）
+SNAPSHOT_COL = "Snapshot date"
+# daily_summary 中按日合计的计数类指标（库中存在的才合计）
+SUM_COLS = [
+    "Impressions", "Spend", "CTA clicked", "Redirect count",
+    "Challenge started", "Challenge solved", "Challenge failed",
+]
+
+# 快照查询结果：库文件状态 + 快照日 + 列 -> DataFrame
+_QUERIES = LRUCache(max_bytes=512 * 1024 * 1024, ttl=3600)
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _connect(path, read_only):
+    if not HAS_DUCKDB:
+        raise RuntimeError("未安装 duckdb，无法使用历史快照库（pip install duckdb）")
+    return duckdb.connect(path, read_only=read_only)
+
+
+def exists(path=HISTORY_DB):
+    """库文件是否存在（且可用）。"""
+    return HAS_DUCKDB and os.path.exists(path)
+
+
+def _stamp(path):
+    st_ = os.stat(path)
+    return st_.st_mtime_ns, st_.st_size
+
+
+def _table_columns(con):
+    rows = con.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+        [TABLE],
+    ).fetchall()
+    return dict(rows)
+
+
+def _sql_type(series):
+    if is_bool_dtype(series):
+        return "BOOLEAN"
+    if is_numeric_dtype(series):
+        return "DOUBLE"
+    return "VARCHAR"
+
+
+def _conform(df, types):
+    """按库中的列类型整理各列（数值列无法解析的记为缺失，文本列转为字符串）。"""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        kind = types.get(col, _sql_type(s))
+        if kind == "DOUBLE":
+            out[col] = pd.to_numeric(s, errors="coerce").astype(np.float64)
+        elif kind == "BOOLEAN":
+            out[col] = s.astype("boolean")
+        else:
+            out[col] = s.astype("string").astype(object).where(s.notna(), None)
+    return pd.DataFrame(out, index=df.index)
+
+
+def _refresh_views(con, types):
+    con.execute(
+        f"CREATE OR REPLACE VIEW latest_snapshot AS SELECT * FROM {TABLE} "
+        f"QUALIFY row_number() OVER (PARTITION BY {_quote('HTML')} ORDER BY {_quote(SNAPSHOT_COL)} DESC) = 1"
+    )
+    sums = "".join(f", sum({_quote(c)}) AS {_quote(c)}" for c in SUM_COLS if types.get(c) == "DOUBLE")
+    con.execute(
+        f"CREATE OR REPLACE VIEW daily_summary AS SELECT {_quote(SNAPSHOT_COL)}, count(*) AS {_quote('Creatives')}{sums} "
+        f"FROM {TABLE} GROUP BY 1 ORDER BY 1"
+    )
+
+
+def ingest(df, snapshot_date, source=None, path=HISTORY_DB):
+    """把一份导出写入库中的 snapshot_date 快照，返回写入行数。
+
+    同一快照日里已有的素材会被覆盖（重复导入同一天的数据不会累加）；同一份导出中同名素材只保留
+    展示量最大的一行。source 为来源文件名，写入「来源文件」列（导出本身已带该列时不覆盖）。
+    """
+    if "HTML" not in df.columns:
+        raise ValueError("数据中没有 HTML 列，无法按素材写入历史库")
+    snapshot_date = pd.Timestamp(snapshot_date).date()
+    df = df[df["HTML"].notna()]
+    if "Impressions" in df.columns:
+        df = df.sort_values("Impressions", ascending=False, kind="stable")
+    df = df.drop_duplicates(subset="HTML")
+    if source is not None and data_loader.SOURCE_COL not in df.columns:
+        df = df.assign(**{data_loader.SOURCE_COL: source})
+
+    with _connect(path, read_only=False) as con:
+        types = _table_columns(con)
+        if not types:
+            con.execute(f"CREATE TABLE {TABLE} ({_quote(SNAPSHOT_COL)} DATE, {_quote('HTML')} VARCHAR)")
+            types = {SNAPSHOT_COL: "DATE", "HTML": "VARCHAR"}
+        # 新导出出现的新列：按列类型加到表上
+        for col in df.columns:
+            if col not in types:
+                kind = _sql_type(df[col])
+                con.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(col)} {kind}")
+                types[col] = kind
+        frame = _conform(df, types)
+        frame.insert(0, SNAPSHOT_COL, snapshot_date)
+        con.register("incoming", frame)
+        con.execute("BEGIN TRANSACTION")
+        con.execute(
+            f"DELETE FROM {TABLE} WHERE {_quote(SNAPSHOT_COL)} = ? AND {_quote('HTML')} IN (SELECT {_quote('HTML')} FROM incoming)",
+            [snapshot_date],
+        )
+        con.execute(f"INSERT INTO {TABLE} BY NAME SELECT * FROM incoming")
+        con.execute("COMMIT")
+        con.unregister("incoming")
+        _refresh_views(con, types)
+    return len(frame)
+
+
+def list_snapshots(path=HISTORY_DB):
+    """按快照日汇总：每日素材数与计数类指标合计（daily_summary 视图）。"""
+    with _connect(path, read_only=True) as con:
+        out = con.execute("SELECT * FROM daily_summary").df()
+    out[SNAPSHOT_COL] = pd.to_datetime(out[SNAPSHOT_COL]).dt.strftime("%Y-%m-%d")
+    return out
+
+
+def load_snapshot(as_of=None, columns=None, path=HISTORY_DB, compact=True, exact=False):
+    """每个素材截至 as_of（含当天；None 表示全部快照）的最近一次快照，每个素材一行。
+
+    exact=True 时只取 as_of 当天写入的快照（即那一天的导出本身，当天没有的素材不会从更早的快照补上），
+    快照对比使用这种方式。
+
+    columns 为需要的列（不存在的忽略，HTML 与快照日期列总会带上）；compact=True 时压成紧凑类型。
+    返回的表在 ``attrs["dataset_key"]`` 中带有「库文件状态 + 快照日」指纹，可供下游缓存使用。
+    """
+    as_of = None if as_of is None else pd.Timestamp(as_of).date()
+    stamp = _stamp(path)
+    if exact and as_of is None:
+        raise ValueError("exact=True 时需要指定快照日期")
+    data_key = key_hash("history", os.path.abspath(path), stamp, str(as_of), exact)
+    wanted = None if columns is None else tuple(columns)
+
+    def query():
+        with _connect(path, read_only=True) as con:
+            all_columns = [c for c in _table_columns(con) if c != SNAPSHOT_COL]
+            cols = all_columns if wanted is None else [c for c in all_columns if c in wanted or c == "HTML"]
+            select = ", ".join(_quote(c) for c in [SNAPSHOT_COL] + cols)
+            if as_of is None:
+                df = con.execute(f"SELECT {select} FROM latest_snapshot").df()
+            elif exact:
+                df = con.execute(f"SELECT {select} FROM {TABLE} WHERE {_quote(SNAPSHOT_COL)} = ?", [as_of]).df()
+            else:
+                df = con.execute(
+                    f"SELECT {select} FROM {TABLE} WHERE {_quote(SNAPSHOT_COL)} <= ? "
+                    f"QUALIFY row_number() OVER (PARTITION BY {_quote('HTML')} ORDER BY {_quote(SNAPSHOT_COL)} DESC) = 1",
+                    [as_of],
+                ).df()
+        df[SNAPSHOT_COL] = pd.to_datetime(df[SNAPSHOT_COL]).dt.strftime("%Y-%m-%d")
+        df = data_loader.compact_dtypes(df) if compact else df
+        df.attrs["dataset_key"] = data_key
+        df.attrs["all_columns"] = [SNAPSHOT_COL] + all_columns
+        return df
+
+    return _QUERIES.get_or_compute(key_hash(data_key, wanted, compact), query)
+
+
+def _ingest_files(files, snapshot_date, path):
+    for name in files:
+        if name in data_loader.DATASETS:
+            df = data_loader.load_dataset(name)
+        else:
+            df = data_loader.read_local(name)
+        day = snapshot_date or datetime.date.fromtimestamp(os.path.getmtime(name))
+        n = ingest(df, day, source=os.path.basename(name), path=path)
+        print(f"{name}: 写入快照 {day}，{n} 个素材")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="历史快照库（DuckDB 单文件）")
+    parser.add_argument("--db", default=HISTORY_DB, help="库文件路径（默认仓库根目录 history.duckdb）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="把导出文件写入快照")
+    p_ingest.add_argument("files", nargs="+", help="Excel 文件（已登记的数据表按 data_loader.DATASETS 的方式解析）")
+    p_ingest.add_argument("--date", default=None, help="快照日期 YYYY-MM-DD（默认取文件修改日期）")
+    sub.add_parser("list", help="列出已有快照")
+    args = parser.parse_args(argv)
+
+    if not HAS_DUCKDB:
+        parser.error("未安装 duckdb（pip install duckdb）")
+    if args.command == "ingest":
+        _ingest_files(args.files, args.date and pd.Timestamp(args.date).date(), args.db)
+    elif not os.path.exists(args.db):
+        print("历史库为空")
+    else:
+        print(list_snapshots(args.db).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""看板排行榜：一次性计算多个「按某指标取前 N 名」的榜单。
+
+- 每个榜单用 argpartition 做部分选择（O(n)），只对选出的前 k 名排序，不再整表排序；
+- 同一来源表上的多个榜单共用一次取列，派生指标（如未完成率）按列向量化计算；
+- 排序规则与 sort_values(ascending=False).head(k) 一致：缺失值排在最后，并列时按原行顺序；
+- 榜单结果按「来源表（数据指纹 + 筛选条件）+ 榜单配置」逐个缓存，新增自定义榜单时只计算新榜单。
+"""
+import numpy as np
+
+from cache_utils import LRUCache, key_hash
+
+# 派生指标：列名 -> 由来源表计算该列的函数（结果按列向量化计算，不修改来源表）
+DERIVED_METRICS = {
+    "Incomplete Count": lambda d: d["Challenge started"] - d["Challenge solved"] - d["Challenge failed"],
+    "Incomplete Rate": lambda d: (d["Challenge started"] - d["Challenge solved"] - d["Challenge failed"]) / d["Challenge started"],
+}
+
+# 看板内置榜单：名称 -> {来源表, 排序指标, 取前几名, 是否升序, 附加的派生列}
+DASHBOARD_BOARDS = {
+    "top10_impressions": {"source": "effective", "metric": "Impressions", "k": 10},
+    "top10_incomplete": {
+        "source": "have_result", "metric": "Incomplete Rate", "k": 10,
+        "extra": ["Incomplete Count", "Incomplete Rate"],
+    },
+    "top5_hard": {"source": "have_result", "metric": "Challenge failed rate", "k": 5},
+    "top5_easy": {"source": "have_result", "metric": "Challenge solved rate", "k": 5},
+    "top5_error": {"source": "effective", "metric": "Runtime error rate", "k": 5},
+}
+
+# 榜单结果：来源表 + 榜单配置 -> 前 k 名子表
+_BOARDS = LRUCache(max_bytes=64 * 1024 * 1024, ttl=3600)
+
+
+def top_k_positions(values, k, ascending=False):
+    """前 k 名的行位置（按名次排列）。
+
+    先用 argpartition 在 O(n) 内选出候选，再只对候选排序；缺失值排在最后，并列时行位置小的在前。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    key = values if ascending else -values
+    valid = np.flatnonzero(~np.isnan(key))
+    if k <= 0:
+        return valid[:0]
+    if len(valid) > k:
+        kth = np.partition(key[valid], k - 1)[k - 1]
+        better = valid[key[valid] < kth]
+        tied = valid[key[valid] == kth][: k - len(better)]
+        chosen = np.concatenate([better, tied])
+    else:
+        chosen = valid
+    chosen = chosen[np.lexsort((chosen, key[chosen]))]
+    if len(chosen) < k:
+        missing = np.flatnonzero(np.isnan(key))[: k - len(chosen)]
+        chosen = np.concatenate([chosen, missing])
+    return chosen
+
+
+def _metric(df, name):
+    if name in df.columns:
+        return df[name]
+    return DERIVED_METRICS[name](df)
+
+
+def _board_key(df, source, spec):
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return None
+    return key_hash(data_key, df.attrs.get("filter_key"), tuple(df.columns), source, sorted(spec.items()))
+
+
+def compute_boards(sources, specs):
+    """按配置计算多个榜单，返回 {榜单名: 前 k 名子表}。
+
+    sources 为 {来源名: DataFrame}；specs 为 {榜单名: {"source", "metric", "k", "ascending", "extra"}}。
+    排序指标或派生列缺失的榜单返回空表。已缓存的榜单直接返回，其余按来源表分组一次性计算。
+    """
+    out, todo = {}, {}
+    for name, spec in specs.items():
+        df = sources[spec["source"]]
+        key = _board_key(df, spec["source"], spec)
+        cached = _BOARDS.get(key) if key is not None else None
+        if cached is not None:
+            out[name] = cached
+        else:
+            todo.setdefault(spec["source"], []).append((name, spec, key))
+
+    for source, boards in todo.items():
+        df = sources[source]
+        # 同一来源表上的各榜单共用一次取列 / 派生列计算
+        columns = {}
+        for name, spec, key in boards:
+            for col in [spec["metric"], *spec.get("extra", [])]:
+                if col not in columns:
+                    try:
+                        columns[col] = _metric(df, col)
+                    except KeyError:
+                        columns[col] = None
+        for name, spec, key in boards:
+            needed = [columns[c] for c in [spec["metric"], *spec.get("extra", [])]]
+            if any(c is None for c in needed):
+                board = df.iloc[:0]
+            else:
+                pos = top_k_positions(columns[spec["metric"]], spec["k"], spec.get("ascending", False))
+                board = df.iloc[pos]
+                extra = {c: columns[c].iloc[pos] for c in spec.get("extra", []) if c not in df.columns}
+                if extra:
+                    board = board.assign(**extra)
+            if key is not None:
+                _BOARDS.put(key, board)
+            out[name] = board
+    return out
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""极值排除：按一个或多个指标，用 IQR 或 MAD 判定极值素材。
+
+- IQR：超出 [Q1 - k×IQR, Q3 + k×IQR] 视为极值（与 analyze_tag_no_outliers.py 一致，默认 k=1.5）；
+- MAD：超出 [中位数 - k×MAD, 中位数 + k×MAD] 视为极值，MAD 已乘 1.4826 换算到正态标准差尺度（默认 k=3）；
+- 四分位数、中位数与 MAD 在整份数据上计算，按「数据指纹 + 列」缓存，调整 k 或切换方法时不重新计算；
+- 任一所选指标为极值即排除该行；指标缺失的行不视为极值；IQR / MAD 为 0 的指标不做排除。
+"""
+import numpy as np
+
+from cache_utils import LRUCache, key_hash
+
+METHODS = {"iqr": "IQR（四分位距）", "mad": "MAD（中位数绝对偏差）"}
+DEFAULT_K = {"iqr": 1.5, "mad": 3.0}
+# MAD 换算为正态分布标准差的系数
+MAD_SCALE = 1.4826
+
+# 数据指纹 + 列 -> RobustStats
+_STATS = LRUCache(max_bytes=16 * 1024 * 1024, ttl=3600)
+# 数据指纹 + 列 + 排除规则 -> 极值掩码
+_MASKS = LRUCache(max_bytes=128 * 1024 * 1024, ttl=3600)
+
+
+class RobustStats:
+    """一列的稳健统计量：Q1、Q3、中位数与（已换算的）MAD。"""
+
+    def __init__(self, values):
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.q1, self.median, self.q3 = np.quantile(values, [0.25, 0.5, 0.75])
+            self.mad = float(np.median(np.abs(values - self.median))) * MAD_SCALE
+        else:
+            self.q1 = self.median = self.q3 = self.mad = np.nan
+
+    def bounds(self, method, k):
+        """(下界, 上界)；离散度为 0 或没有数据时返回 None（不排除）。"""
+        if method == "iqr":
+            iqr = self.q3 - self.q1
+            if not iqr > 0:
+                return None
+            return self.q1 - k * iqr, self.q3 + k * iqr
+        if not self.mad > 0:
+            return None
+        return self.median - k * self.mad, self.median + k * self.mad
+
+
+def _values(df, col):
+    return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def robust_stats(df, col):
+    """df 某列的稳健统计量；按 ``attrs["dataset_key"]`` + 列缓存，没有指纹时不缓存。"""
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return RobustStats(_values(df, col))
+    return _STATS.get_or_compute(key_hash(data_key, col), lambda: RobustStats(_values(df, col)))
+
+
+def outlier_mask(df, cols, method="iqr", k=None):
+    """与 df 行对应的布尔数组：任一所选指标超出界限的行为 True。不存在的列忽略。"""
+    k = DEFAULT_K[method] if k is None else k
+    cols = [c for c in cols if c in df.columns]
+
+    def compute():
+        mask = np.zeros(len(df), dtype=bool)
+        for col in cols:
+            bounds = robust_stats(df, col).bounds(method, k)
+            if bounds is None:
+                continue
+            values = _values(df, col)
+            with np.errstate(invalid="ignore"):
+                mask |= (values < bounds[0]) | (values > bounds[1])
+        return mask
+
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return compute()
+    key = key_hash(data_key, len(df), tuple(cols), method, k)
+    mask = _MASKS.get(key)
+    if mask is None:
+        mask = compute()
+        _MASKS.put(key, mask, nbytes=mask.nbytes)
+    return mask
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""批量分析流水线：把各分析脚本组织成有依赖关系的阶段，一条命令完成夜间刷新。
+
+    python pipeline.py                 # 运行全部阶段（输入未变的阶段自动跳过）
+    python pipeline.py tag_compare     # 只运行指定阶段（及其上游）
+    python pipeline.py --force         # 忽略记录，全部重跑
+    python pipeline.py --dry-run       # 只列出哪些阶段需要重跑
+    python pipeline.py --list          # 列出阶段及依赖
+
+- 每个阶段在独立子进程中运行（与手动执行脚本完全一致），互不依赖的阶段并行执行；
+- 阶段指纹 = 脚本及其导入的本地模块 + 读取的数据文件 + 参数 + 上游阶段指纹 的内容哈希；
+  指纹与上次成功运行时相同且输出文件都在时跳过该阶段；
+- 运行记录写在 .cache/pipeline/state.json，各阶段输出日志写在 .cache/pipeline/logs/。
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache_utils import content_hash, key_hash
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.path.join(ROOT, ".cache", "pipeline")
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+LOG_DIR = os.path.join(STATE_DIR, "logs")
+
+# 阶段：名称 -> {说明, 脚本或代码, 依赖的本地模块, 读取的数据文件, 输出文件, 上游阶段, 参数}
+STAGES = {
+    "load": {
+        "desc": "解析 Excel 并写 Parquet 旁路文件，后续阶段直接读列式缓存",
+        "code": "import data_loader\nfor name in ('tag.xlsx', 'sksx.xlsx'):\n    data_loader.load_dataset(name)\n",
+        "modules": ["data_loader.py"],
+        "data": ["tag.xlsx", "sksx.xlsx"],
+        "outputs": [],
+        "deps": [],
+    },
+    "correlations": {
+        "desc": "sksx.xlsx 相关性分析",
+        "script": "correlation_analysis.py",
+        "data": ["sksx.xlsx"],
+        "outputs": ["correlation_pearson.csv", "correlation_spearman.csv"],
+        "deps": ["load"],
+    },
+    "tag_correlations": {
+        "desc": "tag.xlsx 概览与相关性（含标签列）",
+        "script": "analyze_tag.py",
+        "data": ["tag.xlsx"],
+        "outputs": ["tag_correlation_pearson.csv", "tag_correlation_spearman.csv", "tag_分析结论.md"],
+        "deps": ["load"],
+    },
+    "outliers": {
+        "desc": "tag.xlsx 排除极值后的概览、标签对比与相关性报告",
+        "script": "analyze_tag_no_outliers.py",
+        "data": ["tag.xlsx"],
+        "outputs": [
+            "tag_no_outliers_correlation_pearson.csv", "tag_no_outliers_correlation_spearman.csv",
+            "数据分析报告_排除极值.md",
+        ],
+        "deps": ["load"],
+    },
+    "tag_compare": {
+        "desc": "tag.xlsx 标签分组对比",
+        "script": "tag_label_compare.py",
+        "data": ["tag.xlsx"],
+        "outputs": ["tag_标签对比_相对整体比值.csv", "tag_标签对比_分组均值.csv", "tag_标签突出结论.md"],
+        "deps": ["load"],
+    },
+    "predict": {
+        "desc": "tag.xlsx 回归与二分类预测",
+        "script": "predict_analysis.py",
+        "data": ["tag.xlsx"],
+        "outputs": ["predict_分析结果.md"],
+        "deps": ["load"],
+    },
+}
+
+
+def local_modules(path, seen=None):
+    """脚本及其（递归）导入的、位于仓库根目录下的本地模块文件名。"""
+    seen = set() if seen is None else seen
+    name = os.path.basename(path)
+    if name in seen or not os.path.exists(os.path.join(ROOT, name)):
+        return seen
+    seen.add(name)
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            mods = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            mods = [node.module]
+        else:
+            continue
+        for mod in mods:
+            local_modules(mod.split(".")[0] + ".py", seen)
+    return seen
+
+
+def _file_hash(name):
+    path = os.path.join(ROOT, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+
+def stage_fingerprint(name, upstream):
+    """阶段指纹：代码、数据、参数与上游指纹的哈希（upstream 为 {上游阶段: 指纹}）。"""
+    spec = STAGES[name]
+    code = set()
+    for module in ([spec["script"]] if "script" in spec else []) + spec.get("modules", []):
+        local_modules(module, code)
+    return key_hash(
+        name,
+        spec.get("code"), spec.get("args", []),
+        sorted((m, _file_hash(m)) for m in code),
+        sorted((d, _file_hash(d)) for d in spec.get("data", [])),
+        sorted((d, upstream[d]) for d in spec["deps"]),
+    )
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+
+def with_upstream(names):
+    """所选阶段加上其全部上游，按 STAGES 中的顺序（即拓扑序）返回。"""
+    wanted = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(STAGES[name]["deps"])
+    return [n for n in STAGES if n in wanted]
+
+
+def run_stage(name):
+    """在子进程中运行阶段，输出写入日志文件；返回 (是否成功, 耗时秒数)。"""
+    spec = STAGES[name]
+    cmd = [sys.executable] + (["-c", spec["code"]] if "code" in spec else [spec["script"]]) + spec.get("args", [])
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.monotonic()
+    with open(os.path.join(LOG_DIR, f"{name}.log"), "w", encoding="utf-8") as log:
+        proc = subprocess.run(cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    return proc.returncode == 0, time.monotonic() - start
+
+
+def run(names=None, force=False, jobs=None, dry_run=False):
+    """运行所选阶段（默认全部），返回 {阶段: "ok" / "skipped" / "failed" / "blocked" / "pending"}。"""
+    order = with_upstream(names or list(STAGES))
+    state = load_state()
+    fingerprints, status = {}, {}
+
+    def up_to_date(name):
+        entry = state.get(name, {})
+        outputs_ok = all(os.path.exists(os.path.join(ROOT, o)) for o in STAGES[name]["outputs"])
+        return not force and entry.get("fingerprint") == fingerprints[name] and outputs_ok
+
+    # 指纹依赖上游指纹（而非上游是否重跑），按拓扑序一次算完
+    for name in order:
+        fingerprints[name] = stage_fingerprint(name, fingerprints)
+
+    if dry_run:
+        for name in order:
+            status[name] = "skipped" if up_to_date(name) else "pending"
+            print(f"{name:<18} {'最新，跳过' if status[name] == 'skipped' else '需要重跑'}")
+        return status
+
+    remaining = list(order)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or max(1, min(len(order), os.cpu_count() or 2))) as pool:
+        while remaining or running:
+            for name in list(remaining):
+                deps = STAGES[name]["deps"]
+                if any(status.get(d) in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    remaining.remove(name)
+                    print(f"[{name}] 上游失败，未运行")
+                elif all(status.get(d) in ("ok", "skipped") for d in deps):
+                    remaining.remove(name)
+                    if up_to_date(name):
+                        status[name] = "skipped"
+                        print(f"[{name}] 输入未变化，跳过")
+                    else:
+                        print(f"[{name}] 开始：{STAGES[name]['desc']}")
+                        running[pool.submit(run_stage, name)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                ok, seconds = future.result()
+                status[name] = "ok" if ok else "failed"
+                if ok:
+                    print(f"[{name}] 完成（{seconds:.1f}s）")
+                    state[name] = {"fingerprint": fingerprints[name], "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                   "seconds": round(seconds, 2)}
+                    save_state(state)
+                else:
+                    print(f"[{name}] 失败，详见 {os.path.relpath(os.path.join(LOG_DIR, name + '.log'), ROOT)}")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析流水线（输入未变化的阶段自动跳过）")
+    parser.add_argument("stages", nargs="*", help="要运行的阶段（默认全部；会自动带上上游阶段）")
+    parser.add_argument("--force", action="store_true", help="忽略运行记录，全部重跑")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="最多同时运行的阶段数")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要重跑的阶段")
+    parser.add_argument("--list", action="store_true", help="列出全部阶段及其依赖")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, spec in STAGES.items():
+            deps = "、".join(spec["deps"]) or "无"
+            print(f"{name:<18} 依赖：{deps:<8} {spec['desc']}")
+        return 0
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        parser.error(f"未知阶段：{', '.join(unknown)}（可选：{', '.join(STAGES)}）")
+    status = run(args.stages, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""沙盒柱状图的分组聚合（透视）：按一个分组列，对多个数值指标求合计 / 均值 / 中位数 / 加权均值。
+
+- 一次 groupby 完成所有指标的聚合；加权均值先按列算出 指标×权重，再与权重一起分组求和后相除；
+- 分组列中的缺失值单独成组（显示为「(缺失)」）；
+- 结果按「数据指纹 + 筛选条件 + 分组列 + 指标 + 聚合方式 + 权重列」缓存，切换图表或重跑时直接复用。
+"""
+import numpy as np
+import pandas as pd
+
+from cache_utils import LRUCache, key_hash
+
+# 聚合方式：内部名 -> 中文名
+AGGREGATIONS = {"sum": "合计", "mean": "均值", "median": "中位数", "weighted_mean": "加权均值"}
+# 每组行数列名（随聚合结果一起返回，用于悬停展示）
+COUNT_COL = "行数"
+MISSING_LABEL = "(缺失)"
+
+_PIVOTS = LRUCache(max_bytes=128 * 1024 * 1024, ttl=3600)
+
+
+def _aggregate(df, by, metrics, how, weight):
+    keys = df[by].astype(object)
+    keys = keys.where(keys.notna(), MISSING_LABEL)
+    grouped_cols = {m: pd.to_numeric(df[m], errors="coerce").astype(np.float64) for m in metrics}
+    if how == "weighted_mean":
+        w = pd.to_numeric(df[weight], errors="coerce").astype(np.float64)
+        parts = {}
+        for m, values in grouped_cols.items():
+            valid = values.notna() & w.notna()
+            parts[m] = (values * w).where(valid)
+            # 各指标只用自身非空的行的权重作分母
+            parts[f"__w_{m}"] = w.where(valid)
+        sums = pd.DataFrame(parts, index=df.index).groupby(keys, sort=False).sum(min_count=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = pd.DataFrame({m: sums[m] / sums[f"__w_{m}"].replace(0, np.nan) for m in metrics})
+    else:
+        frame = pd.DataFrame(grouped_cols, index=df.index).groupby(keys, sort=False)
+        out = frame.sum(min_count=1) if how == "sum" else getattr(frame, how)()
+    counts = keys.groupby(keys, sort=False).size()
+    out.insert(0, COUNT_COL, counts.reindex(out.index).to_numpy())
+    out.index.name = by
+    return out.reset_index()
+
+
+def group_aggregate(df, by, metrics, how="sum", weight=None):
+    """按 by 分组聚合 metrics（how 为 AGGREGATIONS 中的键；加权均值需给出 weight 列）。
+
+    返回的表第一列为分组值，随后是「行数」与各指标的聚合值，组的顺序为首次出现的顺序。
+    调用方不要原地修改返回结果。
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"未知的聚合方式：{how}")
+    if how == "weighted_mean" and not weight:
+        raise ValueError("加权均值需要指定权重列")
+    metrics = list(metrics)
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return _aggregate(df, by, metrics, how, weight)
+    key = key_hash(data_key, df.attrs.get("filter_key"), tuple(df.columns), by, metrics, how,
+                   weight if how == "weighted_mean" else None)
+    return _PIVOTS.get_or_compute(key, lambda: _aggregate(df, by, metrics, how, weight))
@@ -8,31 +8,31 @@
 输出：
   - 控制台打印：各任务的交叉验证指标
   - predict_分析结果.md：简要结论与扩展建议
+
+看板「📉 预测分析」页面复用这里的函数：对当前筛选后的数据调用 start()，
+5 折交叉验证在后台进程池中按折并行，结果按「数据哈希 + 特征 + 目标 + 模型参数」缓存。
 """
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import cross_val_predict, cross_validate, KFold
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import KFold
 from sklearn.linear_model import Ridge
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 
+import data_loader
+import workers
+from cache_utils import LRUCache, content_hash, key_hash
+
 FILE = "tag.xlsx"
 OUT_MD = "predict_分析结果.md"
 
-# 读取与列名对齐（与 analyze_tag.py 一致）
-df = pd.read_excel(FILE, sheet_name="Sheet2", engine="openpyxl")
-if len(df.columns) >= 5:
-    df = df.rename(columns={
-        df.columns[2]: "点消",
-        df.columns[3]: "拖消",
-        df.columns[4]: "目标物品",
-    })
-
 # 特征列：尽量用「原因侧」指标，避免用与目标强同源的指标（减少信息泄漏）
-# 标签列用 0 填充缺失，便于参与建模
-TAG_COLS = ["点消", "拖消", "目标物品"]
 FEATURE_COLS = [
     "点消", "拖消", "目标物品",
     "HTML completion rate",
@@ -41,19 +41,33 @@ FEATURE_COLS = [
     "Black view error rate", "Rendering error rate", "Runtime error rate",
 ]
 
-# 确保存在的列
-FEATURE_COLS = [c for c in FEATURE_COLS if c in df.columns]
-for c in TAG_COLS:
-    if c in df.columns:
-        df[c] = df[c].fillna(0)
-
 # 目标变量定义
 TARGET_REGRESSION = "Unique redirects rate"   # CVR，连续值
 TARGET_BINARY = "Unique redirects rate"        # 二分类：是否高于中位数
 
-def get_xy(target_col, binary=False):
+# 任务：回归（Ridge）/ 二分类（LogisticRegression，目标是否高于中位数）
+REGRESSION, CLASSIFICATION = "regression", "classification"
+TASKS = {REGRESSION: "回归（Ridge）", CLASSIFICATION: "二分类：是否高于中位数（LogisticRegression）"}
+# 各任务的评估指标：结果中的名称 -> sklearn scorer（neg_ 开头的取相反数后记录）
+SCORING = {
+    REGRESSION: {"r2": "r2", "mae": "neg_mean_absolute_error", "rmse": "neg_root_mean_squared_error"},
+    CLASSIFICATION: {"accuracy": "accuracy", "f1_weighted": "f1_weighted", "roc_auc": "roc_auc"},
+}
+# 模型参数：Ridge 的 alpha、LogisticRegression 的 C
+DEFAULT_PARAMS = {REGRESSION: {"alpha": 1.0}, CLASSIFICATION: {"C": 1.0}}
+N_SPLITS = 5
+MIN_SAMPLES = 10
+
+# 训练结果：数据哈希 + 特征 + 目标 + 任务 + 参数 -> 结果字典
+_RESULTS = LRUCache(max_bytes=64 * 1024 * 1024, ttl=3600)
+# 正在后台训练（或失败）的任务：同上的键 -> PredictJob
+_JOBS = {}
+_jobs_lock = threading.Lock()
+
+
+def get_xy(df, features, target_col, binary=False):
     """构造 X, y，剔除目标缺失的行。"""
-    use = [c for c in FEATURE_COLS if c in df.columns]
+    use = [c for c in features if c in df.columns]
     X = df[use].copy()
     y = df[target_col].copy()
     if binary:
@@ -67,57 +81,189 @@ def get_xy(target_col, binary=False):
             X[c] = X[c].fillna(X[c].median())
     return X, y
 
-def run_regression():
-    """回归：预测 CVR（Unique redirects rate）。"""
-    if TARGET_REGRESSION not in df.columns:
-        return None
-    X, y = get_xy(TARGET_REGRESSION, binary=False)
-    if len(X) < 10:
-        return None
-    pipe = Pipeline([
+
+def make_pipeline(task, params=None):
+    """缺失值填充 + 标准化 + 模型（回归为 Ridge，二分类为 LogisticRegression）。"""
+    params = {**DEFAULT_PARAMS[task], **(params or {})}
+    if task == REGRESSION:
+        model = Ridge(alpha=params["alpha"])
+    else:
+        model = LogisticRegression(C=params["C"], max_iter=500, random_state=42)
+    return Pipeline([
         ("impute", SimpleImputer(strategy="median")),
         ("scale", StandardScaler()),
-        ("model", Ridge(alpha=1.0)),
+        ("model", model),
     ])
-    cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    scores = cross_validate(pipe, X, y, cv=cv, scoring=["r2", "neg_mean_absolute_error", "neg_root_mean_squared_error"])
-    return {
-        "n_samples": len(X),
-        "r2": scores["test_r2"].mean(),
-        "mae": -scores["test_neg_mean_absolute_error"].mean(),
-        "rmse": -scores["test_neg_root_mean_squared_error"].mean(),
-    }
-
-def run_classification():
-    """二分类：预测 CVR 是否高于中位数。"""
-    if TARGET_BINARY not in df.columns:
+
+
+def prepare(df, task, features, target):
+    """建模用的 (X, y) 数值数组；样本不足（或二分类只有一类）时返回 None。标签列缺失按 0 处理。"""
+    features = [c for c in features if c in df.columns and c != target]
+    if target not in df.columns or not features:
         return None
-    X, y = get_xy(TARGET_BINARY, binary=True)
-    if len(X) < 10 or y.nunique() < 2:
+    frame = data_loader.coerce_tag_columns(df[features + [target]], fill=0)
+    X, y = get_xy(frame, features, target, binary=task == CLASSIFICATION)
+    if len(X) < MIN_SAMPLES or (task == CLASSIFICATION and y.nunique() < 2):
         return None
-    pipe = Pipeline([
-        ("impute", SimpleImputer(strategy="median")),
-        ("scale", StandardScaler()),
-        ("model", LogisticRegression(max_iter=500, random_state=42)),
-    ])
-    cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    scores = cross_validate(pipe, X, y, cv=cv, scoring=["accuracy", "f1_weighted", "roc_auc"])
-    return {
-        "n_samples": len(X),
-        "accuracy": scores["test_accuracy"].mean(),
-        "f1_weighted": scores["test_f1_weighted"].mean(),
-        "roc_auc": scores["test_roc_auc"].mean(),
-    }
+    return X.to_numpy(dtype=np.float64, na_value=np.nan), y.to_numpy(dtype=np.float64), features
+
+
+def score_fold(task, params, X, y, train, test):
+    """在一折上训练并评估，返回 {指标: 取值}（供进程池调用，需为模块顶层函数）。
+
+    与 cross_validate(error_score=np.nan) 一致：该折训练失败（如训练集只有一类）时各指标记为缺失，
+    某个指标无法计算（如测试集只有一类时的 ROC AUC）时该指标记为缺失，其余折照常进行。
+    """
+    try:
+        est = make_pipeline(task, params).fit(X[train], y[train])
+    except Exception:  # noqa: BLE001 — 与 error_score=np.nan 相同，任何训练错误都只让该折缺失
+        return {name: np.nan for name in SCORING[task]}
+    scores = {}
+    for name, scorer in SCORING[task].items():
+        try:
+            value = get_scorer(scorer)(est, X[test], y[test])
+        except Exception:  # noqa: BLE001
+            scores[name] = np.nan
+            continue
+        scores[name] = -value if scorer.startswith("neg_") else value
+    return scores
+
+
+def fit_coefficients(task, params, X, y):
+    """全量数据上拟合，返回标准化后的模型系数（各特征的方向与相对强弱）。"""
+    est = make_pipeline(task, params).fit(X, y)
+    return np.ravel(est.named_steps["model"].coef_)
+
+
+def _folds(n):
+    return list(KFold(n_splits=N_SPLITS, shuffle=True, random_state=42).split(np.zeros(n)))
+
+
+def _summarize(task, features, n, fold_scores, coef):
+    folds = pd.DataFrame(fold_scores, index=pd.RangeIndex(1, len(fold_scores) + 1, name="折"))
+    # 均值只按成功的折计算；failed_folds 为有指标缺失的折数
+    result = {"n_samples": n, **folds.mean().to_dict(), "folds": folds,
+              "failed_folds": int(folds.isna().any(axis=1).sum())}
+    result["coef"] = pd.Series(coef, index=features, name="系数")
+    return result
+
+
+def evaluate(df, task, features, target, params=None):
+    """在当前进程中完成 5 折交叉验证与全量拟合；数据不足时返回 None。"""
+    prepared = prepare(df, task, features, target)
+    if prepared is None:
+        return None
+    X, y, features = prepared
+    fold_scores = [score_fold(task, params, X, y, tr, te) for tr, te in _folds(len(X))]
+    return _summarize(task, features, len(X), fold_scores, fit_coefficients(task, params, X, y))
+
+
+class PredictJob:
+    """一次后台训练：各折与全量拟合分别提交到进程池，完成一项 done 加一，全部完成后写入 result。"""
+
+    def __init__(self, key, task, features, n, total):
+        self.key = key
+        self.task = task
+        self.features = features
+        self.n = n
+        self.total = total
+        self.done = 0
+        self.result = None
+        self.error = None
+        self._fold_scores = {}
+        self._coef = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.result is not None or self.error is not None
+
+    def _collect(self, part, future):
+        try:
+            value = future.result()
+        except Exception as e:  # noqa: BLE001 — 子进程中的异常原样交给页面显示
+            if isinstance(e, BrokenProcessPool):
+                workers.reset_process_pool()
+            with self._lock:
+                self.error = self.error or e
+            return
+        with self._lock:
+            if part == "coef":
+                self._coef = value
+            else:
+                self._fold_scores[part] = value
+            self.done += 1
+            if self.done < self.total or self.error is not None:
+                return
+            fold_scores = [self._fold_scores[i] for i in sorted(self._fold_scores)]
+            result = _summarize(self.task, self.features, self.n, fold_scores, self._coef)
+        _RESULTS.put(self.key, result, nbytes=int(result["folds"].memory_usage().sum()) + 4096)
+        self.result = result
+        with _jobs_lock:
+            _JOBS.pop(self.key, None)
+
+
+def start(df, task, features, target, params=None, retry=False):
+    """在后台训练并评估，立即返回 PredictJob（结果已缓存时返回已完成的任务）；数据不足时返回 None。
+
+    各折与全量拟合并行提交到 workers.process_pool()，调用方轮询 job.done / job.finished 显示进度。
+    结果按「数据哈希 + 特征 + 目标 + 任务 + 模型参数」缓存；失败的任务保留在 job.error 中，retry=True 时重新提交。
+    """
+    prepared = prepare(df, task, features, target)
+    if prepared is None:
+        return None
+    X, y, features = prepared
+    params = {**DEFAULT_PARAMS[task], **(params or {})}
+    key = key_hash(content_hash(X.tobytes() + y.tobytes()), tuple(features), target, task, sorted(params.items()))
+    folds = _folds(len(X))
+    with _jobs_lock:
+        result = _RESULTS.get(key)
+        if result is not None:
+            job = PredictJob(key, task, features, len(X), len(folds) + 1)
+            job.done, job.result = job.total, result
+            return job
+        job = _JOBS.get(key)
+        if job is not None and not (retry and job.error is not None):
+            return job
+        job = _JOBS[key] = PredictJob(key, task, features, len(X), len(folds) + 1)
+    try:
+        pool = workers.process_pool()
+        parts = [(i, pool.submit(score_fold, task, params, X, y, tr, te)) for i, (tr, te) in enumerate(folds)]
+        parts.append(("coef", pool.submit(fit_coefficients, task, params, X, y)))
+    except BrokenProcessPool as e:
+        workers.reset_process_pool()
+        job.error = e
+        return job
+    for part, future in parts:
+        future.add_done_callback(lambda f, part=part: job._collect(part, f))
+    return job
+
+
+def run_regression(df):
+    """回归：预测 CVR（Unique redirects rate）。"""
+    return evaluate(df, REGRESSION, FEATURE_COLS, TARGET_REGRESSION)
+
+
+def run_classification(df):
+    """二分类：预测 CVR 是否高于中位数。"""
+    return evaluate(df, CLASSIFICATION, FEATURE_COLS, TARGET_BINARY)
 
 def main():
+    # 读取与列名对齐（与 analyze_tag.py 一致，由 data_loader 统一处理），只读特征列与目标列
+    # 标签列用 0 填充缺失，便于参与建模
+    df = data_loader.coerce_tag_columns(
+        data_loader.load_dataset(FILE, columns=FEATURE_COLS + [TARGET_REGRESSION, TARGET_BINARY]), fill=0
+    )
     print("Predict (tag.xlsx Sheet2)")
-    print("Features:", FEATURE_COLS)
+    print("Features:", [c for c in FEATURE_COLS if c in df.columns])
     print()
 
-    reg = run_regression()
+    reg = run_regression(df)
     if reg:
         print("[Regression] Target:", TARGET_REGRESSION)
         print(f"  n_samples: {reg['n_samples']}")
+        if reg["failed_folds"]:
+            print(f"  failed folds: {reg['failed_folds']} (scored as NaN, excluded from the means)")
         print(f"  R2 (5-fold CV): {reg['r2']:.4f}")
         print(f"  MAE:        {reg['mae']:.6f}")
         print(f"  RMSE:       {reg['rmse']:.6f}")
@@ -125,10 +271,12 @@ def main():
     else:
         reg = {}
 
-    clf = run_classification()
+    clf = run_classification(df)
     if clf:
         print("[Classification] Target: {} above median?".format(TARGET_BINARY))
         print(f"  n_samples: {clf['n_samples']}")
+        if clf["failed_folds"]:
+            print(f"  failed folds: {clf['failed_folds']} (scored as NaN, excluded from the means)")
         print(f"  Accuracy: {clf['accuracy']:.4f}")
         print(f"  F1(w):   {clf['f1_weighted']:.4f}")
         print(f"  ROC AUC: {clf['roc_auc']:.4f}")
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""侧栏「素材链接搜索」的倒排索引：对去重后的素材名建 n-gram 索引，按展示量排好名次。
+
+- 素材按 Impressions 降序排好后去重（与原逻辑一致），行号即名次，倒排表按行号升序存放，
+  因此任何查询的结果天然按展示量排序，不必每次重新排序；
+- 子串匹配：查询词的每个 n-gram（长度 ≤3）查倒排表并求交，再对少量候选做一次子串确认；
+- 多词查询：按空白切分，各词都须命中（AND）；
+- 模糊匹配：精确结果之外，三元组重合比例不低于 FUZZY_MIN_SHARE 的素材也返回（排在精确结果之后）；
+- 拼音首字母：安装 pypinyin 时，中文素材名同时按首字母索引（如「消消乐」可用 xxl 搜到）。
+"""
+import numpy as np
+
+from cache_utils import LRUCache, key_hash
+
+try:
+    from pypinyin import Style, lazy_pinyin  # 可选：中文名按拼音首字母搜索
+    HAS_PINYIN = True
+except ImportError:
+    HAS_PINYIN = False
+
+# 最长 n-gram；更长的查询词用其三元组求交
+GRAM = 3
+# 模糊匹配：查询词的三元组至少有这么大比例出现在素材名中
+FUZZY_MIN_SHARE = 0.6
+
+_INDEXES = LRUCache(max_bytes=256 * 1024 * 1024, ttl=3600)
+
+
+def initials(text):
+    """中文部分转为拼音首字母（非中文原样保留）；未安装 pypinyin 时返回空串。"""
+    if not HAS_PINYIN:
+        return ""
+    return "".join(lazy_pinyin(text, style=Style.FIRST_LETTER, errors="default")).lower()
+
+
+def _grams(text, sizes=range(1, GRAM + 1)):
+    return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+
+class SearchIndex:
+    """去重后的素材表（HTML、URL，按展示量降序）及其 n-gram 倒排索引。"""
+
+    def __init__(self, df, sort_col="Impressions"):
+        if sort_col in df.columns:
+            df = df.sort_values(by=sort_col, ascending=False, kind="stable")
+        self.frame = df[["HTML", "URL"]].drop_duplicates().reset_index(drop=True)
+        names = self.frame["HTML"].astype(str).str.lower().tolist()
+        # 检索文本：素材名（小写）+ 分隔符 + 拼音首字母；分隔符保证子串不会跨越两部分
+        self.docs = [f"{name}\x00{initials(name)}" if HAS_PINYIN else name for name in names]
+        postings = {}
+        for row, doc in enumerate(self.docs):
+            for g in _grams(doc):
+                postings.setdefault(g, []).append(row)
+        self.postings = {g: np.asarray(rows, dtype=np.int32) for g, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        return int(
+            sum(p.nbytes for p in self.postings.values())
+            + sum(len(d) for d in self.docs)
+            + self.frame.memory_usage(deep=True).sum()
+        )
+
+    def _candidates(self, token):
+        """包含 token 所有 n-gram 的行（超集，需再确认子串）。"""
+        grams = _grams(token, [min(len(token), GRAM)])
+        lists = sorted((self.postings.get(g) for g in grams), key=lambda p: 0 if p is None else len(p))
+        if lists[0] is None:
+            return np.empty(0, dtype=np.int32)
+        rows = lists[0]
+        for p in lists[1:]:
+            rows = np.intersect1d(rows, p, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+    def _exact(self, tokens):
+        rows = None
+        for token in sorted(tokens, key=len, reverse=True):
+            cand = self._candidates(token)
+            if rows is not None:
+                cand = np.intersect1d(rows, cand, assume_unique=True)
+            if len(token) > GRAM:
+                cand = cand[[token in self.docs[r] for r in cand]] if len(cand) else cand
+            rows = cand
+            if not len(rows):
+                break
+        return rows
+
+    def _fuzzy(self, tokens, exclude):
+        """三元组重合比例达标的行（按名次），不含 exclude 中的行。"""
+        rows = None
+        for token in tokens:
+            grams = _grams(token, [min(len(token), GRAM)])
+            hits = [self.postings[g] for g in grams if g in self.postings]
+            if not hits:
+                return np.empty(0, dtype=np.int32)
+            score = np.bincount(np.concatenate(hits), minlength=len(self.frame))
+            matched = np.flatnonzero(score >= np.ceil(FUZZY_MIN_SHARE * len(grams)))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return np.setdiff1d(rows, exclude, assume_unique=True)
+
+    def search(self, query, fuzzy=True):
+        """返回 (命中行号数组, 精确命中数)：行号对应 self.frame，按展示量降序；精确命中在前，模糊命中在后。
+
+        空查询返回全部行。
+        """
+        tokens = str(query).lower().split()
+        if not tokens:
+            rows = np.arange(len(self.frame))
+            return rows, len(rows)
+        rows = self._exact(tokens)
+        n_exact = len(rows)
+        if fuzzy and any(len(t) >= GRAM for t in tokens):
+            rows = np.concatenate([rows, self._fuzzy(tokens, rows)])
+        return rows, n_exact
+
+
+def search_index(df, sort_col="Impressions"):
+    """取（或新建）df 的搜索索引；按「数据指纹 + 筛选条件」缓存，没有指纹时不缓存。"""
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return SearchIndex(df, sort_col)
+    key = key_hash(data_key, df.attrs.get("filter_key"), sort_col, HAS_PINYIN)
+    index = _INDEXES.get(key)
+    if index is None:
+        index = SearchIndex(df, sort_col)
+        _INDEXES.put(key, index, nbytes=index.nbytes)
+    return index
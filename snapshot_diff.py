@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""两份导出的快照对比：按素材（HTML）连接，一次性算出全部指标的绝对变化与相对变化。
+
+- 每份导出中同名素材只保留展示量最大的一行，再按 HTML 做哈希连接（merge）；
+- 两边都有的数值指标排成矩阵，一次向量化计算 新值-旧值 与 (新值-旧值)/|旧值|（旧值为 0 时相对变化记为缺失）；
+- 对比结果按「两份数据的指纹 + 列」缓存，切换指标、排序方式时只在结果矩阵上做部分选择，不再重新连接。
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from cache_utils import LRUCache, key_hash
+from leaderboard import top_k_positions
+
+# 排序方式：内部名 -> 中文名
+RANKINGS = {
+    "abs_change": "变化量绝对值最大",
+    "increase": "增长最多",
+    "decrease": "下降最多",
+    "rel_change": "变化幅度（相对）最大",
+}
+
+_DIFFS = LRUCache(max_bytes=256 * 1024 * 1024, ttl=3600)
+
+
+def _dedupe(df):
+    df = df[df["HTML"].notna()]
+    if "Impressions" in df.columns:
+        df = df.sort_values("Impressions", ascending=False, kind="stable")
+    return df.drop_duplicates(subset="HTML")
+
+
+def _metric_columns(old, new, metrics):
+    cols = [c for c in old.columns if c in new.columns and c != "HTML"]
+    if metrics is not None:
+        cols = [c for c in cols if c in set(metrics)]
+    return [c for c in cols if is_numeric_dtype(old[c]) and is_numeric_dtype(new[c])
+            and not is_bool_dtype(old[c]) and not is_bool_dtype(new[c])]
+
+
+class SnapshotDiff:
+    """两份导出按素材连接后的对比结果（各矩阵形状均为 素材数 × 指标数）。"""
+
+    def __init__(self, old, new, metrics=None):
+        old, new = _dedupe(old), _dedupe(new)
+        self.metrics = _metric_columns(old, new, metrics)
+        cols = ["HTML"] + self.metrics
+        joined = old[cols].merge(new[cols], on="HTML", how="inner", suffixes=("__old", "__new"))
+        self.html = joined["HTML"].astype(str).to_numpy()
+        old_html, new_html = set(old["HTML"].astype(str)), set(new["HTML"].astype(str))
+        self.only_old = sorted(old_html - new_html)
+        self.only_new = sorted(new_html - old_html)
+        as_matrix = lambda suffix: np.column_stack(
+            [joined[f"{c}{suffix}"].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.metrics]
+        ) if self.metrics else np.empty((len(joined), 0))
+        self.old = as_matrix("__old")
+        self.new = as_matrix("__new")
+        self.delta = self.new - self.old
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.rel = np.where(self.old != 0, self.delta / np.abs(self.old), np.nan)
+
+    @property
+    def nbytes(self):
+        return int(self.old.nbytes * 4 + self.html.nbytes)
+
+    def summary(self):
+        """各指标汇总：两边合计、合计变化，以及变化的素材数（按连接上的素材统计）。"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            old_sum, new_sum = np.nansum(self.old, axis=0), np.nansum(self.new, axis=0)
+            return pd.DataFrame({
+                "指标": self.metrics,
+                "旧合计": old_sum,
+                "新合计": new_sum,
+                "合计变化": new_sum - old_sum,
+                "合计相对变化": np.where(old_sum != 0, (new_sum - old_sum) / np.abs(old_sum), np.nan),
+                "上升素材数": (self.delta > 0).sum(axis=0),
+                "下降素材数": (self.delta < 0).sum(axis=0),
+            })
+
+    def movers(self, metric, ranking="abs_change", k=20):
+        """按某指标的变化取前 k 个素材：返回 HTML、旧值、新值、变化量、相对变化。"""
+        j = self.metrics.index(metric)
+        delta, rel = self.delta[:, j], self.rel[:, j]
+        if ranking == "abs_change":
+            key, ascending = np.abs(delta), False
+        elif ranking == "increase":
+            key, ascending = np.where(delta > 0, delta, np.nan), False
+        elif ranking == "decrease":
+            key, ascending = np.where(delta < 0, delta, np.nan), True
+        else:
+            key, ascending = np.abs(rel), False
+        pos = top_k_positions(key, k, ascending)
+        # 前 k 名不足时 top_k_positions 会补上缺失值所在行，这里只保留参与排序的行
+        pos = pos[~np.isnan(key[pos])]
+        return pd.DataFrame({
+            "HTML": self.html[pos],
+            "旧值": self.old[pos, j],
+            "新值": self.new[pos, j],
+            "变化量": delta[pos],
+            "相对变化": rel[pos],
+        })
+
+
+def compare(old, new, metrics=None):
+    """两份数据的对比结果；按「两份数据的指纹 + 列 + 指标范围」缓存，没有指纹时不缓存。"""
+    old_key, new_key = old.attrs.get("dataset_key"), new.attrs.get("dataset_key")
+    if old_key is None or new_key is None:
+        return SnapshotDiff(old, new, metrics)
+    key = key_hash(old_key, tuple(old.columns), new_key, tuple(new.columns),
+                   None if metrics is None else tuple(metrics))
+    diff = _DIFFS.get(key)
+    if diff is None:
+        diff = SnapshotDiff(old, new, metrics)
+        _DIFFS.put(key, diff, nbytes=diff.nbytes)
+    return diff
@@ -3,45 +3,21 @@
 import pandas as pd
 import numpy as np
 
-df = pd.read_excel("tag.xlsx", sheet_name="Sheet2", engine="openpyxl")
-df = df.rename(columns={df.columns[2]: "点消", df.columns[3]: "拖消", df.columns[4]: "目标物品"})
-for c in ["点消", "拖消", "目标物品"]:
-    if c in df.columns:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+import data_loader
+import tagging
+from data_loader import TAG_COLS
 
-def assign_tag(row):
-    if row.get("目标物品") == 1:
-        return "目标物品"
-    if row.get("点消") == 1:
-        return "点消"
-    if row.get("拖消") == 1:
-        return "拖消"
-    return "未标注"
+metrics = tagging.COMPARE_METRICS
 
-df["_tag"] = df.apply(assign_tag, axis=1)
+# 只读标签列与对比指标
+df = data_loader.coerce_tag_columns(data_loader.load_dataset("tag.xlsx", columns=TAG_COLS + metrics))
 
-metrics = [
-    "Impressions", "Spend", "CTA clicked", "CTA click rate",
-    "Unique redirects rate", "HTML completion rate", "Challenge solved rate",
-    "Average duration", "Runtime error rate",
-]
+# 单标签归类（目标物品 > 点消 > 拖消）与分组均值 / 计数 / 相对整体比值，一次分组算出（见 tagging.py）
 metrics = [m for m in metrics if m in df.columns]
-
-overall = df[metrics].mean()
-by_tag = df.groupby("_tag")[metrics].agg(["mean", "count"]).round(4)
-
+summary = tagging.tag_summary(df, metrics)
+by_tag = summary.by_tag.round(4)
 # 相对整体的比值（仅标签组，不含未标注）
-rows = []
-for tag in ["点消", "拖消", "目标物品"]:
-    if tag not in by_tag.index:
-        continue
-    sub = df[df["_tag"] == tag][metrics].mean()
-    ratio = (sub / overall).replace([np.inf, -np.inf], np.nan)
-    n = len(df[df["_tag"] == tag])
-    rows.append({"标签": tag, "样本数": n, **ratio})
-
-ratio_df = pd.DataFrame(rows)
-ratio_df = ratio_df.set_index("标签")
+ratio_df = summary.ratios
 ratio_df.to_csv("tag_标签对比_相对整体比值.csv", encoding="utf-8-sig")
 by_tag.to_csv("tag_标签对比_分组均值.csv", encoding="utf-8-sig")
 
@@ -54,13 +30,11 @@ lines = [
     "| 标签 | 样本数 | 展示量比 | 花费比 | 点击量比 | CTR比 | 跳转率比 | 完播率比 | 通关率比 | 停留时长比 | 报错率比 |",
     "|------|--------|----------|--------|----------|------|----------|----------|----------|------------|----------|",
 ]
-for tag in ["点消", "拖消", "目标物品"]:
+for tag in TAG_COLS:
     if tag not in ratio_df.index:
         continue
     r = ratio_df.loc[tag]
-    n = int(ratio_df.loc[tag].get("样本数", 0)) if "样本数" in ratio_df.columns else int(df["_tag"].value_counts().get(tag, 0))
-    # 从 by_tag 取 count
-    n = len(df[df["_tag"] == tag])
+    n = int(r["样本数"])
     imp = r.get("Impressions", np.nan)
     spend = r.get("Spend", np.nan)
     cta = r.get("CTA clicked", np.nan)
@@ -83,26 +57,12 @@ lines.extend([
 
 # 自动写结论
 conclusions = []
-for tag in ["点消", "拖消", "目标物品"]:
+for tag in TAG_COLS:
     if tag not in ratio_df.index:
         continue
     r = ratio_df.loc[tag]
-    n = len(df[df["_tag"] == tag])
-    pts = []
-    if r.get("Impressions", 0) > 1.5:
-        pts.append("展示量/花费/点击量明显高于整体")
-    elif r.get("Impressions", 1) < 0.5:
-        pts.append("展示量/花费/点击量低于整体")
-    if r.get("CTA click rate", 1) > 1.2:
-        pts.append("CTR 高于整体")
-    elif r.get("CTA click rate", 1) < 0.85:
-        pts.append("CTR 低于整体")
-    if r.get("Challenge solved rate", 1) > 1.2:
-        pts.append("通关率高于整体")
-    elif r.get("Challenge solved rate", 1) < 0.7:
-        pts.append("通关率低于整体")
-    if r.get("HTML completion rate", 1) < 0.6:
-        pts.append("完播率明显低于整体")
+    n = int(r["样本数"])
+    pts = tagging.highlights(r)
     if pts:
         conclusions.append(f"- **{tag}**（n={n}）：" + "；".join(pts) + "。")
 
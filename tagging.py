@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""素材标签归类与分组统计：向量化地把标签列（点消/拖消/目标物品等，取值 0/1）归成标签组，再一次分组算出各组指标。
+
+- 单标签模式：按优先级（默认 目标物品 > 点消 > 拖消）用 np.select 一次性为每行选出一个标签，都不是 1 的记为「未标注」；
+- 多标签模式：一行可同时属于多个标签组（各标签列为 1 即计入），都不是 1 的记为「未标注」；
+- 标签列数量不限：传入任意标签列名即可，未在优先级中列出的列按传入顺序排在后面；
+- 各组均值、非空计数、样本数与相对整体的比值都来自同一次 groupby。
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from cache_utils import LRUCache, key_hash
+from data_loader import TAG_COLS
+
+# 单标签模式的默认优先级（从高到低）
+DEFAULT_PRIORITY = ["目标物品", "点消", "拖消"]
+UNTAGGED = "未标注"
+# 标签对比的默认指标
+COMPARE_METRICS = [
+    "Impressions", "Spend", "CTA clicked", "CTA click rate",
+    "Unique redirects rate", "HTML completion rate", "Challenge solved rate",
+    "Average duration", "Runtime error rate",
+]
+
+# 标签分组统计：数据指纹 + 筛选条件 + 标签 / 模式 -> TagSummary（覆盖全部数值指标）
+_SUMMARIES = LRUCache(max_bytes=64 * 1024 * 1024, ttl=3600)
+
+
+def _priority(tags, priority):
+    priority = DEFAULT_PRIORITY if priority is None else priority
+    return [t for t in priority if t in tags] + [t for t in tags if t not in priority]
+
+
+def tag_membership(df, tags):
+    """(行数 × 标签数) 的布尔矩阵：标签列取值为 1 的位置为 True（缺失与其它取值为 False）。"""
+    if not tags:
+        return np.zeros((len(df), 0), dtype=bool)
+    return np.column_stack([
+        pd.to_numeric(df[t], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan) == 1 for t in tags
+    ])
+
+
+def assign_tags(df, tags=None, priority=None, untagged=UNTAGGED):
+    """单标签归类：每行取优先级最高的、取值为 1 的标签，返回与 df 同索引的 Series。
+
+    tags 为参与归类的标签列（默认 data_loader.TAG_COLS 中存在的列）；priority 为优先级（从高到低）。
+    """
+    tags = [t for t in (TAG_COLS if tags is None else tags) if t in df.columns]
+    ordered = _priority(tags, priority)
+    member = tag_membership(df, ordered)
+    labels = np.select([member[:, i] for i in range(len(ordered))], ordered, default=untagged)
+    return pd.Series(labels, index=df.index, dtype=object)
+
+
+class TagSummary:
+    """标签分组统计结果。
+
+    - by_tag：各组各指标的 mean / count（列为 (指标, "mean"/"count") 两层），组按名称排序；
+    - sizes：各组样本数（行数）；overall：全部行的指标均值；
+    - ratios：各标签组（不含未标注）相对整体均值的比值，列为「样本数」+ 各指标，行按 tags 的顺序。
+    """
+
+    def __init__(self, by_tag, sizes, overall, ratios):
+        self.by_tag = by_tag
+        self.sizes = sizes
+        self.overall = overall
+        self.ratios = ratios
+
+
+def tag_summary(df, metrics, tags=None, priority=None, multi_label=False, untagged=UNTAGGED):
+    """按标签分组统计 metrics：一次 groupby 得到各组均值与计数，再算出相对整体的比值。
+
+    multi_label=True 时一行可计入多个标签组（组内样本数之和可能大于总行数）。
+    """
+    tags = [t for t in (TAG_COLS if tags is None else tags) if t in df.columns]
+    metrics = [m for m in metrics if m in df.columns]
+    values = df[metrics]
+    if multi_label:
+        member = tag_membership(df, tags)
+        rows, cols = np.nonzero(member)
+        untagged_rows = np.flatnonzero(~member.any(axis=1))
+        # 展开成「行 × 所属标签」的长表（未标注的行各占一条），在长表上做一次分组
+        rows = np.concatenate([rows, untagged_rows])
+        labels = np.concatenate([np.asarray(tags, dtype=object)[cols], np.full(len(untagged_rows), untagged, dtype=object)])
+        values = values.iloc[rows]
+    else:
+        labels = assign_tags(df, tags, priority, untagged).to_numpy()
+
+    # 按数组分组（不按索引对齐，长表中重复的行索引不影响分组）
+    grouped = values.groupby(labels)
+    by_tag = grouped.agg(["mean", "count"]).rename_axis("标签")
+    sizes = grouped.size().rename_axis("标签")
+    overall = df[metrics].mean()
+
+    means = by_tag.xs("mean", axis=1, level=1)
+    present = [t for t in tags if t in means.index]
+    ratios = (means.loc[present] / overall).replace([np.inf, -np.inf], np.nan)
+    ratios.insert(0, "样本数", sizes.loc[present].astype(int))
+    ratios.index.name = "标签"
+    return TagSummary(by_tag, sizes, overall, ratios)
+
+
+def numeric_metrics(df, tags=()):
+    """可参与标签对比的数值指标列（不含标签列与布尔列）。"""
+    return [c for c in df.columns
+            if c not in tags and c not in TAG_COLS and is_numeric_dtype(df[c]) and not is_bool_dtype(df[c])]
+
+
+def cached_summary(df, tags=None, priority=None, multi_label=False, untagged=UNTAGGED):
+    """对 df 的全部数值指标做标签分组统计，按「数据指纹 + 筛选条件 + 列 + 标签 + 模式」缓存。
+
+    调用方从结果中按需取指标列，切换指标不重新分组；没有指纹时不缓存。
+    """
+    tags = [t for t in (TAG_COLS if tags is None else tags) if t in df.columns]
+    compute = lambda: tag_summary(df, numeric_metrics(df, tags), tags, priority, multi_label, untagged)
+    data_key = df.attrs.get("dataset_key")
+    if data_key is None:
+        return compute()
+    key = key_hash(data_key, df.attrs.get("filter_key"), tuple(df.columns), tuple(tags),
+                   None if priority is None else tuple(priority), multi_label, untagged)
+    summary = _SUMMARIES.get(key)
+    if summary is None:
+        summary = compute()
+        nbytes = int(summary.by_tag.memory_usage(deep=True).sum() + summary.ratios.memory_usage(deep=True).sum())
+        _SUMMARIES.put(key, summary, nbytes=nbytes)
+    return summary
+
+
+def highlights(ratio):
+    """由某标签组相对整体的比值（Series）归纳出的突出点列表（如「CTR 高于整体」）。"""
+    pts = []
+    if ratio.get("Impressions", 0) > 1.5:
+        pts.append("展示量/花费/点击量明显高于整体")
+    elif ratio.get("Impressions", 1) < 0.5:
+        pts.append("展示量/花费/点击量低于整体")
+    if ratio.get("CTA click rate", 1) > 1.2:
+        pts.append("CTR 高于整体")
+    elif ratio.get("CTA click rate", 1) < 0.85:
+        pts.append("CTR 低于整体")
+    if ratio.get("Challenge solved rate", 1) > 1.2:
+        pts.append("通关率高于整体")
+    elif ratio.get("Challenge solved rate", 1) < 0.7:
+        pts.append("通关率低于整体")
+    if ratio.get("HTML completion rate", 1) < 0.6:
+        pts.append("完播率明显低于整体")
+    return pts
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""让测试可以直接导入仓库根目录下的模块（仓库为平铺结构，没有包）。"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""历史快照库：按日精确读取快照，以及快照对比中「仅旧数据有」的素材。"""
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+import history_store  # noqa: E402
+import snapshot_diff  # noqa: E402
+
+
+def _export(names, impressions):
+    return pd.DataFrame({"HTML": names, "Impressions": impressions, "CTA clicked": [1] * len(names)})
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "history.duckdb")
+    history_store.ingest(_export(["a", "b", "c"], [100, 200, 300]), "2026-10-01", path=path)
+    # 新一天的导出中少了素材 c
+    history_store.ingest(_export(["a", "b"], [150, 180]), "2026-10-08", path=path)
+    return path
+
+
+def test_exact_snapshot_only_returns_that_days_export(db):
+    exact = history_store.load_snapshot("2026-10-08", path=db, exact=True)
+    assert sorted(exact["HTML"]) == ["a", "b"]
+    # 不指定 exact 时仍是「截至该日各素材的最近一次快照」，c 从更早的快照补上
+    carried = history_store.load_snapshot("2026-10-08", path=db)
+    assert sorted(carried["HTML"]) == ["a", "b", "c"]
+
+
+def test_exact_requires_a_date(db):
+    with pytest.raises(ValueError):
+        history_store.load_snapshot(None, path=db, exact=True)
+
+
+def test_compare_reports_creative_missing_from_newer_snapshot(db):
+    old = history_store.load_snapshot("2026-10-01", path=db, exact=True)
+    new = history_store.load_snapshot("2026-10-08", path=db, exact=True)
+    diff = snapshot_diff.compare(old, new)
+    assert diff.only_old == ["c"]
+    assert diff.only_new == []
+    assert sorted(diff.html) == ["a", "b"]
+    moved = diff.movers("Impressions", "abs_change", k=5).set_index("HTML")["变化量"]
+    assert moved.to_dict() == {"a": 50.0, "b": -20.0}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""散点图趋势线：自行拟合并缓存，作为单独的折线叠加到图上（替代 px.scatter 的 trendline 参数）。
+
+- OLS：最小二乘直线（np.polyfit），只需画出两端点；
+- LOWESS：statsmodels 局部加权回归。点数超过 LOWESS_MAX_POINTS 时先按 x 的分位数分箱、
+  取各箱均值再拟合（近似），并在图上注明；
+- 拟合结果按「x、y 数据内容 + 方法 + 参数」缓存，同一份数据在不同图表、不同重跑中只拟合一次。
+"""
+import numpy as np
+import plotly.graph_objects as go
+from statsmodels.nonparametric.smoothers_lowess import lowess
+
+from cache_utils import LRUCache, content_hash
+
+# 与 plotly express 默认一致的 LOWESS 平滑比例
+LOWESS_FRAC = 2 / 3
+# LOWESS 直接拟合的最大点数；超过时按分箱均值近似
+LOWESS_MAX_POINTS = 2000
+LOWESS_BINS = 400
+
+METHOD_LABELS = {"ols": "OLS 线性趋势", "lowess": "LOWESS 平滑趋势"}
+
+_FITS = LRUCache(max_bytes=32 * 1024 * 1024, ttl=3600)
+
+
+def _binned_means(x, y, bins):
+    """按 x 的分位数分箱，返回各非空箱的 (x 均值, y 均值)。"""
+    edges = np.unique(np.quantile(x, np.linspace(0, 1, bins + 1)))
+    which = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, max(len(edges) - 2, 0))
+    counts = np.bincount(which)
+    keep = counts > 0
+    return (np.bincount(which, weights=x)[keep] / counts[keep],
+            np.bincount(which, weights=y)[keep] / counts[keep])
+
+
+def _fit(x, y, method, frac):
+    n = len(x)
+    if method == "ols":
+        slope, intercept = np.polyfit(x, y, 1)
+        line_x = np.array([x.min(), x.max()])
+        resid = y - (slope * x + intercept)
+        ss_tot = ((y - y.mean()) ** 2).sum()
+        r2 = 1 - (resid ** 2).sum() / ss_tot if ss_tot > 0 else np.nan
+        return {"x": line_x, "y": slope * line_x + intercept, "n": n, "binned": False,
+                "slope": float(slope), "intercept": float(intercept), "r2": float(r2)}
+    binned = n > LOWESS_MAX_POINTS
+    if binned:
+        x, y = _binned_means(x, y, LOWESS_BINS)
+    fitted = lowess(y, x, frac=frac, return_sorted=True)
+    return {"x": fitted[:, 0], "y": fitted[:, 1], "n": n, "binned": binned, "bins": len(x) if binned else None}
+
+
+def fit_trendline(x, y, method="ols", frac=LOWESS_FRAC):
+    """拟合趋势线，返回 {"x", "y", "n", "binned", ...}；有效点（x、y 均为有限值）少于 3 个时返回 None。"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    if len(x) < 3 or np.ptp(x) == 0:
+        return None
+    key = (content_hash(x.tobytes() + y.tobytes()), method, frac if method == "lowess" else None)
+    return _FITS.get_or_compute(key, lambda: _fit(x, y, method, frac))
+
+
+def add_trendline(fig, x, y, method="ols", color="#d62728", frac=LOWESS_FRAC):
+    """在图上叠加趋势线（单独一条折线），返回需要提示的说明文字（LOWESS 分箱近似时），否则返回 None。"""
+    fit = fit_trendline(x, y, method, frac)
+    if fit is None:
+        return None
+    name = METHOD_LABELS[method]
+    if method == "ols":
+        hover = f"{name}<br>y = {fit['slope']:.4g}·x + {fit['intercept']:.4g}<br>R² = {fit['r2']:.3f}<extra></extra>"
+    else:
+        hover = f"{name}<br>x=%{{x:.4g}}<br>y=%{{y:.4g}}<extra></extra>"
+    fig.add_trace(go.Scatter(
+        x=fit["x"], y=fit["y"], mode="lines", name=name,
+        line=dict(color=color, width=2), hovertemplate=hover, showlegend=True,
+    ))
+    # 图例横放在图表上方，避免与连续色条重叠
+    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    if fit["binned"]:
+        return f"注：共 {fit['n']:,} 个点，LOWESS 趋势线基于 {fit['bins']} 个分位数分箱的均值近似拟合。"
+    return None
+
+
+def annotate_note(fig, note):
+    """把说明文字写在图的左下方（随图表一起缓存）。"""
+    if note:
+        fig.add_annotation(text=note, xref="paper", yref="paper", x=0, y=-0.18,
+                           showarrow=False, xanchor="left", font=dict(size=11, color="gray"))
+    return fig
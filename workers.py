@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""进程内共享的后台执行器：CPU 密集的解析/计算放进程池并行，不阻塞 Streamlit 会话线程。
+
+进程池懒创建、跨重跑复用，避免每次交互都重新拉起子进程。
+使用 spawn 方式启动子进程（Streamlit 服务进程是多线程的，fork 可能死锁），
+因此提交的函数必须是模块顶层可导入的函数，参数与返回值需可 pickle。
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_lock = threading.Lock()
+_process_pool = None
+
+
+def default_workers():
+    """默认并行度：CPU 核数减一，至少 1、至多 8。"""
+    return max(1, min(8, (os.cpu_count() or 2) - 1))
+
+
+def process_pool():
+    """返回共享进程池（首次调用时创建）。"""
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=default_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def reset_process_pool():
+    """关闭并丢弃当前进程池（子进程异常退出导致池不可用时调用，下次使用会重建）。"""
+    global _process_pool
+    with _lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None